@@ -5,14 +5,32 @@ except AttributeError:
     pass
 
 from fastapi import FastAPI, Request, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from app.rag.core import ask_question, initialize_rag
+from app.rag.core import aask_question, astream_question
+from app.rag.cache import answer_cache, embedding_cache
+from app.rag.warmup import run_warmup, warmup_state
+from app.rag.faiss_engine import search_gita_batch
+from app.rag.batcher import search_batcher
+from app.rag.inference_pool import inference_pool
+from app.rag.context import token_usage
+from app.rag.telemetry import render_prometheus
+from app.rag.rate_limiter import LLMBusyError
+from app.rag.llm_router import llm_router
 from app.whatsapp.handler import handle_whatsapp_message
+from app.whatsapp.jobs import whatsapp_jobs
+from app.whatsapp.broadcast import broadcast_status
+from app.whatsapp.subscribers import subscriber_store
 from app.youtube.automation import generate_daily_story
+from app.youtube.daily_story import get_story, FORMATS as STORY_FORMATS
 import os
+import json
+import asyncio
 import traceback
+from datetime import date, datetime, timezone
+from typing import List
+from pydantic import BaseModel
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -33,33 +51,152 @@ app.add_middleware(
 async def startup_event():
     print(">>> UPNISHAD AI SERVER RESTARTING - LOADING v5 LOGIC <<<")
     print(">>> FORCE RELOAD FOR DEEP DIVE LOGIC <<<")
-    initialize_rag()
+    # Warm up in the background so the server can answer health checks while loading
+    asyncio.get_running_loop().run_in_executor(None, run_warmup)
+    # Workers that answer queued WhatsApp questions (and resume any left over from a restart)
+    whatsapp_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await whatsapp_jobs.stop()
+    inference_pool.shutdown()
+    await asyncio.to_thread(answer_cache.flush)
 
 # API Endpoints
 @app.get("/api/health")
 async def health_check():
-    return {"status": "ok"}
+    # 503 until warm-up finishes so the load balancer only routes traffic to warm instances
+    if warmup_state["status"] in ("cold", "warming"):
+        return JSONResponse(status_code=503, content={"status": "warming", "timings": warmup_state["timings"]})
+    return {
+        "status": "ok",
+        "warmup": warmup_state["status"],
+        "timings": warmup_state["timings"],
+        "errors": warmup_state["errors"],
+    }
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {"answers": answer_cache.stats(), "embeddings": embedding_cache.stats()}
+
+@app.get("/api/batcher/stats")
+async def batcher_stats():
+    return search_batcher.stats()
+
+@app.get("/api/inference/stats")
+async def inference_stats():
+    return inference_pool.stats()
+
+@app.get("/api/usage")
+async def usage_stats():
+    return token_usage
+
+@app.get("/api/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, cache, LLM and token counters."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    return llm_router.stats()
 
 @app.post("/api/ask")
-def ask(question: str, mode: str = "chat"):
+async def ask(question: str, mode: str = "chat"):
     try:
-        answer = ask_question(question, mode=mode)
+        answer = await aask_question(question, mode=mode)
         return {"answer": answer}
+    except LLMBusyError as e:
+        # Shed by the LLM rate limiter: tell the client when to come back instead of timing out
+        return JSONResponse(
+            status_code=503,
+            content={"answer": {"answer": str(e), "follow_up_questions": []}, "busy": True},
+            headers={"Retry-After": str(round(e.retry_after))}
+        )
     except Exception as e:
         print(f"CRITICAL ERROR in /api/ask: {e}")
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"answer": f"Internal Server Error: {str(e)}"})
 
+@app.post("/api/ask/stream")
+async def ask_stream(question: str, mode: str = "chat"):
+    """Server-Sent Events: 'token' events carry answer text as it is generated, 'done' carries the parsed answer."""
+    async def event_stream():
+        try:
+            async for event, data in astream_question(question, mode=mode):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            print(f"CRITICAL ERROR in /api/ask/stream: {e}")
+            traceback.print_exc()
+            yield f"event: error\ndata: {json.dumps({'answer': f'Internal Server Error: {str(e)}'})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class BatchSearchRequest(BaseModel):
+    questions: List[str]
+    top_k: int = 3
+
+MAX_BATCH_QUESTIONS = 256
+
+@app.post("/api/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """Retrieval only (no LLM): returns the top verses for each question, in order."""
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        return JSONResponse(status_code=400, content={"error": f"At most {MAX_BATCH_QUESTIONS} questions per batch"})
+    try:
+        results = await asyncio.to_thread(search_gita_batch, request.questions, max(1, min(request.top_k, 20)))
+        return {"results": [{"question": q, "matches": r} for q, r in zip(request.questions, results)]}
+    except Exception as e:
+        print(f"CRITICAL ERROR in /api/search/batch: {e}")
+        traceback.print_exc()
+        return JSONResponse(status_code=500, content={"error": f"Internal Server Error: {str(e)}"})
+
 @app.post("/api/whatsapp")
 async def whatsapp_webhook(request: Request):
     form_data = await request.form()
     response = await handle_whatsapp_message(form_data)
     return response
 
+@app.get("/api/whatsapp/jobs")
+async def whatsapp_job_stats():
+    return await asyncio.to_thread(whatsapp_jobs.stats)
+
+@app.get("/api/subscribers/stats")
+async def subscriber_stats():
+    return await asyncio.to_thread(subscriber_store.stats)
+
+@app.get("/api/broadcasts/{broadcast_id}")
+async def get_broadcast(broadcast_id: str):
+    status = await asyncio.to_thread(broadcast_status, broadcast_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown broadcast '{broadcast_id}'"})
+    return status
+
 @app.post("/api/trigger-daily-story")
 async def trigger_story(background_tasks: BackgroundTasks):
+    # Sending (due time-zone waves) always runs; the story itself is generated at most once per date
     background_tasks.add_task(generate_daily_story)
+    story = await asyncio.to_thread(get_story, datetime.now(timezone.utc).date())
+    if story is not None:
+        return {"message": "Daily story already generated; delivery triggered in background", "story": story["web"]}
     return {"message": "Daily story generation triggered in background"}
 
+@app.get("/api/daily-story")
+async def daily_story(day: str = None, format: str = "web"):
+    """The stored story for a date (default today, UTC) in one of the pre-rendered formats."""
+    if format not in STORY_FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"format must be one of {', '.join(STORY_FORMATS)}"})
+    try:
+        story_day = date.fromisoformat(day) if day else datetime.now(timezone.utc).date()
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "day must be YYYY-MM-DD"})
+    story = await asyncio.to_thread(get_story, story_day)
+    if story is None:
+        return JSONResponse(status_code=404, content={"error": f"No story generated for {story_day.isoformat()} yet"})
+    return {"date": story["date"], "format": format, "content": story[format], "sources": story["sources"]}
+
 # Serve frontend
 app.mount("/", StaticFiles(directory="frontend", html=True), name="static")
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import contextvars
+
+from app.rag.faiss_engine import encode_and_search_batch
+
+# Configuration (override via environment)
+EMBED_BATCHING_ENABLED = os.getenv("EMBED_BATCHING", "1") == "1"
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent local retrievals into one batched encode + FAISS search.
+    Callers await submit(); a single worker task collects queries that arrive within
+    max_wait_ms (up to max_batch_size), runs them together in a thread and resolves
+    each caller's future with its own (query_vector, results).
+    """
+    def __init__(self, max_batch_size: int = EMBED_BATCH_MAX_SIZE, max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+        # Metrics
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self.max_queue_depth = 0
+        self.batch_size_histogram = {}  # upper bound (1, 2, 4, ...) -> count
+        self.total_queue_wait = 0.0
+        self.total_batch_time = 0.0
+
+    def _ensure_worker(self):
+        # The worker is bound to the running loop; start a fresh one if the loop changed (e.g. in tests)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            # Run the worker outside the caller's context so its spans aren't billed to that one request
+            self._worker = contextvars.Context().run(loop.create_task, self._run())
+
+    async def submit(self, query: str, top_k: int = 3):
+        """Returns (query_vector of shape (1, dim) or None, results) for one query."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((query, top_k, future, time.perf_counter()))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting, then wait out the window
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            self._record(batch, started)
+
+            queries = [item[0] for item in batch]
+            top_k = max(item[1] for item in batch)
+            try:
+                vectors, results = await asyncio.to_thread(encode_and_search_batch, queries, top_k)
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.total_batch_time += time.perf_counter() - started
+
+            for row, (_, k, future, _) in enumerate(batch):
+                if future.done():  # Caller went away (cancelled)
+                    continue
+                vector = vectors[row:row + 1] if vectors is not None else None
+                future.set_result((vector, results[row][:k]))
+
+    def _record(self, batch, started: float):
+        size = len(batch)
+        self.batches += 1
+        self.queries += size
+        self.largest_batch = max(self.largest_batch, size)
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        self.batch_size_histogram[bucket] = self.batch_size_histogram.get(bucket, 0) + 1
+        self.total_queue_wait += sum(started - item[3] for item in batch)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": EMBED_BATCHING_ENABLED,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "batch_size_histogram": {f"<={k}": v for k, v in sorted(self.batch_size_histogram.items())},
+            "avg_queue_wait_ms": round(self.total_queue_wait / self.queries * 1000, 3) if self.queries else 0.0,
+            "avg_batch_time_ms": round(self.total_batch_time / self.batches * 1000, 3) if self.batches else 0.0,
+        }
+
+
+search_batcher = EmbeddingBatcher()
+
+async def batched_search(query: str, top_k: int = 3):
+    """Local embed + FAISS search for async callers. Returns (query_vector, results)."""
+    if EMBED_BATCHING_ENABLED:
+        return await search_batcher.submit(query, top_k)
+    vectors, results = await asyncio.to_thread(encode_and_search_batch, [query], top_k)
+    return vectors, results[0] if results else []
@@ -0,0 +1,241 @@
+import os
+import time
+import copy
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Configuration (override via environment)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))  # seconds
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")  # e.g. /mnt/cache/answer_cache.pkl
+ANSWER_CACHE_SAVE_DELAY = float(os.getenv("ANSWER_CACHE_SAVE_DELAY", "5"))  # seconds between background writes
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+
+class SemanticAnswerCache:
+    """
+    Caches final answers keyed on (mode, query embedding).
+    A lookup returns the stored response of the most similar previous query
+    in the same mode, provided its cosine similarity clears the threshold.
+
+    With a path set, changes are written by a background thread at most every
+    ANSWER_CACHE_SAVE_DELAY seconds, so put() never pickles on the caller's thread.
+    """
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, path: str = ANSWER_CACHE_PATH,
+                 save_delay: float = ANSWER_CACHE_SAVE_DELAY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.path = path
+        self.save_delay = save_delay
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (mode, unit vector, response, created_at)
+        self._matrices = {}  # mode -> (keys, stacked vectors), rebuilt after the entries change
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._save_lock = threading.Lock()  # one writer at a time (background thread or flush)
+        self._writer = None
+        if self.path:
+            self._load()
+
+    @staticmethod
+    def _normalize(vector):
+        vec = np.asarray(vector, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _expire(self, now: float):
+        expired = [k for k, (_, _, _, created) in self._entries.items() if now - created > self.ttl]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrices.clear()
+        return bool(expired)
+
+    def _matrix(self, mode: str, dim: int):
+        # One matrix product per lookup instead of a Python loop over every entry
+        cached = self._matrices.get((mode, dim))
+        if cached is None:
+            keys = [k for k, (m, vec, _, _) in self._entries.items() if m == mode and vec.shape == (dim,)]
+            vectors = np.vstack([self._entries[k][1] for k in keys]) if keys else np.zeros((0, dim), dtype='float32')
+            cached = self._matrices[(mode, dim)] = (keys, vectors)
+        return cached
+
+    def get(self, mode: str, vector):
+        """Returns a copy of the cached response for a near-duplicate query, or None."""
+        query = self._normalize(vector)
+        with self._lock:
+            # Drop stale entries first, so a fresh one is found even when an expired one scores higher
+            expired = self._expire(time.time())
+            keys, vectors = self._matrix(mode, query.shape[0])
+            best_key, best_score = None, -1.0
+            if keys:
+                scores = vectors @ query
+                best = int(np.argmax(scores))
+                best_key, best_score = keys[best], float(scores[best])
+
+            if best_key is None or best_score < self.threshold:
+                self.misses += 1
+                response = None
+            else:
+                self.hits += 1
+                self._entries.move_to_end(best_key)  # LRU bump
+                response = copy.deepcopy(self._entries[best_key][2])
+        if expired:
+            self._schedule_save()
+        return response
+
+    def put(self, mode: str, vector, response: dict):
+        with self._lock:
+            self._expire(time.time())
+            self._entries[self._next_key] = (mode, self._normalize(vector), copy.deepcopy(response), time.time())
+            self._next_key += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)  # Evict least recently used
+            self._matrices.clear()
+        self._schedule_save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+        self._schedule_save()
+
+    def flush(self):
+        """Writes pending changes now (called on shutdown)."""
+        if self.path and self._dirty.is_set():
+            self._dirty.clear()
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(time.time())
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "persistent": bool(self.path),
+        }
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                entries = pickle.load(f)
+            self._entries = OrderedDict(entries)
+            self._next_key = max(self._entries.keys(), default=-1) + 1
+            self._expire(time.time())
+            print(f"Loaded {len(self._entries)} cached answers from {self.path}")
+        except Exception as e:
+            print(f"Failed to load answer cache from {self.path}: {e}")
+            self._entries = OrderedDict()
+
+    def _schedule_save(self):
+        if not self.path:
+            return
+        self._dirty.set()
+        if self._writer is None or not self._writer.is_alive():
+            # Started lazily (and again after a fork), like the telemetry log listener
+            self._writer = threading.Thread(target=self._write_loop, name="answer-cache-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.save_delay)  # Coalesce a burst of puts into one write
+            self._dirty.clear()
+            self._save()
+
+    def _save(self):
+        # Entries are never mutated in place, so a shallow snapshot is enough; pickling happens outside the lock
+        with self._lock:
+            snapshot = list(self._entries.items())
+        # Write to a temp file and rename so a crash never leaves a truncated cache behind
+        with self._save_lock:
+            try:
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"  # workers of serve.py share the file
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(snapshot, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Failed to persist answer cache to {self.path}: {e}")
+
+
+answer_cache = SemanticAnswerCache()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU of normalized query text -> embedding, keyed per embedding model
+    so vectors from different models (and dimensions) never collide.
+    """
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (model, normalized text) -> vector
+        self._counters = {}  # model -> {"hits": n, "misses": n}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def _count(self, model: str, outcome: str):
+        counters = self._counters.setdefault(model, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def get(self, model: str, text: str):
+        key = (model, self.normalize(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self._count(model, "misses")
+                return None
+            self._count(model, "hits")
+            self._entries.move_to_end(key)
+        return list(vector) if isinstance(vector, list) else vector
+
+    def put(self, model: str, text: str, vector):
+        if isinstance(vector, np.ndarray):
+            # Shared between callers, so make sure nobody can modify it in place
+            vector = np.array(vector, dtype='float32').reshape(-1)
+            vector.flags.writeable = False
+        else:
+            vector = list(vector)
+        key = (model, self.normalize(text))
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        models = {}
+        for model, counters in self._counters.items():
+            total = counters["hits"] + counters["misses"]
+            models[model] = {
+                **counters,
+                "hit_rate": round(counters["hits"] / total, 4) if total else 0.0,
+                "size": sum(1 for m, _ in self._entries if m == model),
+            }
+        return {"size": len(self._entries), "max_size": self.max_size, "models": models}
+
+
+embedding_cache = EmbeddingCache()
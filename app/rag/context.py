@@ -0,0 +1,104 @@
+import os
+import threading
+
+# Configuration (override via environment)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+REDUNDANCY_THRESHOLD = float(os.getenv("CONTEXT_REDUNDANCY_THRESHOLD", "0.8"))  # word-set Jaccard
+
+_encoder = None
+_encoder_failed = False
+
+# Running totals, reported by the stats endpoints
+token_usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "context_tokens": 0, "sources_dropped": 0}
+_usage_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate token count. Uses tiktoken's cl100k_base (close enough to Gemini's tokenizer
+    for budgeting); falls back to ~4 characters per token if the encoding can't be loaded.
+    """
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # The BPE file is downloaded on first use; don't retry on every request when offline
+            _encoder_failed = True
+            print(f"tiktoken unavailable, estimating tokens from length: {e}")
+    if _encoder is not None:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def _words(text: str) -> set:
+    return set(text.lower().split())
+
+
+def _is_redundant(words: set, kept: list) -> bool:
+    for other in kept:
+        union = words | other
+        if union and len(words & other) / len(union) >= REDUNDANCY_THRESHOLD:
+            return True
+    return False
+
+
+def format_source(source: dict) -> str:
+    # One compact line per source instead of indented JSON
+    return f"[{source['source']} | {source['reference']}] {' '.join(str(source['core_idea']).split())}"
+
+
+def pack_sources(sources: list, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Keeps sources in rank order while they fit in the token budget, skipping near-duplicates.
+    Returns (compact context text, tokens used, number of sources dropped).
+    """
+    lines, kept_words = [], []
+    used = 0
+    dropped = 0
+    for source in sources:
+        words = _words(str(source.get('core_idea', '')))
+        if _is_redundant(words, kept_words):
+            dropped += 1
+            continue
+        line = format_source(source)
+        cost = count_tokens(line) + 1  # + newline
+        if used + cost > budget:
+            if lines:
+                dropped += 1
+                continue
+            # Never send an empty context just because the best source is long: truncate it
+            line = line[:max(budget, 1) * 4]
+            cost = count_tokens(line) + 1
+        lines.append(line)
+        kept_words.append(words)
+        used += cost
+    return "\n".join(lines), used, dropped
+
+
+def message_tokens(messages) -> int:
+    return sum(count_tokens(str(m.content)) for m in messages)
+
+
+def record_usage(mode: str, messages, response=None, context_tokens: int = 0, dropped: int = 0,
+                 completion_text: str = ""):
+    """
+    Logs prompt vs. completion tokens for one LLM call. Uses the provider's usage metadata
+    when the response carries it, otherwise local estimates.
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens") or message_tokens(messages)
+    completion_tokens = usage.get("output_tokens") or (count_tokens(completion_text) if completion_text else 0)
+    source = "reported" if usage else "estimated"
+
+    with _usage_lock:
+        token_usage["requests"] += 1
+        token_usage["prompt_tokens"] += prompt_tokens
+        token_usage["completion_tokens"] += completion_tokens
+        token_usage["context_tokens"] += context_tokens
+        token_usage["sources_dropped"] += dropped
+
+    print(f"Token usage ({source}, {mode}): prompt={prompt_tokens} completion={completion_tokens} "
+          f"context={context_tokens}/{CONTEXT_TOKEN_BUDGET} dropped_sources={dropped}")
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
@@ -1,10 +1,13 @@
 import os
+import re
+import json
 import time
-import random
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
 from pinecone import Pinecone
 from langchain_core.messages import HumanMessage, SystemMessage
 from typing import List
+from app.rag.rate_limiter import LLMBusyError
+from app.rag.llm_router import llm_router
 
 # Global variables
 pinecone_index = None
@@ -18,17 +21,28 @@ class PineconeInferenceEmbeddings:
         self.model = model
 
     def embed_query(self, text: str) -> List[float]:
+        from app.rag.cache import embedding_cache
+        cached = embedding_cache.get(self.model, text)
+        if cached is not None:
+            return cached
         try:
             response = self.pc.inference.embed(
                 model=self.model,
                 inputs=[text],
                 parameters={"input_type": "query", "truncate": "END"}
             )
-            return response.data[0]['values']
+            vector = response.data[0]['values']
+            if vector:
+                embedding_cache.put(self.model, text, vector)
+            return vector
         except Exception as e:
             print(f"Error embedding query: {e}")
             return []
 
+    async def aembed_query(self, text: str) -> List[float]:
+        # The Pinecone inference client is synchronous; keep the round-trip off the event loop
+        return await asyncio.to_thread(self.embed_query, text)
+
 def initialize_rag():
     global pinecone_index, llm, embeddings
     
@@ -59,119 +73,82 @@ def initialize_rag():
         print(f"Failed to connect to Pinecone Index: {e}")
         return
     
-    # LLM - Gemini 1.5 Pro (Better instruction following)
+    # LLM - one Gemini client per model; the router picks the model per request
     try:
-        llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.5, google_api_key=google_api_key)
-        print("RAG Initialized successfully with Pinecone & Gemini Pro (Direct Mode).")
+        llm_router.configure(google_api_key)
+        llm = llm_router
+        print(f"RAG Initialized successfully with Pinecone & Gemini (chat: {llm.chain()[0]}, deep dive: {llm.chain(True)[0]}).")
     except Exception as e:
         print(f"Failed to initialize Gemini: {e}")
 
-def call_llm_with_retry(prompt_messages, max_retries=5):
-    """Calls the LLM with exponential backoff for 429 errors."""
-    delay = 2
-    for attempt in range(max_retries):
-        try:
-            return llm.invoke(prompt_messages)
-        except Exception as e:
-            error_str = str(e).lower()
-            if "429" in error_str or "quota" in error_str or "resourceexhausted" in error_str:
-                if attempt < max_retries - 1:
-                    sleep_time = delay + random.uniform(0, 1)
-                    print(f"Quota hit. Retrying in {sleep_time:.2f} seconds... (Attempt {attempt+1}/{max_retries})")
-                    time.sleep(sleep_time)
-                    delay *= 2  # Exponential backoff
-                else:
-                    raise e
-            else:
-                raise e
-
-from app.rag.faiss_engine import search_gita
-
-def ask_question(query: str, mode: str = "chat") -> str:
-    global pinecone_index, llm, embeddings
-    
-    # Initialize Core RAG components (always needed for LLM)
-    if not (llm):
-        initialize_rag()
-    
+def call_llm_with_retry(prompt_messages, deep_dive: bool = False):
+    """
+    Calls the LLM through the router: the tier's model behind its rate limiter, failing over to
+    the next model on quota or timeout errors. Raises LLMBusyError when every model is saturated.
+    """
+    return llm.invoke(prompt_messages, deep_dive=deep_dive)
+
+async def acall_llm_with_retry(prompt_messages, deep_dive: bool = False):
+    """Async variant of call_llm_with_retry; may also hedge a slow call (LLM_HEDGE)."""
+    return await llm.ainvoke(prompt_messages, deep_dive=deep_dive)
+
+from app.rag.faiss_engine import search_gita, embed_query
+from app.rag.cache import answer_cache
+from app.rag.batcher import batched_search
+from app.rag.retrieval import RetrievalJob
+from app.rag.context import pack_sources, record_usage
+from app.rag.telemetry import span, observe, request_trace, set_mode, annotate, log_event
+
+def _detect_deep_dive(query: str, mode: str) -> bool:
     mode_in = mode.strip().lower()
     
-    # 1. DETERMINE MODE
     # Force Deep Dive for core philosophical concepts regardless of UI toggles
     keywords = ["deep dive", "structure", "karma", "dharma", "yoga", "moksha", "life", "death", "soul", "god"]
     is_deep_dive = (mode_in == "deep_dive") or any(k in query.lower() for k in keywords)
 
-    # DEBUG LOGGING (PROOF OF LIFE)
-    try:
-        with open("server_debug_log.txt", "a") as f:
-            f.write(f"Query: {query} | Mode: {mode_in} | IsDeepDive: {is_deep_dive} | Time: {time.time()}\n")
-    except:
-        pass
+    # Structured, non-blocking log (written by a background thread)
+    log_event("query", query=query, mode=mode_in, deep_dive=is_deep_dive)
+    set_mode("deep_dive" if is_deep_dive else "chat")
 
     if is_deep_dive:
         print(f"Executing Deep Dive Logic for query: '{query}'")
     else:
         print(f"Executing Standard Chat Logic for query: '{query}'")
-    
-    # 2. CONTEXT RETRIEVAL
-    retrieved_sources = [] # New: Store as objects for JSON serialization
-    
-    # Attempt FAISS (Local)
-    try:
-        # We always try FAISS first for Gita related queries as it is faster and more precise
-        faiss_results = search_gita(query, top_k=4)
-        if faiss_results:
-            print(f"FAISS found {len(faiss_results)} matches.")
-            for res in faiss_results:
-                    # Spec Section 4.3: "ALWAYS send compressed meaning"
-                    retrieved_sources.append({
-                        "source": "Bhagavad Gita",
-                        "reference": res['source'],
-                        "core_idea": res['text'] # This is the meaning/translation
-                    })
-    except Exception as e:
-        print(f"FAISS Search Skipped/Failed: {e}")
+    return is_deep_dive
+
+def _faiss_sources(faiss_results) -> list:
+    sources = []
+    if faiss_results:
+        print(f"FAISS found {len(faiss_results)} matches.")
+        for res in faiss_results:
+            # Spec Section 4.3: "ALWAYS send compressed meaning"
+            sources.append({
+                "source": "Bhagavad Gita",
+                "reference": res['source'],
+                "core_idea": res['text'] # This is the meaning/translation
+            })
+    return sources
+
+def _pinecone_sources(results) -> list:
+    sources = []
+    for match in results.matches:
+        if match.score < 0.1: continue
+        text_content = match.metadata.get('text') or match.metadata.get('chunk_text')
+        if text_content:
+            sources.append({
+                "source": "Upanishads/Vedic Text",
+                "reference": "Chunk ID: " + match.id,
+                "core_idea": text_content
+            })
+    return sources
+
+def _build_messages(query: str, retrieved_sources: list, is_deep_dive: bool, stream: bool = False):
+    """Returns (messages, packing stats). Sources are packed under CONTEXT_TOKEN_BUDGET, one compact line each."""
+    context_str, context_tokens, dropped = pack_sources(retrieved_sources)
+    packing = {"context_tokens": context_tokens, "dropped": dropped}
+    if not context_str:
+        context_str = "No specific scripture context found."
 
-    # Fallback/Augment with Pinecone (Cloud)
-    # If FAISS provided nothing, or if we are in standard chat and want more breadth
-    if not retrieved_sources:
-        if not (pinecone_index and embeddings):
-                initialize_rag()
-        
-        if pinecone_index and embeddings:
-            try:
-                query_vector = embeddings.embed_query(query)
-                if query_vector:
-                    results = pinecone_index.query(
-                        vector=query_vector,
-                        top_k=4,
-                        include_metadata=True,
-                        namespace="gita"
-                    )
-                    for match in results.matches:
-                        if match.score < 0.1: continue
-                        text_content = match.metadata.get('text') or match.metadata.get('chunk_text')
-                        if text_content:
-                            retrieved_sources.append({
-                                "source": "Upanishads/Vedic Text",
-                                "reference": "Chunk ID: " + match.id,
-                                "core_idea": text_content
-                            })
-            except Exception as e:
-                print(f"Pinecone Search Error: {e}")
-
-    # Spec Section 4.3: Create Context Object
-    context_object = {
-        "question": query,
-        "retrieved_sources": retrieved_sources
-    }
-    
-    import json
-    context_json_str = json.dumps(context_object, indent=2)
-
-    # 3. CONSTRUCT MESSAGES & CALL LLM
-    messages = []
-    
     if is_deep_dive:
         # Spec Section 1 & 2 & 3
         system_instruction = """You are an AI guide trained on Indian philosophical texts (Bhagavad Gita, Principal Upanishads).
@@ -213,8 +190,8 @@ Every answer MUST include these sections in order (use exact headers):
 AFTER the reflection prompt, add a section called "Suggested Questions:" with 4 follow-up questions.
 """
         user_content = f"""
-CONTEXT (JSON):
-{context_json_str}
+CONTEXT ([source | reference] meaning):
+{context_str}
 
 USER QUESTION: {query}
 
@@ -222,20 +199,13 @@ INSTRUCTION:
 Answer in PURE MARKDOWN format. Do not use JSON output.
 Follow the 5 headers exactly.
 """
-        messages = [
+        return [
             SystemMessage(content=system_instruction),
             HumanMessage(content=user_content)
-        ]
-    else:
-        # Standard Chat
-        # Reconstruct simple string context for standard chat
-        context_str = ""
-        if retrieved_sources:
-             context_str = "\n\n".join([f"Source: {r['source']} ({r['reference']})\nContent: {r['core_idea']}" for r in retrieved_sources])
-        else:
-             context_str = "No specific scripture context found."
-
-        prompt = f"""You are an assistant answering questions about the Bhagavad Gita and Upanishads.
+        ], packing
+
+    # Standard Chat
+    prompt = f"""You are an assistant answering questions about the Bhagavad Gita and Upanishads.
 Use the following pieces of retrieved context to answer the question at the end.
 Please provide a concise and clear answer (maximum 300 words).
 
@@ -243,21 +213,23 @@ Context:
 {context_str}
 
 Question: {query}
-
+"""
+    if stream:
+        # Streamed answers are shown token by token, so ask for plain text instead of JSON
+        prompt += """
+IMPORTANT: Answer in plain text. Do not use JSON output.
+AFTER the answer, add a section called "Suggested Questions:" with 4 short, relevant follow-up questions, one per line.
+"""
+    else:
+        prompt += """
 IMPORTANT: Return VALID JSON.
 The JSON must have two keys:
 1. "answer": The text of your answer.
 2. "follow_up_questions": A list of 4 short, relevant follow-up questions based on the answer.
 """
-        messages = [HumanMessage(content=prompt)]
-
-    # Call LLM
-    try:
-        response = call_llm_with_retry(messages)
-    except Exception as e:
-        return {"answer": f"Error calling AI: {str(e)}", "follow_up_questions": []}
+    return [HumanMessage(content=prompt)], packing
 
-    # 4. PROCESS RESPONSE
+def _response_text(response) -> str:
     # Normalize content (handle list output from Gemini)
     content_text = ""
     if isinstance(response.content, list):
@@ -270,41 +242,391 @@ The JSON must have two keys:
                 content_text += str(part)
     else:
         content_text = str(response.content)
+    return content_text
 
+def _parse_response(content_text: str, is_deep_dive: bool):
+    """Returns (result, cacheable)."""
     if is_deep_dive:
-        # Gemini sometimes wraps the markdown in ```json ... ``` even when told not to.
+        # Gemini sometimes wraps the markdown in ```json (or ```markdown) ... ``` even when told not to.
         # We must strip this if present, otherwise it renders as code block.
         answer_text = content_text
-        if answer_text.strip().startswith("```json"):
-             answer_text = answer_text.strip().replace("```json", "", 1)
+        if answer_text.strip().startswith("```"):
+             answer_text = re.sub(r"^```[A-Za-z]*", "", answer_text.strip(), count=1)
         if answer_text.strip().endswith("```"):
              answer_text = answer_text.strip()[:-3]
         
         # Also clean up any leading/trailing quotes if it was a JSON string
         answer_text = answer_text.strip().strip('"')
         
-        # Debug tag to prove new logic ran
-        # Debug tag removed as per user request
-        # status_tag = f"\n\n_(Mode: Deep Dive | Context: {'Local FAISS' if retrieved_sources else 'Cloud/General'})_"
-        # answer_text += status_tag
-        
-        # Extract Follow Ups
+        # A JSON reply ({"answer": ..., "follow_up_questions": [...]}) is used as it is
+        if answer_text.startswith("{"):
+            try:
+                result = json.loads(answer_text.strip("`"))
+                if isinstance(result, dict) and "answer" in result:
+                    return result, True
+            except json.JSONDecodeError:
+                pass
+
+        # Extract Follow Ups (the marker may be bolded or a heading)
         follow_ups = []
-        if "Suggested Questions:" in answer_text:
-            parts = answer_text.split("Suggested Questions:")
-            answer_text = parts[0].strip()
-            lines = parts[1].strip().split('\n')
-            follow_ups = [line.strip('- ').strip() for line in lines if line.strip()]
+        match = SUGGESTED_QUESTIONS_RE.search(answer_text)
+        if match:
+            lines = answer_text[match.end():].strip().strip('`').split('\n')
+            answer_text = answer_text[:match.start()].strip()
+            follow_ups = [line.strip('-*• ').strip() for line in lines if line.strip('-*•` ')]
             
         return {
             "answer": answer_text,
             "follow_up_questions": follow_ups if follow_ups else ["What is Dharma?", "Explain Yoga", "Who is Krishna?"]
-        }
-    else:
-        # Standard JSON parsing
-        clean_content = content_text.replace('```json', '').replace('```', '').strip()
-        try:
-            import json
-            return json.loads(clean_content)
-        except json.JSONDecodeError:
-            return {"answer": clean_content, "follow_up_questions": []}
+        }, True
+
+    # Standard JSON parsing
+    clean_content = content_text.replace('```json', '').replace('```', '').strip()
+    try:
+        result = json.loads(clean_content)
+        return result, isinstance(result, dict)
+    except json.JSONDecodeError:
+        # Unparseable output is returned as-is but never cached
+        return {"answer": clean_content, "follow_up_questions": []}, False
+
+def ask_question(query: str, mode: str = "chat") -> str:
+    with request_trace("ask_sync"):
+        return _ask_question(query, mode)
+
+def _ask_question(query: str, mode: str = "chat") -> str:
+    global pinecone_index, llm, embeddings
+    
+    # Initialize Core RAG components (always needed for LLM)
+    if not (llm):
+        initialize_rag()
+    
+    # 1. DETERMINE MODE
+    is_deep_dive = _detect_deep_dive(query, mode)
+
+    # Embed once: the vector keys the answer cache and is reused by the FAISS search
+    cache_mode = "deep_dive" if is_deep_dive else "chat"
+    query_vector = None
+    try:
+        query_vector = embed_query(query)
+    except Exception as e:
+        print(f"Query embedding failed: {e}")
+
+    if query_vector is not None:
+        with span("cache_lookup"):
+            cached = answer_cache.get(cache_mode, query_vector[0])
+        if cached is not None:
+            print(f"Answer cache hit for query: '{query}'")
+            annotate(cache_hit=True)
+            return cached
+    
+    # 2. CONTEXT RETRIEVAL
+    retrieved_sources = [] # New: Store as objects for JSON serialization
+    
+    # Attempt FAISS (Local)
+    try:
+        # We always try FAISS first for Gita related queries as it is faster and more precise
+        retrieved_sources = _faiss_sources(search_gita(query, top_k=4, query_vector=query_vector))
+    except Exception as e:
+        print(f"FAISS Search Skipped/Failed: {e}")
+
+    # Fallback/Augment with Pinecone (Cloud)
+    # If FAISS provided nothing, or if we are in standard chat and want more breadth
+    if not retrieved_sources:
+        if not (pinecone_index and embeddings):
+                initialize_rag()
+        
+        if pinecone_index and embeddings:
+            try:
+                with span("pinecone_embed"):
+                    pinecone_vector = embeddings.embed_query(query)
+                if pinecone_vector:
+                    with span("pinecone_query"):
+                        results = pinecone_index.query(
+                            vector=pinecone_vector,
+                            top_k=4,
+                            include_metadata=True,
+                            namespace="gita"
+                        )
+                    retrieved_sources = _pinecone_sources(results)
+            except Exception as e:
+                print(f"Pinecone Search Error: {e}")
+
+    # 3. CONSTRUCT MESSAGES & CALL LLM
+    with span("prompt"):
+        messages, packing = _build_messages(query, retrieved_sources, is_deep_dive)
+
+    try:
+        with span("llm"):
+            response = call_llm_with_retry(messages, deep_dive=is_deep_dive)
+    except LLMBusyError:
+        raise  # Callers turn this into a "busy, try again" reply
+    except Exception as e:
+        return {"answer": f"Error calling AI: {str(e)}", "follow_up_questions": []}
+
+    # 4. PROCESS RESPONSE
+    with span("parse"):
+        content_text = _response_text(response)
+        record_usage(cache_mode, messages, response, completion_text=content_text, **packing)
+        result, cacheable = _parse_response(content_text, is_deep_dive)
+    if cacheable and query_vector is not None:
+        answer_cache.put(cache_mode, query_vector[0], result)
+    return result
+
+async def _apinecone_search(query: str, top_k: int = 4) -> list:
+    """Pinecone inference embed + query, as source dicts. Runs concurrently with FAISS via RetrievalJob."""
+    global pinecone_index, embeddings
+
+    if not (pinecone_index and embeddings):
+            await asyncio.to_thread(initialize_rag)
+    if not (pinecone_index and embeddings):
+        return []
+
+    with span("pinecone_embed"):
+        pinecone_vector = await embeddings.aembed_query(query)
+    if not pinecone_vector:
+        return []
+    with span("pinecone_query"):
+        results = await asyncio.to_thread(
+            pinecone_index.query,
+            vector=pinecone_vector,
+            top_k=top_k,
+            include_metadata=True,
+            namespace="gita"
+        )
+    return _pinecone_sources(results)
+
+async def aask_question(query: str, mode: str = "chat"):
+    """
+    Non-blocking variant of ask_question for the async endpoints.
+    CPU-bound and blocking client calls run in worker threads; the LLM call is awaited directly.
+    """
+    with request_trace("ask"):
+        return await _aask_question(query, mode)
+
+async def _aask_question(query: str, mode: str = "chat"):
+    global pinecone_index, llm, embeddings
+    
+    if not (llm):
+        await asyncio.to_thread(initialize_rag)
+    
+    # 1. DETERMINE MODE
+    is_deep_dive = _detect_deep_dive(query, mode)
+
+    cache_mode = "deep_dive" if is_deep_dive else "chat"
+    # Local FAISS (through the micro-batcher) and Pinecone start together under one deadline.
+    # The local query vector arrives first and keys the answer cache.
+    retrieval = RetrievalJob(query, local_search=batched_search, remote_search=_apinecone_search, top_k=4)
+    with span("local_retrieval"):
+        query_vector, faiss_results = await retrieval.local()
+
+    if query_vector is not None:
+        with span("cache_lookup"):
+            cached = answer_cache.get(cache_mode, query_vector[0])
+        if cached is not None:
+            print(f"Answer cache hit for query: '{query}'")
+            annotate(cache_hit=True)
+            retrieval.cancel()
+            return cached
+    
+    # 2. CONTEXT RETRIEVAL
+    with span("remote_wait"):
+        retrieved_sources = await retrieval.sources(_faiss_sources(faiss_results))
+
+    # 3. CONSTRUCT MESSAGES & CALL LLM
+    with span("prompt"):
+        messages, packing = _build_messages(query, retrieved_sources, is_deep_dive)
+
+    try:
+        with span("llm"):
+            response = await acall_llm_with_retry(messages, deep_dive=is_deep_dive)
+    except LLMBusyError:
+        raise  # Callers turn this into a "busy, try again" reply
+    except Exception as e:
+        return {"answer": f"Error calling AI: {str(e)}", "follow_up_questions": []}
+
+    # 4. PROCESS RESPONSE
+    with span("parse"):
+        content_text = _response_text(response)
+        record_usage(cache_mode, messages, response, completion_text=content_text, **packing)
+        result, cacheable = _parse_response(content_text, is_deep_dive)
+    if cacheable and query_vector is not None:
+        answer_cache.put(cache_mode, query_vector[0], result)
+    return result
+
+SUGGESTED_QUESTIONS_MARKER = "Suggested Questions:"
+# The marker as Gemini actually writes it: "Suggested Questions:", "**Suggested Questions:**",
+# "### Suggested Questions", "*Suggested Questions*:" ...
+SUGGESTED_QUESTIONS_RE = re.compile(
+    r"(?:#{1,6}[ \t]*)?[*_]{0,3}Suggested [Qq]uestions[*_]{0,3}(?::[*_]{0,3}|(?<=[*_])|(?=[ \t]*(?:\n|$)))"
+)
+_MARKER_HOLD = len("### **Suggested Questions:**")
+
+class SuggestedQuestionsSplitter:
+    """
+    Incrementally splits a streamed answer at the "Suggested Questions:" marker.
+    feed() returns only the answer text that is safe to show: a partial marker (with any
+    markdown around it) at the end of the buffer is held back, and nothing after the marker
+    is ever returned. A reply that is JSON (bare or in a ```json fence) is not streamed at
+    all; the parsed "done" answer replaces it. A ```markdown fence is streamed without the fences.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.emitted = 0
+        self.in_follow_ups = False  # marker (or the closing fence) reached: nothing more to show
+        self.suppressed = False     # JSON reply: nothing is streamed
+        self._started = False       # opening of the reply checked for a fence / JSON
+        self._fenced = False        # streaming the inside of a ``` block
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if self.in_follow_ups or self.suppressed:
+            return ""
+        if not self._started and not self._check_opening():
+            return ""
+        return self._emit(final=False)
+
+    def flush(self) -> str:
+        if self.in_follow_ups or self.suppressed:
+            return ""
+        if not self._started:
+            self._check_opening(final=True)
+            if self.suppressed:
+                return ""
+        return self._emit(final=True)
+
+    def _check_opening(self, final: bool = False) -> bool:
+        """Looks at the start of the reply once; returns True when streaming can begin."""
+        stripped = self.buffer.lstrip()
+        offset = len(self.buffer) - len(stripped)
+        if stripped.startswith("{"):
+            self.suppressed = True
+            return False
+        if stripped.startswith("```"):
+            newline = stripped.find("\n")
+            if newline == -1:
+                if not final:
+                    return False  # Language tag not complete yet
+                newline = len(stripped)
+            language = stripped[3:newline].strip().lower()
+            body = stripped[newline + 1:].lstrip()
+            if language not in ("", "markdown", "md") or body.startswith("{"):
+                self.suppressed = True
+                return False
+            if not body and not final:
+                return False  # An untagged fence may still turn out to hold JSON
+            self._fenced = True
+            self.emitted = offset + min(newline + 1, len(stripped))
+        elif not final and (not stripped or (len(stripped) < 3 and "```".startswith(stripped))):
+            return False  # Could still become a fence
+        self._started = True
+        return True
+
+    def _emit(self, final: bool) -> str:
+        end = len(self.buffer)
+        match = SUGGESTED_QUESTIONS_RE.search(self.buffer, max(0, self.emitted - _MARKER_HOLD))
+        if match:
+            end = match.start()
+            self.in_follow_ups = True
+        if self._fenced:
+            close = self.buffer.find("```", self.emitted)
+            if close != -1 and close <= end:
+                end = close
+                self.in_follow_ups = True
+        if not (self.in_follow_ups or final):
+            end = self._hold_back(end)
+
+        out = self.buffer[self.emitted:end] if end > self.emitted else ""
+        self.emitted = max(self.emitted, end)
+        return out
+
+    def _hold_back(self, end: int) -> int:
+        # Earliest position from which the tail could still grow into the marker or a closing fence
+        for i in range(max(self.emitted, end - _MARKER_HOLD), end):
+            tail = self.buffer[i:end]
+            rest = tail.lstrip(" \t#*_").lower()
+            if ("suggested questions".startswith(rest)
+                    or (rest.startswith("suggested questions") and len(rest) <= len("suggested questions") + 3)
+                    or (self._fenced and "```".startswith(tail))):
+                return i
+        return end
+
+async def astream_question(query: str, mode: str = "chat"):
+    """
+    Streams an answer as (event, data) tuples: any number of ("token", {"text": ...})
+    followed by one ("done", {"answer", "follow_up_questions"}) or ("error", {"answer": ...}).
+    The "done" payload is the fully parsed answer, identical in shape to aask_question.
+    """
+    with request_trace("ask_stream"):
+        async for event in _astream_question(query, mode):
+            yield event
+
+async def _astream_question(query: str, mode: str = "chat"):
+    global llm
+    
+    if not (llm):
+        await asyncio.to_thread(initialize_rag)
+    
+    is_deep_dive = _detect_deep_dive(query, mode)
+
+    cache_mode = "deep_dive" if is_deep_dive else "chat"
+    # Local FAISS (through the micro-batcher) and Pinecone start together under one deadline.
+    # The local query vector arrives first and keys the answer cache.
+    retrieval = RetrievalJob(query, local_search=batched_search, remote_search=_apinecone_search, top_k=4)
+    with span("local_retrieval"):
+        query_vector, faiss_results = await retrieval.local()
+
+    if query_vector is not None:
+        with span("cache_lookup"):
+            cached = answer_cache.get(cache_mode, query_vector[0])
+        if cached is not None:
+            print(f"Answer cache hit for query: '{query}'")
+            annotate(cache_hit=True)
+            retrieval.cancel()
+            yield "token", {"text": cached.get("answer", "")}
+            yield "done", cached
+            return
+
+    with span("remote_wait"):
+        retrieved_sources = await retrieval.sources(_faiss_sources(faiss_results))
+    with span("prompt"):
+        messages, packing = _build_messages(query, retrieved_sources, is_deep_dive, stream=True)
+
+    if not llm:
+        yield "error", {"answer": "Error calling AI: LLM is not initialized", "follow_up_questions": []}
+        return
+
+    splitter = SuggestedQuestionsSplitter()
+    usage_chunk = None  # Gemini reports token usage on the final chunk
+    llm_start = time.perf_counter()
+    first_chunk = True
+    try:
+        # The router fails over to the next model only until the first chunk arrives
+        async for chunk in llm.astream(messages, deep_dive=is_deep_dive):
+            if first_chunk:
+                observe("llm_first_token", time.perf_counter() - llm_start)
+                first_chunk = False
+            if getattr(chunk, "usage_metadata", None):
+                usage_chunk = chunk
+            text = splitter.feed(_response_text(chunk))
+            if text:
+                yield "token", {"text": text}
+    except LLMBusyError as e:
+        yield "error", {"answer": str(e), "follow_up_questions": [], "busy": True, "retry_after": round(e.retry_after)}
+        return
+    except Exception as e:
+        yield "error", {"answer": f"Error calling AI: {str(e)}", "follow_up_questions": []}
+        return
+
+    observe("llm", time.perf_counter() - llm_start)
+
+    tail = splitter.flush()
+    if tail:
+        yield "token", {"text": tail}
+
+    with span("parse"):
+        record_usage(cache_mode, messages, usage_chunk, completion_text=splitter.buffer, **packing)
+        # Both modes were prompted for markdown + "Suggested Questions:", so parse them the deep-dive way
+        result, cacheable = _parse_response(splitter.buffer, True)
+    if cacheable and query_vector is not None:
+        answer_cache.put(cache_mode, query_vector[0], result)
+    yield "done", result
@@ -1,5 +1,10 @@
 import os
 import pickle
+import threading
+
+import numpy as np
+
+from app.rag.telemetry import span
 
 # Global FAISS index and metadata
 faiss_index = None
@@ -9,6 +14,101 @@ model = None
 DATA_FILE_PATH = "app/data/bhagavad_gita.csv" # Expected CSV location
 INDEX_FILE_PATH = "app/data/gita_faiss.index"
 METADATA_FILE_PATH = "app/data/gita_metadata.pkl"
+VERSE_STORE_PATH = "app/data/gita_verses.bin" # mmap'd verse store, preferred over the pickle
+FLAT_INDEX_FILE_PATH = "app/data/gita_faiss_flat.index" # exact copy kept by app/rag/index_builder.py
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# "torch" (SentenceTransformer) or "onnx" (int8 ONNX Runtime export, see app/rag/onnx_encoder.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# Index type used when building: flat, hnsw, ivf_flat or ivf_pq (see app/rag/index_builder.py)
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+# Vectors are L2-normalized, so inner product == cosine similarity and "score" is a real similarity
+FAISS_METRIC = os.getenv("FAISS_METRIC", "ip")
+# Hits below this cosine similarity are dropped instead of being stuffed into the prompt
+FAISS_MIN_SCORE = float(os.getenv("FAISS_MIN_SCORE", "0.3"))
+
+# BM25 over the verse text, fused with the dense ranking (see app/rag/lexical.py)
+BM25_FILE_PATH = "app/data/gita_bm25.pkl"
+LEXICAL_FUSION = os.getenv("LEXICAL_FUSION", "1") == "1"
+BM25_MIN_SCORE = float(os.getenv("BM25_MIN_SCORE", "1.0"))
+RRF_K = 60
+lexical_index = None
+
+# Separate locks so the model and the index can be loaded concurrently (see app/rag/warmup.py)
+_model_lock = threading.Lock()
+_index_lock = threading.Lock()
+
+def load_embedding_model():
+    """Loads the embedding model for EMBEDDING_BACKEND once. Safe to call from several threads."""
+    global model
+    with _model_lock:
+        if model is not None:
+            return model
+        if EMBEDDING_BACKEND == "onnx":
+            try:
+                from app.rag.onnx_encoder import OnnxEncoder
+                model = OnnxEncoder()
+                return model
+            except Exception as e:
+                print(f"Failed to load ONNX embedding model, falling back to SentenceTransformer: {e}")
+        from sentence_transformers import SentenceTransformer
+        try:
+            model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        except Exception as e:
+            print(f"Failed to load SentenceTransformer: {e}")
+        return model
+
+def load_index() -> bool:
+    """Loads the saved FAISS index and verse metadata from disk. Returns False if they are missing or unreadable."""
+    global faiss_index, gita_metadata
+    with _index_lock:
+        if faiss_index is not None and gita_metadata:
+            return True
+        if not os.path.exists(INDEX_FILE_PATH):
+            return False
+        if not (os.path.exists(VERSE_STORE_PATH) or os.path.exists(METADATA_FILE_PATH)):
+            return False
+
+        import faiss
+        from app.rag.index_builder import apply_search_params
+        try:
+            faiss_index = faiss.read_index(INDEX_FILE_PATH)
+            apply_search_params(faiss_index)
+            gita_metadata = load_metadata()
+            load_lexical_index()
+            print("Loaded FAISS index locally.")
+            return True
+        except Exception as e:
+            print(f"Error loading existing FAISS index, rebuilding: {e}")
+            return False
+
+def load_metadata():
+    """Opens the mmap'd verse store, falling back to unpickling gita_metadata.pkl."""
+    if os.path.exists(VERSE_STORE_PATH):
+        try:
+            from app.rag.verse_store import VerseStore
+            return VerseStore(VERSE_STORE_PATH)
+        except Exception as e:
+            print(f"Failed to open verse store {VERSE_STORE_PATH}, using pickle: {e}")
+
+    with open(METADATA_FILE_PATH, 'rb') as f:
+        return pickle.load(f)
+
+def load_lexical_index():
+    """Loads the BM25 index stored next to the FAISS index, building it from the metadata if missing."""
+    global lexical_index
+    from app.rag.lexical import LexicalIndex
+
+    try:
+        if os.path.exists(BM25_FILE_PATH):
+            lexical_index = LexicalIndex.load(BM25_FILE_PATH)
+        elif gita_metadata:
+            lexical_index = LexicalIndex.build(gita_metadata)
+            lexical_index.save(BM25_FILE_PATH)
+    except Exception as e:
+        print(f"Failed to load BM25 index, lexical retrieval disabled: {e}")
+        lexical_index = None
+    return lexical_index
 
 def initialize_faiss():
     global faiss_index, gita_metadata, model
@@ -17,25 +117,14 @@ def initialize_faiss():
     import pandas as pd
     import faiss
     import numpy as np
-    from sentence_transformers import SentenceTransformer
     
     # Initialize Embedding Model (lightweight)
-    try:
-        model = SentenceTransformer('all-MiniLM-L6-v2') 
-    except Exception as e:
-        print(f"Failed to load SentenceTransformer: {e}")
+    if load_embedding_model() is None:
         return
 
     # Check if index exists to load
-    if os.path.exists(INDEX_FILE_PATH) and os.path.exists(METADATA_FILE_PATH):
-        try:
-            faiss_index = faiss.read_index(INDEX_FILE_PATH)
-            with open(METADATA_FILE_PATH, 'rb') as f:
-                gita_metadata = pickle.load(f)
-            print("Loaded FAISS index locally.")
-            return
-        except Exception as e:
-            print(f"Error loading existing FAISS index, rebuilding: {e}")
+    if load_index():
+        return
 
     # Build Index from CSV
     if os.path.exists(DATA_FILE_PATH):
@@ -54,6 +143,7 @@ def initialize_faiss():
                 # verse_number usually looks like "Chapter 1, Verse 1"
                 verse_ref = row.get('verse_number', 'Unknown')
                 sanskrit = row.get('verse_in_sanskrit', '')
+                transliteration = row.get('sanskrit_verse_transliteration', '')
                 translation = row.get('translation_in_english', row.get('meaning_in_english', ''))
                 
                 # Clean up verse ref if needed or use as is
@@ -65,6 +155,7 @@ def initialize_faiss():
                     "chapter": verse_ref, # Storing full ref string as chapter for simplicity in display
                     "verse": "",
                     "sanskrit": sanskrit,
+                    "transliteration": transliteration,
                     "translation": translation,
                     "full_text": text_for_embedding
                 })
@@ -72,15 +163,21 @@ def initialize_faiss():
             # Embed
             embeddings = model.encode(documents)
             
-            # Create FAISS Index
-            dimension = embeddings.shape[1]
-            faiss_index = faiss.IndexFlatL2(dimension)
-            faiss_index.add(embeddings.astype('float32'))
+            # Create FAISS Index (the exact flat copy is what index_builder rebuilds from)
+            from app.rag.index_builder import create_index
+            flat_index = create_index(embeddings, "flat", FAISS_METRIC)
+            faiss_index = flat_index if FAISS_INDEX_TYPE == "flat" else create_index(embeddings, FAISS_INDEX_TYPE, FAISS_METRIC)
             
             # Save
             faiss.write_index(faiss_index, INDEX_FILE_PATH)
+            faiss.write_index(flat_index, FLAT_INDEX_FILE_PATH)
             with open(METADATA_FILE_PATH, 'wb') as f:
                 pickle.dump(gita_metadata, f)
+            from app.rag.verse_store import write_verse_store
+            write_verse_store(gita_metadata, VERSE_STORE_PATH)
+            if os.path.exists(BM25_FILE_PATH):
+                os.remove(BM25_FILE_PATH)  # Stale: doc ids changed
+            load_lexical_index()
                 
             print(f"FAISS index built with {len(documents)} verses.")
             
@@ -89,29 +186,206 @@ def initialize_faiss():
     else:
         print(f"Gita CSV not found at {DATA_FILE_PATH}. transform_local_rag will likely fail.")
 
-def search_gita(query: str, top_k: int = 3):
+def embed_query(query: str):
+    """Embeds a query with the local model. Returns a (1, dim) float32 array, or None if unavailable."""
     global faiss_index, gita_metadata, model
+
+    pool = _inference_pool()
+    if pool is not None:
+        return pool.encode([query])
+
+    if not (faiss_index and model and gita_metadata):
+        initialize_faiss()
+        if not model:
+            return None
+
+    return encode_queries([query])
+
+def encode_queries(queries: list):
+    """Encodes queries as a (n, dim) float32 matrix, serving repeats from the shared embedding cache."""
+    from app.rag.cache import embedding_cache
+
+    vectors = [embedding_cache.get(EMBEDDING_MODEL_NAME, q) for q in queries]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        with span("encode"):
+            encoded = model.encode([queries[i] for i in missing], batch_size=64).astype('float32')
+        encoded /= np.maximum(np.linalg.norm(encoded, axis=1, keepdims=True), 1e-12)
+        for row, i in enumerate(missing):
+            vectors[i] = encoded[row]
+            embedding_cache.put(EMBEDDING_MODEL_NAME, queries[i], encoded[row])
+
+    return np.vstack(vectors).astype('float32')
+
+def search_gita(query: str, top_k: int = 3, query_vector=None, min_score: float = None):
+    global faiss_index, gita_metadata, model
+
+    pool = _inference_pool()
+    if pool is not None:
+        if query_vector is None:
+            return pool.encode_and_search([query], top_k, min_score)[1][0]
+        return pool.search([query], query_vector, top_k, min_score)[0]
     
     if not (faiss_index and model and gita_metadata):
         initialize_faiss()
         if not (faiss_index and model):
             return []
 
-    # Embed Query
-    query_vector = model.encode([query])
+    # A query that is only a verse reference ("Chapter 2, Verse 47", "BG 2.47") skips embedding entirely
+    direct_hits = _verse_ref_hits(query, top_k)
+    if direct_hits and _reference_only(query):
+        return direct_hits
+
+    # Embed Query (callers that already embedded the query can pass the vector in)
+    if query_vector is None:
+        query_vector = encode_queries([query])
     
+    query_vector = np.array(query_vector, dtype='float32').reshape(1, -1)
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+
     # Search
-    distances, indices = faiss_index.search(query_vector.astype('float32'), top_k)
+    with span("faiss_search"):
+        distances, indices = faiss_index.search(query_vector, _candidate_k(top_k))
     
+    with span("rerank"):
+        return _with_ref_hits(direct_hits, _rank_hits(query, query_vector[0], distances[0], indices[0], top_k, min_score), top_k)
+
+def search_gita_batch(queries: list, top_k: int = 3, min_score: float = None) -> list:
+    """
+    Searches many queries at once: one batched encode and one FAISS search over the whole matrix.
+    Returns one result list per query, in the same shape as search_gita.
+    """
+    _, results = encode_and_search_batch(queries, top_k, min_score)
+    return results
+
+def encode_and_search_batch(queries: list, top_k: int = 3, min_score: float = None):
+    """Like search_gita_batch, but also returns the (n, dim) query matrix (None if the model is unavailable)."""
+    global faiss_index, gita_metadata, model
+
+    if not queries:
+        return None, []
+
+    pool = _inference_pool()
+    if pool is not None:
+        return pool.encode_and_search(list(queries), top_k, min_score)
+
+    if not (faiss_index and model and gita_metadata):
+        initialize_faiss()
+        if not (faiss_index and model):
+            return None, [[] for _ in queries]
+
+    # Reference queries are still embedded here: callers use the vector as the answer-cache key
+    query_vectors = encode_queries(list(queries))
+    with span("faiss_search"):
+        distances, indices = faiss_index.search(query_vectors, _candidate_k(top_k))
+
     results = []
-    for i, idx in enumerate(indices[0]):
+    with span("rerank"):
+        for row, query in enumerate(queries):
+            direct_hits = _verse_ref_hits(query, top_k)
+            if direct_hits and _reference_only(query):
+                results.append(direct_hits)
+                continue
+            ranked = _rank_hits(query, query_vectors[row], distances[row], indices[row], top_k, min_score)
+            results.append(_with_ref_hits(direct_hits, ranked, top_k))
+    return query_vectors, results
+
+def _inference_pool():
+    # Set in the web process when INFERENCE_WORKERS > 0; inference processes never start one
+    from app.rag.inference_pool import inference_pool
+    return inference_pool if inference_pool.active else None
+
+def _candidate_k(top_k: int) -> int:
+    # Fetch extra dense candidates when they will be re-ranked together with BM25
+    return top_k * 2 if (LEXICAL_FUSION and lexical_index is not None) else top_k
+
+def _verse_ref_hits(query: str, top_k: int) -> list:
+    if lexical_index is None:
+        return []
+    doc_ids = lexical_index.lookup(query)
+    return [_hit(idx, 1.0) for idx in doc_ids[:max(top_k, 1)] if idx < len(gita_metadata)]
+
+def _reference_only(query: str) -> bool:
+    from app.rag.lexical import is_reference_only
+    return is_reference_only(query)
+
+def _with_ref_hits(ref_hits: list, ranked: list, top_k: int) -> list:
+    # "What does Gita 2.47 say about duty?": the named verse first, then the normal ranking
+    sources = {hit['source'] for hit in ref_hits}
+    return (ref_hits + [hit for hit in ranked if hit['source'] not in sources])[:top_k]
+
+def _dense_candidates(distances_row, indices_row, min_score: float = None) -> list:
+    """[(doc id, cosine similarity)] best first, dropping hits below min_score."""
+    import faiss
+
+    if min_score is None:
+        min_score = FAISS_MIN_SCORE
+    # Legacy L2 indexes over unit vectors: squared distance d relates to cosine as 1 - d / 2
+    is_l2 = getattr(faiss_index, 'metric_type', faiss.METRIC_INNER_PRODUCT) == faiss.METRIC_L2
+
+    candidates = []
+    for i, idx in enumerate(indices_row):
         if idx != -1 and idx < len(gita_metadata):
-            meta = gita_metadata[idx]
-            results.append({
-                "text": meta['full_text'],
-                "sanskrit": meta['sanskrit'],
-                "source": meta['chapter'], # Contains "Chapter X, Verse Y"
-                "score": float(distances[0][i])
-            })
-            
-    return results
+            score = float(distances_row[i])
+            if is_l2:
+                score = 1.0 - score / 2.0
+            if score >= min_score:
+                candidates.append((int(idx), score))
+    return candidates
+
+def _rank_hits(query: str, query_vector, distances_row, indices_row, top_k: int, min_score: float = None) -> list:
+    dense = _dedupe(_dense_candidates(distances_row, indices_row, min_score))
+    if not (LEXICAL_FUSION and lexical_index is not None):
+        return [_hit(idx, score) for idx, score in dense[:top_k]]
+
+    lexical = _dedupe([(idx, score) for idx, score in lexical_index.search(query, top_k * 2) if score >= BM25_MIN_SCORE])
+
+    # Reciprocal-rank fusion of the dense and BM25 rankings
+    fused = {}
+    for ranking in (dense, lexical):
+        for rank, (idx, _) in enumerate(ranking, start=1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (RRF_K + rank)
+
+    if min_score is None:
+        min_score = FAISS_MIN_SCORE
+    dense_scores, bm25_scores = dict(dense), dict(lexical)
+    hits = []
+    for idx in sorted(fused, key=lambda i: -fused[i]):
+        score = dense_scores.get(idx)
+        if score is None:
+            # BM25-only hits pass the same cosine cutoff, so off-topic queries still come back empty
+            # (and fall back to Pinecone); without stored vectors they need a dense hit to ride along
+            score = _cosine_to(query_vector, idx)
+            if (score is None and not dense) or (score is not None and score < min_score):
+                continue
+        hits.append(_hit(idx, score or 0.0, bm25_scores.get(idx, 0.0)))
+        if len(hits) == top_k:
+            break
+    return hits
+
+def _dedupe(ranking: list) -> list:
+    # Multi-verse ranges ("Chapter 1, Verse 4-6") are stored once per verse with identical text
+    seen, unique = set(), []
+    for idx, score in ranking:
+        key = gita_metadata[idx]['full_text']
+        if key not in seen:
+            seen.add(key)
+            unique.append((idx, score))
+    return unique
+
+def _cosine_to(query_vector, idx: int):
+    # Lexical-only hits have no dense score; recompute it when the index can return stored vectors (else None)
+    try:
+        return float(np.dot(faiss_index.reconstruct(idx), query_vector))
+    except Exception:
+        return None
+
+def _hit(idx: int, score: float, bm25: float = 0.0) -> dict:
+    meta = gita_metadata[idx]
+    return {
+        "text": meta['full_text'],
+        "sanskrit": meta['sanskrit'],
+        "source": meta['chapter'], # Contains "Chapter X, Verse Y"
+        "score": score,
+        "bm25": bm25
+    }
@@ -0,0 +1,191 @@
+"""
+Builds the local FAISS index with a configurable index type and reports recall@k
+against the exact flat index plus p50/p99 single-query search latency.
+
+    python -m app.rag.index_builder --type hnsw
+    python -m app.rag.index_builder --type all --no-write   # compare every type, write nothing
+
+Recall is measured with held-out queries: the hand-written questions in
+benchmarks/verse_labels.txt, embedded with the serving model. Stored verse vectors used as
+their own queries always find themselves and overstate recall, so they are only a fallback
+(with a warning) when the embedding model is unavailable.
+"""
+import os
+import sys
+import math
+import time
+import argparse
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+QUESTIONS_PATH = "benchmarks/verse_labels.txt"
+
+# Tunables (override via environment)
+HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "8"))
+PQ_SUBQUANTIZERS = int(os.getenv("FAISS_PQ_M", "48"))  # must divide the embedding dimension
+
+
+def _ivf_nlist(n: int) -> int:
+    # ~sqrt(n) lists, but keep >= 39 training points per centroid so k-means is meaningful
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def create_index(vectors: np.ndarray, index_type: str = "flat", metric: str = "l2"):
+    """Creates, trains and fills a FAISS index of the given type over float32 row vectors."""
+    import faiss
+
+    vectors = np.array(vectors, dtype='float32')
+    if metric == "ip":
+        faiss.normalize_L2(vectors)  # inner product over unit vectors == cosine similarity
+    n, dim = vectors.shape
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss_metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        quantizer = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+        nlist = _ivf_nlist(n)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss_metric)
+        else:
+            m = PQ_SUBQUANTIZERS if dim % PQ_SUBQUANTIZERS == 0 else 1
+            # 8-bit codes need ~39 * 256 training points; shrink the codebooks for small corpora
+            nbits = 8 if n >= 39 * 256 else max(1, int(math.log2(max(n // 39, 2))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits, faiss_metric)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Choose one of {', '.join(INDEX_TYPES)}.")
+
+    index.add(vectors)
+    apply_search_params(index)
+    return index
+
+
+def apply_search_params(index):
+    """Sets query-time knobs (HNSW efSearch, IVF nprobe); these are not persisted by write_index."""
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+    except Exception:
+        pass  # Not an IVF index
+
+
+def load_vectors(path: str) -> np.ndarray:
+    """Reads every stored vector back out of an index that supports reconstruction (flat, HNSW)."""
+    import faiss
+
+    index = faiss.read_index(path)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> list:
+    """The questions of a verse_labels.txt-style file ("question => 2.47, 2.48"), without their labels."""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                questions.append(line.rpartition("=>")[0].strip() or line)
+    return questions
+
+
+def query_vectors(path: str, vectors: np.ndarray, fallback: int) -> tuple:
+    """(queries, description): embedded held-out questions, or `fallback` stored vectors if that is impossible."""
+    from app.rag import faiss_engine
+
+    try:
+        model = faiss_engine.load_embedding_model() if os.path.exists(path) else None
+    except ImportError as e:
+        print(f"Embedding model unavailable: {e}")
+        model = None
+    if model is not None:
+        questions = load_questions(path)
+        encoded = faiss_engine.encode_queries(questions)
+        if encoded.shape[1] == vectors.shape[1]:
+            return encoded, f"{len(questions)} held-out questions from {path}"
+        print(f"Warning: the embedding model's dimension ({encoded.shape[1]}) differs from the index's ({vectors.shape[1]})")
+
+    print("Warning: no held-out queries; reusing stored vectors, which overstates recall")
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(vectors), size=min(fallback, len(vectors)), replace=False)]
+    return sample, f"{len(sample)} stored vectors as self-queries"
+
+
+def evaluate(index, exact_index, queries: np.ndarray, k: int = 4) -> dict:
+    """recall@k of index against exact_index, plus single-query latency percentiles in ms."""
+    _, exact_ids = exact_index.search(queries, k)
+
+    latencies = []
+    approx_ids = np.empty_like(exact_ids)
+    for row in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[row:row + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        approx_ids[row] = ids[0]
+
+    recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(approx_ids.tolist(), exact_ids.tolist())])
+    return {
+        "recall": float(recall),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main(argv=None):
+    from app.rag import faiss_engine
+
+    parser = argparse.ArgumentParser(description="Build the local FAISS index and report recall/latency.")
+    parser.add_argument("--type", default=faiss_engine.FAISS_INDEX_TYPE, choices=INDEX_TYPES + ("all",))
+    parser.add_argument("--source", default=faiss_engine.FLAT_INDEX_FILE_PATH,
+                        help="Exact flat index holding the verse vectors (created from --output on first run)")
+    parser.add_argument("--output", default=faiss_engine.INDEX_FILE_PATH)
+    parser.add_argument("--metric", default=faiss_engine.FAISS_METRIC, choices=("l2", "ip"))
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="Held-out questions to embed as queries")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Stored vectors reused as queries when the questions can't be embedded")
+    parser.add_argument("--no-write", action="store_true")
+    args = parser.parse_args(argv)
+
+    import faiss
+
+    # Keep an exact copy of the vectors so approximate indexes can always be rebuilt and checked
+    if not os.path.exists(args.source):
+        print(f"Saving exact vectors from {args.output} to {args.source}...")
+        faiss.write_index(faiss.read_index(args.output), args.source)
+    vectors = load_vectors(args.source)
+    print(f"Loaded {vectors.shape[0]} vectors of dimension {vectors.shape[1]} from {args.source}")
+
+    exact = create_index(vectors, "flat", args.metric)
+    sample, description = query_vectors(args.questions, vectors, args.queries)
+    print(f"Queries: {description}")
+
+    types = INDEX_TYPES if args.type == "all" else (args.type,)
+    print(f"\n{'type':<10} {'build_s':>8} {'recall@' + str(args.k):>10} {'p50_ms':>8} {'p99_ms':>8}")
+    built = None
+    for index_type in types:
+        start = time.perf_counter()
+        index = create_index(vectors, index_type, args.metric)
+        build_s = time.perf_counter() - start
+        report = evaluate(index, exact, sample, args.k)
+        print(f"{index_type:<10} {build_s:>8.3f} {report['recall']:>10.3f} {report['p50_ms']:>8.3f} {report['p99_ms']:>8.3f}")
+        built = index
+
+    if args.type != "all" and not args.no_write:
+        faiss.write_index(built, args.output)
+        print(f"\nWrote {args.type} index to {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,159 @@
+"""
+Optional pool of inference processes that hold the embedding model and FAISS index, so
+CPU-bound encoding runs outside the web process's GIL. Enabled with INFERENCE_WORKERS > 0.
+
+Queries and ranked results travel over the pool's pipes; query vectors go through a
+shared-memory buffer allocated per call (n x dim float32), not through pickle.
+faiss_engine routes search_gita, search_gita_batch, encode_and_search_batch and embed_query
+here once the pool is started (by warm-up), so the batcher and callers are unchanged.
+"""
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app.rag.telemetry import span
+
+# Configuration (override via environment)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))    # 0 = encode in the web process
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "1"))    # torch/FAISS threads per inference process
+
+
+# --- Inference process side -----------------------------------------------------------------
+
+def _init_worker(threads: int):
+    from app.rag import faiss_engine
+
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    faiss_engine.load_embedding_model()
+    if not faiss_engine.load_index():
+        faiss_engine.initialize_faiss()
+
+
+def _dimension() -> int:
+    from app.rag import faiss_engine
+    return int(faiss_engine.faiss_index.d)
+
+
+def _job(op: str, queries: list, top_k: int, min_score, shm_name: str):
+    """Runs one encode / search / encode+search batch; vectors are read from or written to shm_name."""
+    from app.rag import faiss_engine
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    vectors = np.ndarray((len(queries), faiss_engine.faiss_index.d), dtype='float32', buffer=shm.buf)
+    try:
+        if op == "search":
+            return [faiss_engine.search_gita(q, top_k, query_vector=vectors[i], min_score=min_score)
+                    for i, q in enumerate(queries)], True
+        if op == "encode":
+            vectors[:] = faiss_engine.encode_queries(queries)
+            return None, True
+        encoded, results = faiss_engine.encode_and_search_batch(queries, top_k, min_score)
+        if encoded is None:  # Model unavailable: same shape of answer as in-process
+            return results, False
+        vectors[:] = encoded
+        return results, True
+    finally:
+        del vectors  # Release the buffer export before closing the mapping
+        shm.close()
+
+
+# --- Web process side -----------------------------------------------------------------------
+
+class InferencePool:
+    """ProcessPoolExecutor of inference processes (spawned, so nothing is inherited from a forked server)."""
+    def __init__(self, workers: int = INFERENCE_WORKERS, threads: int = INFERENCE_THREADS):
+        self.workers = workers
+        self.threads = threads
+        self.dim = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.jobs = 0
+        self.queries = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    @property
+    def active(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        """Spawns every inference process and waits until each has loaded the model and index."""
+        with self._lock:
+            if self._executor is not None or not self.enabled:
+                return self
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=_init_worker, initargs=(self.threads,))
+            # One concurrent job per slot makes the executor spawn (and initialize) all of them now
+            dims = [f.result() for f in [executor.submit(_dimension) for _ in range(self.workers)]]
+            self.dim = dims[0]
+            self._executor = executor
+            print(f"Started {self.workers} inference processes (dim {self.dim})")
+            return self
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def _run(self, op: str, queries: list, top_k: int = 0, min_score: float = None, vectors=None):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(queries) * self.dim * 4))
+        buffer = np.ndarray((len(queries), self.dim), dtype='float32', buffer=shm.buf)
+        started = time.perf_counter()
+        try:
+            if vectors is not None:
+                buffer[:] = np.asarray(vectors, dtype='float32').reshape(len(queries), self.dim)
+            with span("inference_pool"):
+                results, has_vectors = self._executor.submit(_job, op, list(queries), top_k, min_score, shm.name).result()
+            return (buffer.copy() if has_vectors else None), results
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.jobs += 1
+            self.queries += len(queries)
+            self.total_time += time.perf_counter() - started
+            del buffer  # Release the buffer export before closing the mapping
+            shm.close()
+            shm.unlink()
+
+    def encode(self, queries: list) -> np.ndarray:
+        """(n, dim) float32 unit vectors."""
+        return self._run("encode", queries)[0]
+
+    def search(self, queries: list, vectors, top_k: int = 3, min_score: float = None) -> list:
+        """One result list per query for vectors the caller already has."""
+        return self._run("search", queries, top_k, min_score, vectors)[1]
+
+    def encode_and_search(self, queries: list, top_k: int = 3, min_score: float = None):
+        """Same return value as faiss_engine.encode_and_search_batch: ((n, dim) vectors, per-query results)."""
+        return self._run("encode_and_search", queries, top_k, min_score)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "active": self.active,
+            "workers": self.workers,
+            "threads_per_worker": self.threads,
+            "jobs": self.jobs,
+            "queries": self.queries,
+            "errors": self.errors,
+            "avg_job_time_ms": round(self.total_time / self.jobs * 1000, 3) if self.jobs else 0.0,
+        }
+
+
+inference_pool = InferencePool()
@@ -0,0 +1,220 @@
+"""
+Lexical retrieval over verse metadata: a BM25 inverted index (stored next to gita_faiss.index)
+and an exact "Chapter X, Verse Y" / "BG 2.47" reference lookup that needs no embedding.
+
+The indexed text is the Devanagari verse, its romanization and the English translation, so
+queries such as "sthitaprajna" or "karmanye vadhikaraste" match without diacritics.
+
+    python -m app.rag.lexical   # (re)build app/data/gita_bm25.pkl from the verse metadata
+"""
+import os
+import re
+import math
+import bisect
+import pickle
+import unicodedata
+from collections import Counter, defaultdict
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Query terms this long also match indexed words they start ("sthitaprajna" -> "sthitaprajnasya")
+PREFIX_MIN_LENGTH = 5
+PREFIX_MAX_TERMS = 8
+
+# Devanagari vowel signs and viramas are combining marks, so \w alone would split words apart
+_TOKEN_RE = re.compile(r"[\w\u0900-\u097F]+")
+# Common spelling variants of transliterated Sanskrit ("nishkama" / "niṣkāma" / "niskama")
+_TRANSLIT_FOLDS = (("sh", "s"), ("aa", "a"), ("ee", "i"), ("oo", "u"), ("w", "v"))
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has he in is it its of on or that the to was were will with "
+    "what who how why which this these those i you your me my we our they their his her do does".split()
+)
+
+_VERSE_REF_RES = (
+    re.compile(r"chapter\s*(\d{1,2})\s*[,:.\s]\s*(?:verse|shloka|sloka|v\.?)?\s*(\d{1,3})", re.I),
+    re.compile(r"\b(?:ch\.?|bg|gita)\s*(\d{1,2})\s*[.:,\s]\s*(?:v\.?\s*)?(\d{1,3})\b", re.I),
+)
+# A bare "2.47" is also a score or a time ("3.5 in exams", "5:30 am"): only a reference when the
+# query mentions the Gita or a verse, or is nothing but the reference
+_BARE_REF_RE = re.compile(r"(?<![\d.])(\d{1,2})\s*[.:]\s*(\d{1,3})(?![\d.])")
+_REF_CUE_RE = re.compile(r"\b(?:gita|geeta|bg|chapter|verse|shloka|sloka)s?\b", re.I)
+_REF_FILLER_RE = re.compile(r"\b(?:bhagavad|bhagwad|gita|geeta|bg|ch|chapter|verse|shloka|sloka|v)\b|[\W_]", re.I)
+_VERSE_NUMBER_RE = re.compile(r"[|\u0964\u0965]+\s*[\d\u0966-\u096f.]+\s*[|\u0964\u0965]+")  # "|| 54||" in the sanskrit
+_META_REF_RE = re.compile(r"Chapter\s+(\d+),\s*Verse\s+(\d+)(?:\s*-\s*(\d+))?")
+
+# Devanagari -> plain Latin, spelled the way the queries are typed (no diacritics, "sh" for both sibilants)
+_DEVA_VOWELS = dict(zip("अआइईउऊऋॠऌएऐओऔ", "a a i i u u ri ri li e ai o au".split()))
+_DEVA_SIGNS = dict(zip("ािीुूृॄॢेैोौ", "a i i u u ri ri li e ai o au".split()))
+_DEVA_CONSONANTS = dict(zip(
+    "कखगघङचछजझञटठडढणतथदधनपफबभमयरलळवशषसह",
+    "k kh g gh n ch chh j jh n t th d dh n t th d dh n p ph b bh m y r l l v sh sh s h".split(),
+))
+_DEVA_VIRAMA, _DEVA_ANUSVARA, _DEVA_VISARGA = "\u094d", "\u0902", "\u0903"
+
+
+def _fold(token: str) -> str:
+    stripped = "".join(c for c in unicodedata.normalize("NFKD", token) if not unicodedata.combining(c))
+    if not stripped.isascii():
+        return token  # Devanagari: keep as is
+    for src, dst in _TRANSLIT_FOLDS:
+        stripped = stripped.replace(src, dst)
+    return stripped
+
+
+def romanize(text: str) -> str:
+    """Plain-Latin rendering of Devanagari text ("स्थितप्रज्ञस्य" -> "sthitaprajnasya"); other characters pass through."""
+    out = []
+    pending_a = False  # a consonant's inherent vowel, dropped before a vowel sign or virama
+    for i, char in enumerate(text):
+        if char in _DEVA_SIGNS or char == _DEVA_VIRAMA:
+            out.append(_DEVA_SIGNS.get(char, ""))
+            pending_a = False
+            continue
+        if pending_a and char != "\u093c":  # nukta
+            out.append("a")
+            pending_a = False
+        if char in _DEVA_CONSONANTS:
+            out.append(_DEVA_CONSONANTS[char])
+            pending_a = True
+        elif char in _DEVA_VOWELS:
+            out.append(_DEVA_VOWELS[char])
+        elif char == _DEVA_ANUSVARA or char == "\u0901":
+            # Spelled "m" before labials and at word ends ("karmani" but "sangam"), otherwise "n"
+            following = _DEVA_CONSONANTS.get(text[i + 1], "") if i + 1 < len(text) else ""
+            out.append("m" if not following or following[0] in "pbm" else "n")
+        elif char == _DEVA_VISARGA:
+            out.append("h")
+        elif char in "\u093d\u093c":  # avagraha, nukta
+            continue
+        else:
+            out.append(" " if char in "\u0964\u0965" else char)  # dandas end words
+    if pending_a:
+        out.append("a")
+    return "".join(out)
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for raw in _TOKEN_RE.findall(text.lower()):
+        token = _fold(raw)
+        if token and token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def parse_verse_refs(query: str) -> list:
+    """(chapter, verse) pairs referenced in the query, e.g. 'Chapter 2, Verse 47', 'BG 2.47' or just '2.47'."""
+    patterns = _VERSE_REF_RES
+    if _REF_CUE_RE.search(query) or is_reference_only(query):
+        patterns += (_BARE_REF_RE,)
+    refs = []
+    for pattern in patterns:
+        for chapter, verse in pattern.findall(query):
+            ref = (int(chapter), int(verse))
+            if 1 <= ref[0] <= 18 and ref not in refs:
+                refs.append(ref)
+        if refs:
+            break
+    return refs
+
+
+def is_reference_only(query: str) -> bool:
+    """True when the query is nothing but verse references ("2.47", "BG 18.66", "Chapter 2, Verse 47")."""
+    rest = _BARE_REF_RE.sub(" ", query)
+    for pattern in _VERSE_REF_RES:
+        rest = pattern.sub(" ", rest)
+    return rest != query and not _REF_FILLER_RE.sub("", rest)
+
+
+class LexicalIndex:
+    """BM25 postings over the sanskrit, transliteration and translation fields, plus a verse-reference map."""
+    def __init__(self, postings: dict, doc_lengths: list, verse_map: dict):
+        self.postings = postings          # term -> list of (doc id, term frequency)
+        self.doc_lengths = doc_lengths
+        self.verse_map = verse_map        # (chapter, verse) -> [doc ids]
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        self._vocabulary = sorted(postings)
+
+    @classmethod
+    def build(cls, metadata) -> "LexicalIndex":
+        postings = defaultdict(list)
+        doc_lengths = []
+        verse_map = defaultdict(list)
+        for doc_id, meta in enumerate(metadata):
+            # The "Chapter X, Verse Y" reference is left out: its words and numbers match almost any query.
+            # Metadata built before the transliteration column existed gets a romanization of the Devanagari.
+            sanskrit = _VERSE_NUMBER_RE.sub(" ", meta.get('sanskrit', ''))
+            transliteration = meta.get('transliteration') or romanize(sanskrit)
+            text = f"{sanskrit} {transliteration} {meta.get('translation', '')}"
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+
+            match = _META_REF_RE.search(meta.get('chapter', ''))
+            if match:
+                chapter, first, last = int(match.group(1)), int(match.group(2)), int(match.group(3) or match.group(2))
+                for verse in range(first, last + 1):
+                    verse_map[(chapter, verse)].append(doc_id)
+        return cls(dict(postings), doc_lengths, dict(verse_map))
+
+    def search(self, query: str, top_k: int = 4) -> list:
+        """[(doc id, bm25 score)] best first."""
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            # A document counts once per query term, with its best-scoring form of that term
+            term_scores = {}
+            for indexed in self._expand(term):
+                docs = self.postings[indexed]
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_doc_length)
+                    term_scores[doc_id] = max(term_scores.get(doc_id, 0.0), idf * tf * (BM25_K1 + 1) / (tf + norm))
+            for doc_id, score in term_scores.items():
+                scores[doc_id] += score
+        return sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+
+    def _expand(self, term: str) -> list:
+        """Indexed terms a query term matches: itself, plus words it is a prefix of if it is long enough."""
+        if len(term) < PREFIX_MIN_LENGTH:
+            return [term] if term in self.postings else []
+        start = bisect.bisect_left(self._vocabulary, term)
+        matches = []
+        for indexed in self._vocabulary[start:start + PREFIX_MAX_TERMS]:
+            if not indexed.startswith(term):
+                break
+            matches.append(indexed)
+        return matches
+
+    def lookup(self, query: str) -> list:
+        """Doc ids for explicit verse references in the query (empty if there are none)."""
+        doc_ids = []
+        for ref in parse_verse_refs(query):
+            for doc_id in self.verse_map.get(ref, []):
+                if doc_id not in doc_ids:
+                    doc_ids.append(doc_id)
+        return doc_ids
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({"postings": self.postings, "doc_lengths": self.doc_lengths, "verse_map": self.verse_map}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        return cls(data["postings"], data["doc_lengths"], data["verse_map"])
+
+
+if __name__ == "__main__":
+    from app.rag import faiss_engine
+    metadata = faiss_engine.load_metadata()
+    index = LexicalIndex.build(metadata)
+    index.save(faiss_engine.BM25_FILE_PATH)
+    print(f"Built BM25 index over {len(index.doc_lengths)} verses ({len(index.postings)} terms) "
+          f"and {len(index.verse_map)} verse references -> {faiss_engine.BM25_FILE_PATH}")
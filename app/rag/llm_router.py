@@ -0,0 +1,325 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+
+import numpy as np
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from app.rag.rate_limiter import AdaptiveRateLimiter, LLMBusyError, is_quota_error
+
+# Configuration (override via environment). Each list is "primary,fallback,...";
+# names are the ones `python check_models.py` prints, without the "models/" prefix.
+LLM_CHAT_MODELS = [m.strip() for m in os.getenv("LLM_CHAT_MODELS", "gemini-2.0-flash,gemini-2.0-flash-lite").split(",") if m.strip()]
+LLM_DEEP_DIVE_MODELS = [m.strip() for m in os.getenv("LLM_DEEP_DIVE_MODELS", "gemini-2.5-flash,gemini-2.0-flash").split(",") if m.strip()]
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))                 # seconds per attempt (first chunk when streaming)
+LLM_FAILOVER_WAIT = float(os.getenv("LLM_FAILOVER_WAIT", "2"))      # max queueing on a model that has a fallback
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))  # never hedge sooner than this
+# Rough completion size used to reserve tokens/min before the real usage is known
+LLM_COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "600"))
+
+_FAILOVER_MARKERS = ("timeout", "timed out", "deadline", "503", "unavailable", "overloaded")
+
+
+def is_failover_error(e: Exception) -> bool:
+    """Errors worth retrying on another model: quota, timeouts and an unavailable backend."""
+    if isinstance(e, (LLMBusyError, asyncio.TimeoutError, TimeoutError)):
+        return True
+    error_str = str(e).lower()
+    return is_quota_error(e) or any(marker in error_str for marker in _FAILOVER_MARKERS)
+
+
+def estimate_tokens(messages) -> int:
+    from app.rag.context import message_tokens
+    return message_tokens(messages) + LLM_COMPLETION_ESTIMATE
+
+
+def reported_tokens(response) -> int:
+    usage = getattr(response, "usage_metadata", None) or {}
+    return usage.get("total_tokens") or 0
+
+
+class ModelStats:
+    """Per-model counters plus a window of recent call latencies (seconds) for the hedge threshold."""
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def percentile(self, q: float):
+        if not self.latencies:
+            return None
+        return float(np.percentile(list(self.latencies), q))
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class LLMRouter:
+    """
+    Picks a Gemini model per request (a light one for chat, a stronger one for deep dive) and
+    fails over down the tier's list on quota, timeout or unavailability errors. Every model has
+    its own adaptive rate limiter, since Gemini quotas are per model.
+
+    With LLM_HEDGE on, a non-streaming call that outlives the primary's p95 latency is duplicated
+    on the fallback model (if it has spare quota) and whichever answers first wins.
+    """
+    def __init__(self, chat_models: list = LLM_CHAT_MODELS, deep_dive_models: list = LLM_DEEP_DIVE_MODELS,
+                 hedge: bool = LLM_HEDGE):
+        self.tiers = {"chat": list(chat_models), "deep_dive": list(deep_dive_models)}
+        self.hedge = hedge
+        self.clients = {}
+        self.limiters = {}
+        self.stats_by_model = {}
+        self._lock = threading.Lock()
+        for model in self.models():
+            self.limiters[model] = AdaptiveRateLimiter()
+            self.stats_by_model[model] = ModelStats()
+
+    def models(self) -> list:
+        seen = []
+        for models in self.tiers.values():
+            seen.extend(m for m in models if m not in seen)
+        return seen
+
+    def configure(self, google_api_key: str):
+        """(Re)creates the clients; limiters and latency stats survive re-initialisation."""
+        clients = {}
+        for model in self.models():
+            # Client-side retries would hide 429s from the limiter and delay failover
+            clients[model] = ChatGoogleGenerativeAI(model=model, temperature=LLM_TEMPERATURE,
+                                                    google_api_key=google_api_key, timeout=LLM_TIMEOUT, max_retries=0)
+        self.clients = clients
+
+    def scale_limits(self, share: float):
+        """Gives this process `share` of every model's quota (see serve.py, which runs several workers)."""
+        for limiter in self.limiters.values():
+            limiter.scale(share)
+
+    def __bool__(self):
+        return bool(self.clients)
+
+    def chain(self, deep_dive: bool = False) -> list:
+        return self.tiers["deep_dive" if deep_dive else "chat"]
+
+    def _max_wait(self, position: int, models: list):
+        # Don't queue long on a model when there is another one to try
+        return LLM_FAILOVER_WAIT if position < len(models) - 1 else None
+
+    def _record(self, model: str, latency: float = None, error: bool = False):
+        with self._lock:
+            stats = self.stats_by_model[model]
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            if latency is not None:
+                stats.latencies.append(latency)
+
+    def _failover(self, model: str, e: Exception, last: bool):
+        if last:
+            return
+        with self._lock:
+            self.stats_by_model[model].failovers += 1
+        print(f"LLM {model} failed ({type(e).__name__}: {str(e)[:120]}), failing over")
+
+    @staticmethod
+    def _exhausted(errors: list):
+        # Every model was out of quota: report "busy" rather than a raw provider error
+        if errors and all(isinstance(e, LLMBusyError) or is_quota_error(e) for e in errors):
+            retry_after = min((e.retry_after for e in errors if isinstance(e, LLMBusyError)), default=60.0)
+            return LLMBusyError(retry_after=retry_after)
+        return errors[-1]
+
+    def invoke(self, messages, deep_dive: bool = False):
+        """Blocking call with failover (no hedging: that needs the event loop)."""
+        models = self.chain(deep_dive)
+        estimate = estimate_tokens(messages)
+        errors = []
+        for position, model in enumerate(models):
+            try:
+                return self._call(model, messages, estimate, self._max_wait(position, models))
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                errors.append(e)
+                self._failover(model, e, position == len(models) - 1)
+        raise self._exhausted(errors)
+
+    def _call(self, model: str, messages, estimate: int, max_wait):
+        limiter = self.limiters[model]
+        limiter.acquire_sync(estimate, max_wait=max_wait)
+        response, quota_hit = None, False
+        start = time.perf_counter()
+        try:
+            response = self.clients[model].invoke(messages)
+            self._record(model, time.perf_counter() - start)
+            return response
+        except Exception as e:
+            quota_hit = is_quota_error(e)
+            self._record(model, error=True)
+            raise
+        finally:
+            limiter.release(throttled=quota_hit, estimated_tokens=estimate, actual_tokens=reported_tokens(response))
+
+    async def ainvoke(self, messages, deep_dive: bool = False):
+        models = self.chain(deep_dive)
+        estimate = estimate_tokens(messages)
+        errors = []
+        position = 0
+        while position < len(models):
+            model = models[position]
+            hedge_model = models[position + 1] if self.hedge and position + 1 < len(models) else None
+            try:
+                if hedge_model:
+                    return await self._ahedged(model, hedge_model, messages, estimate)
+                return await self._acall(model, messages, estimate, self._max_wait(position, models))
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                errors.append(e)
+                # A failed hedge already tried the fallback too
+                position += 2 if hedge_model else 1
+                self._failover(model, e, position >= len(models))
+        raise self._exhausted(errors)
+
+    async def _acall(self, model: str, messages, estimate: int, max_wait):
+        limiter = self.limiters[model]
+        await limiter.acquire(estimate, max_wait=max_wait)
+        response, quota_hit = None, False
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self.clients[model].ainvoke(messages), LLM_TIMEOUT)
+            self._record(model, time.perf_counter() - start)
+            return response
+        except Exception as e:
+            quota_hit = is_quota_error(e)
+            self._record(model, error=True)
+            raise
+        finally:
+            limiter.release(throttled=quota_hit, estimated_tokens=estimate, actual_tokens=reported_tokens(response))
+
+    def _hedge_delay(self, model: str):
+        stats = self.stats_by_model[model]
+        if len(stats.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(stats.percentile(95), LLM_HEDGE_MIN_DELAY)
+
+    async def _ahedged(self, model: str, hedge_model: str, messages, estimate: int):
+        primary = asyncio.ensure_future(self._acall(model, messages, estimate, LLM_FAILOVER_WAIT))
+        delay = self._hedge_delay(model)
+        if delay is None:
+            # Not enough samples for a p95 yet: plain failover to the hedge model
+            try:
+                return await primary
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                self._failover(model, e, False)
+                return await self._acall(hedge_model, messages, estimate, None)
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            try:
+                return primary.result()
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                self._failover(model, e, False)
+                return await self._acall(hedge_model, messages, estimate, None)
+
+        # Primary is slower than its p95: race a duplicate on the fallback, but only with spare quota
+        secondary = asyncio.ensure_future(self._acall(hedge_model, messages, estimate, 0))
+        with self._lock:
+            self.stats_by_model[model].hedges += 1
+        pending = {primary, secondary}
+        first_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            with self._lock:
+                                self.stats_by_model[model].hedge_wins += 1
+                        return task.result()
+                    if not (task is secondary and isinstance(task.exception(), LLMBusyError)):
+                        first_error = first_error or task.exception()
+            # A hedge that could not get a slot is not a real failure of the request
+            raise first_error or secondary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(self, messages, deep_dive: bool = False):
+        """
+        Yields message chunks from the first model in the tier that starts answering.
+        Failover only happens before the first chunk; later errors propagate to the caller.
+        """
+        models = self.chain(deep_dive)
+        estimate = estimate_tokens(messages)
+        errors = []
+        for position, model in enumerate(models):
+            last = position == len(models) - 1
+            limiter = self.limiters[model]
+            try:
+                await limiter.acquire(estimate, max_wait=self._max_wait(position, models))
+            except LLMBusyError as e:
+                errors.append(e)
+                self._failover(model, e, last)
+                continue
+
+            usage_chunk, quota_hit, started = None, False, False
+            chunks = self.clients[model].astream(messages).__aiter__()
+            try:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), LLM_TIMEOUT)
+                except StopAsyncIteration:
+                    return
+                started = True
+                while True:
+                    if getattr(chunk, "usage_metadata", None):
+                        usage_chunk = chunk
+                    yield chunk
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        # Stream durations are not comparable to invoke latencies, so no hedge sample
+                        self._record(model)
+                        return
+            except Exception as e:
+                quota_hit = is_quota_error(e)
+                self._record(model, error=True)
+                if started or not is_failover_error(e):
+                    raise
+                errors.append(e)
+                self._failover(model, e, last)
+            finally:
+                # Also runs if the client disconnects mid-stream, so the slot is never leaked
+                limiter.release(throttled=quota_hit, estimated_tokens=estimate,
+                                actual_tokens=reported_tokens(usage_chunk))
+        raise self._exhausted(errors)
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {model: {**stats.snapshot(), "limiter": self.limiters[model].stats()}
+                      for model, stats in self.stats_by_model.items()}
+        return {"tiers": self.tiers, "hedging": self.hedge, "models": models}
+
+
+llm_router = LLMRouter()
@@ -0,0 +1,212 @@
+"""
+ONNX Runtime backend for the local embedding model: an int8 dynamically-quantized export of
+all-MiniLM-L6-v2 that needs only onnxruntime + tokenizers at serving time (no PyTorch).
+Selected with EMBEDDING_BACKEND=onnx (see faiss_engine.load_embedding_model); the packages
+are in requirements-onnx.txt, and the Dockerfile runs both commands below for that backend.
+
+    python -m app.rag.onnx_encoder export    # needs torch + transformers + onnx; writes app/data/onnx/
+    python -m app.rag.onnx_encoder parity    # same verses as the PyTorch model? + load/encode timings
+
+The exported model outputs token embeddings; mean pooling over the attention mask and L2
+normalization reproduce the sentence-transformers pipeline, so vectors stay compatible
+with the existing gita_faiss.index.
+"""
+import os
+import sys
+import time
+import inspect
+import argparse
+
+import numpy as np
+
+# Configuration (override via environment)
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "app/data/onnx/all-MiniLM-L6-v2")
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "model_int8.onnx")  # model.onnx = unquantized fp32
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))                  # 0 = onnxruntime default
+ONNX_MAX_LENGTH = 256  # max_seq_length of all-MiniLM-L6-v2
+
+
+class OnnxEncoder:
+    """Drop-in for SentenceTransformer.encode(): returns an (n, dim) float32 array of unit vectors."""
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, model_file: str = ONNX_MODEL_FILE,
+                 threads: int = ONNX_THREADS, max_length: int = ONNX_MAX_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.path = os.path.join(model_dir, model_file)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real tokens, as the sentence-transformers Pooling layer does
+            weights = mask[..., None].astype('float32')
+            pooled = (token_embeddings * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            batches.append(pooled)
+        if not batches:
+            return np.zeros((0, self.dim), dtype='float32')
+
+        vectors = np.vstack(batches).astype('float32')
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+
+def export(model_name: str, output_dir: str, opset: int = 14, quantize: bool = True):
+    """Exports the Hugging Face model behind a sentence-transformers name to ONNX (+ an int8 copy)."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    model = AutoModel.from_pretrained(repo).eval()
+
+    sample = tokenizer(["Chapter 2, Verse 47: You have a right to perform your duty"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class TokenEmbeddings(torch.nn.Module):
+        # Keyword arguments keep the export independent of the model's forward() argument order
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    # Newer torch defaults to the dynamo exporter; the TorchScript one understands dynamic_axes
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(), tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=opset, **legacy,
+        )
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, "tokenizer.json"))
+    print(f"Exported {repo} to {fp32_path} ({os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, "model_int8.onnx")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized to {int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB)")
+
+
+def load_queries(path: str) -> list:
+    """Queries from a benchmarks/queries.txt-style file (comments skipped, mode prefixes dropped)."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                queries.append(line.split(":", 1)[1].strip() if line.startswith("deep_dive:") else line)
+    return queries
+
+
+def _timed_encode(encoder, queries: list) -> tuple:
+    """(n, dim) unit vectors encoded one query at a time, plus the per-query latencies in ms."""
+    vectors, latencies = [], []
+    encoder.encode(queries[:1])  # First call pays for lazy initialisation
+    for query in queries:
+        start = time.perf_counter()
+        vector = np.asarray(encoder.encode([query]), dtype='float32')
+        latencies.append((time.perf_counter() - start) * 1000)
+        vectors.append(vector[0] / max(float(np.linalg.norm(vector[0])), 1e-12))
+    return np.vstack(vectors), latencies
+
+
+def parity(args) -> int:
+    """Compares the ONNX backend with the PyTorch model on load time, encode latency and FAISS top-k."""
+    from app.rag import faiss_engine
+
+    if not faiss_engine.load_index():
+        raise SystemExit(f"No FAISS index at {faiss_engine.INDEX_FILE_PATH}")
+    queries = load_queries(args.queries)
+
+    start = time.perf_counter()
+    from sentence_transformers import SentenceTransformer
+    reference = SentenceTransformer(faiss_engine.EMBEDDING_MODEL_NAME)
+    torch_load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate = OnnxEncoder(args.model_dir, args.model_file)
+    onnx_load_s = time.perf_counter() - start
+
+    ref_vectors, ref_ms = _timed_encode(reference, queries)
+    onnx_vectors, onnx_ms = _timed_encode(candidate, queries)
+
+    k = args.k
+    _, ref_ids = faiss_engine.faiss_index.search(ref_vectors, k)
+    _, onnx_ids = faiss_engine.faiss_index.search(onnx_vectors, k)
+    overlap = np.array([len(set(a) & set(b)) / k for a, b in zip(ref_ids.tolist(), onnx_ids.tolist())])
+    top1 = float(np.mean(ref_ids[:, 0] == onnx_ids[:, 0]))
+    cosine = np.sum(ref_vectors * onnx_vectors, axis=1)
+
+    print(f"{len(queries)} queries, model {candidate.path}")
+    print(f"\n{'backend':<10}{'load s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, load_s, latencies in (("torch", torch_load_s, ref_ms), ("onnx", onnx_load_s, onnx_ms)):
+        print(f"{name:<10}{load_s:>9.2f}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 99):>9.2f}")
+    print(f"\ncosine(torch, onnx): mean {cosine.mean():.4f}, min {cosine.min():.4f}")
+    print(f"top-{k} overlap with torch: mean {overlap.mean():.3f}, min {overlap.min():.3f}; top-1 agreement {top1:.3f}")
+
+    if overlap.mean() < args.min_overlap:
+        print(f"FAIL: mean top-{k} overlap below {args.min_overlap}")
+        for query, score in zip(queries, overlap):
+            if score < 1.0:
+                print(f"  {score:.2f}  {query[:90]}")
+        return 1
+    print("OK")
+    return 0
+
+
+def main(argv=None):
+    from app.rag.faiss_engine import EMBEDDING_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Export and check the ONNX embedding backend.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Export the model to ONNX and quantize it to int8")
+    export_parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    export_parser.add_argument("--output", default=ONNX_MODEL_DIR)
+    export_parser.add_argument("--opset", type=int, default=14)
+    export_parser.add_argument("--no-quantize", action="store_true")
+
+    parity_parser = commands.add_parser("parity", help="Compare ONNX and PyTorch vectors on the FAISS index")
+    parity_parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parity_parser.add_argument("--model-file", default=ONNX_MODEL_FILE)
+    parity_parser.add_argument("--queries", default="benchmarks/queries.txt")
+    parity_parser.add_argument("--k", type=int, default=4)
+    parity_parser.add_argument("--min-overlap", type=float, default=0.9,
+                               help="Fail if the mean top-k overlap with PyTorch is below this")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export(args.model, args.output, args.opset, quantize=not args.no_quantize)
+        return 0
+    return parity(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,188 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+
+# Configuration (override via environment). LLM_RPM/LLM_TPM are the Gemini quota of your tier, per model;
+# 0 (the default) means no cap, and the rate is only lowered once the provider returns a 429.
+LLM_RPM = float(os.getenv("LLM_RPM", "0")) or math.inf
+LLM_TPM = float(os.getenv("LLM_TPM", "0")) or math.inf
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))            # waiting callers beyond this are shed
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "20"))  # seconds a caller may wait for a slot
+LLM_MIN_RPM = 1.0
+
+BUSY_MESSAGE = "Many seekers are asking right now. Please try again in a minute."
+
+
+class LLMBusyError(Exception):
+    """Raised when a call is shed because the shared LLM quota is saturated."""
+    def __init__(self, retry_after: float):
+        super().__init__(BUSY_MESSAGE)
+        self.retry_after = retry_after
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide token buckets (requests/min and tokens/min) plus a concurrency cap in front
+    of one LLM model. The request rate adapts AIMD-style: it halves and pauses everyone on a
+    429, and creeps back up by ~1 rpm per minute of successful calls. Without a configured
+    requests/min cap the first 429 starts it at half the rate of the past minute.
+    Works for threads (acquire_sync) and the event loop (acquire) alike.
+    """
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_queue: int = LLM_MAX_QUEUE, max_wait: float = LLM_MAX_QUEUE_WAIT):
+        self.max_rpm = rpm
+        self.rpm = rpm          # effective (learned) limit
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        now = time.monotonic()
+        self._request_tokens = min(rpm, max(1.0, rpm / 4))  # allow a small initial burst
+        self._token_tokens = tpm
+        self._last_refill = now
+        self._paused_until = 0.0
+        self._cooldown = 2.0
+        self._recent_grants = deque()  # grant times of the past minute, only tracked while uncapped
+        self._lock = threading.Lock()
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.granted = 0
+        self.throttled = 0
+        self.shed = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if not math.isinf(self.rpm):
+            self._request_tokens = min(max(self.rpm, 1.0), self._request_tokens + elapsed * self.rpm / 60.0)
+        if not math.isinf(self.tpm):
+            self._token_tokens = min(self.tpm, self._token_tokens + elapsed * self.tpm / 60.0)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Grants a slot (returns 0) or returns how long to wait before trying again."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.in_flight >= self.max_concurrency:
+            return 0.05
+        tokens = min(tokens, self.tpm)
+        if self._request_tokens < 1.0:
+            return (1.0 - self._request_tokens) * 60.0 / self.rpm
+        if self._token_tokens < tokens:
+            return (tokens - self._token_tokens) * 60.0 / self.tpm
+        self._request_tokens -= 1.0
+        self._token_tokens -= tokens
+        if math.isinf(self.rpm):
+            self._recent_grants.append(now)
+            while self._recent_grants[0] < now - 60.0:
+                self._recent_grants.popleft()
+        self.in_flight += 1
+        self.granted += 1
+        return 0.0
+
+    def _enter_queue(self):
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                raise LLMBusyError(retry_after=self._retry_after())
+            self.waiting += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _retry_after(self) -> float:
+        return max(1.0, self._paused_until - time.monotonic(), 60.0 / max(self.rpm, LLM_MIN_RPM))
+
+    def _check_deadline(self, deadline: float, wait: float):
+        if time.monotonic() + wait > deadline:
+            with self._lock:
+                self.shed += 1
+            raise LLMBusyError(retry_after=wait)
+
+    def acquire_sync(self, tokens: int, max_wait: float = None):
+        self._enter_queue()
+        try:
+            deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+            while True:
+                with self._lock:
+                    wait = self._try_acquire(tokens)
+                if wait <= 0:
+                    return
+                self._check_deadline(deadline, wait)
+                time.sleep(min(wait, 1.0))
+        finally:
+            self._leave_queue()
+
+    async def acquire(self, tokens: int, max_wait: float = None):
+        self._enter_queue()
+        try:
+            deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+            while True:
+                with self._lock:
+                    wait = self._try_acquire(tokens)
+                if wait <= 0:
+                    return
+                self._check_deadline(deadline, wait)
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            self._leave_queue()
+
+    def release(self, throttled: bool = False, estimated_tokens: int = 0, actual_tokens: int = 0):
+        """Call exactly once per granted slot, reporting whether the provider returned a 429."""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if actual_tokens and estimated_tokens:
+                # Settle the token bucket with what the call really cost
+                self._token_tokens = min(self.tpm, self._token_tokens + estimated_tokens - actual_tokens)
+            if throttled:
+                # Multiplicative decrease + a shared pause, so callers don't retry independently
+                self.throttled += 1
+                if math.isinf(self.rpm):
+                    self.rpm = float(len(self._recent_grants))
+                    self._recent_grants.clear()
+                self.rpm = max(LLM_MIN_RPM, self.rpm / 2)
+                self._request_tokens = 0.0
+                self._paused_until = time.monotonic() + self._cooldown
+                self._cooldown = min(self._cooldown * 2, 60.0)
+                print(f"LLM quota hit: effective limit lowered to {self.rpm:.1f} rpm, pausing {self._paused_until - time.monotonic():.1f}s")
+            else:
+                # Additive increase: about +1 rpm per minute's worth of successful calls
+                self.rpm = min(self.max_rpm, self.rpm + 1.0 / max(self.rpm, 1.0))
+                self._cooldown = 2.0
+
+    def scale(self, share: float):
+        """Shrinks the limits to one process's share of a quota split across several worker processes."""
+        with self._lock:
+            self.max_rpm = max(LLM_MIN_RPM, self.max_rpm * share)
+            self.rpm = min(self.rpm, self.max_rpm)
+            self.tpm = self.tpm * share
+            self.max_concurrency = max(1, math.ceil(self.max_concurrency * share))
+            self._request_tokens = min(self._request_tokens, max(1.0, self.max_rpm / 4))
+            self._token_tokens = min(self._token_tokens, self.tpm)
+
+    def stats(self) -> dict:
+        """Limits are None while uncapped."""
+        return {
+            "effective_rpm": None if math.isinf(self.rpm) else round(self.rpm, 2),
+            "max_rpm": None if math.isinf(self.max_rpm) else self.max_rpm,
+            "tpm": None if math.isinf(self.tpm) else self.tpm,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "shed": self.shed,
+        }
+
+
+def is_quota_error(e: Exception) -> bool:
+    error_str = str(e).lower()
+    return "429" in error_str or "quota" in error_str or "resourceexhausted" in error_str
@@ -0,0 +1,91 @@
+import os
+import asyncio
+
+# Configuration (override via environment)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"  # 0 = Pinecone only as a fallback when FAISS is empty
+RETRIEVAL_DEADLINE_MS = float(os.getenv("RETRIEVAL_DEADLINE_MS", "1500"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+MAX_SOURCES = int(os.getenv("RETRIEVAL_MAX_SOURCES", "6"))
+
+
+def _dedupe_keys(source: dict):
+    text_key = " ".join(str(source.get("core_idea", "")).lower().split())[:200]
+    return (source.get("source"), source.get("reference")), text_key
+
+
+def fuse_rrf(ranked_lists: list, limit: int = MAX_SOURCES, k: int = RRF_K) -> list:
+    """
+    Reciprocal-rank fusion: each source scores sum(1 / (k + rank)) over the lists it appears in.
+    Duplicates (same reference, or same text) are merged into their first occurrence.
+    """
+    scores = {}
+    order = []
+    seen_refs, seen_texts = {}, {}
+    for ranked in ranked_lists:
+        for rank, source in enumerate(ranked, start=1):
+            ref_key, text_key = _dedupe_keys(source)
+            slot = seen_refs.get(ref_key, seen_texts.get(text_key))
+            if slot is None:
+                slot = len(order)
+                order.append(source)
+                scores[slot] = 0.0
+            seen_refs.setdefault(ref_key, slot)
+            seen_texts.setdefault(text_key, slot)
+            scores[slot] += 1.0 / (k + rank)
+
+    ranked_slots = sorted(scores, key=lambda slot: (-scores[slot], slot))
+    return [order[slot] for slot in ranked_slots[:limit]]
+
+
+class RetrievalJob:
+    """
+    Runs local (FAISS) and remote (Pinecone) retrieval for one query concurrently under a
+    single deadline. local() returns as soon as the local search is done, so callers can
+    check the answer cache (and cancel()) before waiting for the remote side.
+    """
+    def __init__(self, query: str, local_search, remote_search, top_k: int = 4,
+                 deadline_ms: float = RETRIEVAL_DEADLINE_MS, hybrid: bool = HYBRID_RETRIEVAL):
+        self.query = query
+        self.top_k = top_k
+        self.deadline_ms = deadline_ms
+        self.hybrid = hybrid
+        self._loop = asyncio.get_running_loop()
+        self._deadline_at = self._loop.time() + deadline_ms / 1000.0
+        self._remote_search = remote_search
+        self._local_task = asyncio.ensure_future(local_search(query, top_k))
+        self._remote_task = asyncio.ensure_future(remote_search(query, top_k)) if hybrid else None
+
+    def _remaining(self) -> float:
+        return max(0.0, self._deadline_at - self._loop.time())
+
+    async def _await(self, task, timeout: float, label: str, default):
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            print(f"{label} retrieval missed the {self.deadline_ms:.0f}ms deadline; continuing without it.")
+        except Exception as e:
+            print(f"{label} retrieval failed: {e}")
+        return default
+
+    async def local(self):
+        """(query_vector, faiss_results) from the local search, or (None, []) on failure/deadline."""
+        return await self._await(self._local_task, self._remaining(), "FAISS", (None, []))
+
+    async def sources(self, local_sources: list) -> list:
+        """Local sources fused with whatever remote sources arrived before the deadline."""
+        if self._remote_task is None:
+            if local_sources:
+                return local_sources
+            # Sequential fallback mode: only go remote when local retrieval found nothing
+            self._remote_task = asyncio.ensure_future(self._remote_search(self.query, self.top_k))
+            remote_sources = await self._await(self._remote_task, self.deadline_ms / 1000.0, "Pinecone", [])
+        else:
+            remote_sources = await self._await(self._remote_task, self._remaining(), "Pinecone", [])
+
+        self.cancel()
+        return fuse_rrf([local_sources, remote_sources or []])
+
+    def cancel(self):
+        for task in (self._local_task, self._remote_task):
+            if task is not None and not task.done():
+                task.cancel()
@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import numpy as np
+
+# Configuration (override via environment)
+RAG_LOG_PATH = os.getenv("RAG_LOG_PATH", "server_debug_log.jsonl")
+RAG_LOG_MAX_BYTES = int(os.getenv("RAG_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+QUANTILE_WINDOW = int(os.getenv("METRICS_QUANTILE_WINDOW", "1024"))  # recent samples kept per stage/mode
+
+# Prometheus-style bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# The request being served (set by request_trace); spans pick up its mode and add themselves to it
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+class StageHistogram:
+    """Cumulative bucket counts for Prometheus plus a window of recent samples for exact p50/p95/p99."""
+    def __init__(self):
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=QUANTILE_WINDOW)
+
+    def observe(self, seconds: float):
+        self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def quantiles(self) -> dict:
+        if not self.recent:
+            return {q: 0.0 for q in QUANTILES}
+        values = np.percentile(list(self.recent), [q * 100 for q in QUANTILES])
+        return dict(zip(QUANTILES, (float(v) for v in values)))
+
+
+_histograms = {}   # (stage, mode) -> StageHistogram
+_counters = {}     # (name, labels tuple) -> value
+_metrics_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float, mode: str = None):
+    trace = _current_trace.get()
+    mode = mode or (trace["mode"] if trace else "all")
+    with _metrics_lock:
+        histogram = _histograms.get((stage, mode))
+        if histogram is None:
+            histogram = _histograms[(stage, mode)] = StageHistogram()
+        histogram.observe(seconds)
+    if trace is not None:
+        trace["spans"][stage] = round(trace["spans"].get(stage, 0.0) + seconds * 1000, 2)
+
+
+def increment(name: str, amount: float = 1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def span(stage: str):
+    """Times a block as one stage of the current request (mode label from request_trace)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def set_mode(mode: str):
+    """Relabels the current request once its mode (chat / deep_dive) is known."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["mode"] = mode
+
+
+def annotate(**fields):
+    """Adds fields (e.g. cache_hit=True) to the current request's log line."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["fields"].update(fields)
+
+
+@contextmanager
+def request_trace(endpoint: str, mode: str = "unknown", **fields):
+    """
+    Collects the spans of one request. On exit records the "total" stage, counts the request
+    by outcome and writes a single structured log line with every stage's duration.
+    """
+    trace = {"endpoint": endpoint, "mode": mode, "spans": {}, "outcome": "ok", "fields": dict(fields)}
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    except (GeneratorExit, asyncio.CancelledError):
+        trace["outcome"] = "cancelled"  # e.g. the client closed a stream
+        raise
+    except BaseException:
+        trace["outcome"] = "error"
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            _current_trace.set(None)  # Async generator finalised from another context
+        total = time.perf_counter() - start
+        observe("total", total, mode=trace["mode"])
+        increment("rag_requests_total", endpoint=endpoint, mode=trace["mode"], outcome=trace["outcome"])
+        log_event("request", endpoint=endpoint, mode=trace["mode"], outcome=trace["outcome"],
+                  total_ms=round(total * 1000, 2), spans=trace["spans"], **trace["fields"])
+
+
+def stage_summary() -> dict:
+    """{stage: {mode: {count, p50_ms, p95_ms, p99_ms}}} over the recent-sample windows."""
+    with _metrics_lock:
+        items = [(key, h.count, h.quantiles()) for key, h in _histograms.items()]
+    summary = {}
+    for (stage, mode), count, quantiles in sorted(items):
+        summary.setdefault(stage, {})[mode] = {
+            "count": count,
+            **{f"p{int(q * 100)}_ms": round(value * 1000, 3) for q, value in quantiles.items()},
+        }
+    return summary
+
+
+def reset():
+    """Clears every histogram and counter (used between benchmark scenarios)."""
+    with _metrics_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+# --- Structured log -------------------------------------------------------------------------
+# Records go onto an in-memory queue; a background listener thread does the file I/O.
+
+_log_queue = queue.SimpleQueue()
+_logger = logging.getLogger("upnishad.rag")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+_logger.addHandler(QueueHandler(_log_queue))
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            handler = RotatingFileHandler(RAG_LOG_PATH, maxBytes=RAG_LOG_MAX_BYTES, backupCount=3, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _listener = QueueListener(_log_queue, handler)
+            _listener.start()
+
+
+def log_event(event: str, **fields):
+    """Appends one JSON line to RAG_LOG_PATH without blocking the caller."""
+    if _listener is None:
+        _start_listener()
+    _logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, ensure_ascii=False, default=str))
+
+
+# --- Prometheus exposition -------------------------------------------------------------------
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+def _family(lines: list, name: str, kind: str, help_text: str, samples: list):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for suffix, labels, value in samples:
+        lines.append(f"{name}{suffix}{_labels(**labels)} {value}")
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    from app.rag.cache import answer_cache, embedding_cache
+    from app.rag.llm_router import llm_router
+    from app.rag.batcher import search_batcher
+    from app.rag.context import token_usage
+
+    lines = []
+    with _metrics_lock:
+        histograms = {key: (list(h.bucket_counts), h.count, h.total, h.quantiles()) for key, h in _histograms.items()}
+        counters = dict(_counters)
+
+    samples = []
+    for (stage, mode), (bucket_counts, count, total, _) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(list(BUCKETS) + ["+Inf"], bucket_counts):
+            cumulative += bucket_count
+            samples.append(("_bucket", {"stage": stage, "mode": mode, "le": bound}, cumulative))
+        samples.append(("_sum", {"stage": stage, "mode": mode}, round(total, 6)))
+        samples.append(("_count", {"stage": stage, "mode": mode}, count))
+    _family(lines, "rag_stage_duration_seconds", "histogram", "Duration of each request stage.", samples)
+
+    samples = []
+    for (stage, mode), (_, count, total, quantiles) in sorted(histograms.items()):
+        for q, value in quantiles.items():
+            samples.append(("", {"stage": stage, "mode": mode, "quantile": q}, round(value, 6)))
+        samples.append(("_sum", {"stage": stage, "mode": mode}, round(total, 6)))
+        samples.append(("_count", {"stage": stage, "mode": mode}, count))
+    _family(lines, "rag_stage_latency_seconds", "summary",
+            f"p50/p95/p99 over the last {QUANTILE_WINDOW} samples of each stage.", samples)
+
+    by_name = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append(("", dict(labels), value))
+    for name, samples in by_name.items():
+        _family(lines, name, "counter", name.replace("_", " ") + ".", samples)
+
+    answers, embeddings = answer_cache.stats(), embedding_cache.stats()
+    cache_samples = [("", {"cache": "answer", "result": "hit"}, answers["hits"]),
+                     ("", {"cache": "answer", "result": "miss"}, answers["misses"])]
+    for model, stats in embeddings["models"].items():
+        cache_samples.append(("", {"cache": f"embedding:{model}", "result": "hit"}, stats["hits"]))
+        cache_samples.append(("", {"cache": f"embedding:{model}", "result": "miss"}, stats["misses"]))
+    _family(lines, "rag_cache_lookups_total", "counter", "Answer and embedding cache lookups.", cache_samples)
+
+    router = llm_router.stats()["models"]
+    llm_samples = {"calls": [], "errors": [], "failovers": [], "hedges": [], "throttled": [], "shed": []}
+    for model, stats in router.items():
+        for key in ("calls", "errors", "failovers", "hedges"):
+            llm_samples[key].append(("", {"model": model}, stats[key]))
+        llm_samples["throttled"].append(("", {"model": model}, stats["limiter"]["throttled"]))
+        llm_samples["shed"].append(("", {"model": model}, stats["limiter"]["shed"]))
+    _family(lines, "rag_llm_calls_total", "counter", "LLM calls per model.", llm_samples["calls"])
+    _family(lines, "rag_llm_errors_total", "counter", "Failed LLM calls per model.", llm_samples["errors"])
+    _family(lines, "rag_llm_failovers_total", "counter", "Calls retried on the next model.", llm_samples["failovers"])
+    _family(lines, "rag_llm_hedges_total", "counter", "Hedged duplicate requests started.", llm_samples["hedges"])
+    _family(lines, "rag_llm_throttled_total", "counter", "429 responses seen by the rate limiter.", llm_samples["throttled"])
+    _family(lines, "rag_llm_shed_total", "counter", "Calls rejected as busy by the rate limiter.", llm_samples["shed"])
+    _family(lines, "rag_llm_effective_rpm", "gauge", "Requests/minute the limiter currently allows.",
+            [("", {"model": model}, "+Inf" if stats["limiter"]["effective_rpm"] is None else stats["limiter"]["effective_rpm"])
+             for model, stats in router.items()])
+
+    batcher = search_batcher.stats()
+    _family(lines, "rag_batcher_queries_total", "counter", "Queries through the embedding micro-batcher.",
+            [("", {}, batcher.get("queries", 0))])
+    _family(lines, "rag_batcher_batches_total", "counter", "Batches run by the embedding micro-batcher.",
+            [("", {}, batcher.get("batches", 0))])
+    _family(lines, "rag_tokens_total", "counter", "LLM tokens by kind.",
+            [("", {"kind": "prompt"}, token_usage["prompt_tokens"]),
+             ("", {"kind": "completion"}, token_usage["completion_tokens"]),
+             ("", {"kind": "context"}, token_usage["context_tokens"])])
+    return "\n".join(lines) + "\n"
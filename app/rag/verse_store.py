@@ -0,0 +1,127 @@
+"""
+Memory-mapped columnar store for verse metadata (replaces gita_metadata.pkl).
+
+File layout (little-endian):
+    header   : magic b"VRS1", uint32 version, uint32 record count, uint32 column count
+    offsets  : per column, (count + 1) uint64 byte offsets into that column's blob
+    blobs    : per column, the UTF-8 encoded values back to back
+
+Every worker maps the same file read-only, so the pages are shared through the OS
+page cache instead of being unpickled into each process heap.
+"""
+import os
+import sys
+import mmap
+import struct
+import pickle
+
+import numpy as np
+
+MAGIC = b"VRS1"
+VERSION = 2
+COLUMNS = ("chapter", "verse", "sanskrit", "transliteration", "translation", "full_text")
+# Version 1 stores predate the transliteration column; they stay readable (it reads as "")
+_VERSION_COLUMNS = {1: ("chapter", "verse", "sanskrit", "translation", "full_text"), 2: COLUMNS}
+_HEADER = struct.Struct("<4sIII")
+
+
+class VerseStore:
+    """Read-only, list-like view over a verse store file. store[i] returns the same dict shape as the pickle."""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, ncols = _HEADER.unpack_from(self._mm, 0)
+        columns = _VERSION_COLUMNS.get(version)
+        if magic != MAGIC or columns is None or ncols != len(columns):
+            raise ValueError(f"{path} is not a verse store (version {', '.join(map(str, _VERSION_COLUMNS))})")
+        self._count = count
+
+        # Offsets are read in place from the mapping (no copy)
+        self._offsets = np.frombuffer(self._mm, dtype='<u8', count=ncols * (count + 1),
+                                      offset=_HEADER.size).reshape(ncols, count + 1)
+        blob_start = _HEADER.size + self._offsets.nbytes
+        self._blob_starts = []
+        for col in range(ncols):
+            self._blob_starts.append(blob_start)
+            blob_start += int(self._offsets[col, -1])
+
+        self._column_index = {name: i for i, name in enumerate(columns)}
+
+    def __len__(self):
+        return self._count
+
+    def raw(self, idx: int, column: str) -> memoryview:
+        """Zero-copy view of one field's UTF-8 bytes."""
+        col = self._column_index[column]
+        base = self._blob_starts[col]
+        start, end = int(self._offsets[col, idx]), int(self._offsets[col, idx + 1])
+        return memoryview(self._mm)[base + start:base + end]
+
+    def field(self, idx: int, column: str) -> str:
+        return str(self.raw(idx, column), 'utf-8')
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._count))]
+        idx = int(idx)
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError("verse index out of range")
+        return {name: self.field(idx, name) if name in self._column_index else "" for name in COLUMNS}
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self):
+        """Unmaps the file. Views returned by raw() must be released first."""
+        self._offsets = None  # the numpy view holds a buffer export that blocks mmap.close()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_verse_store(records: list, path: str):
+    """Writes a list of verse metadata dicts (the gita_metadata.pkl shape) to a verse store file."""
+    encoded = [[str(rec.get(name, "") or "").encode('utf-8') for rec in records] for name in COLUMNS]
+
+    offsets = np.zeros((len(COLUMNS), len(records) + 1), dtype='<u8')
+    for col, values in enumerate(encoded):
+        offsets[col, 1:] = np.cumsum([len(v) for v in values], dtype='<u8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(records), len(COLUMNS)))
+        f.write(offsets.tobytes())
+        for values in encoded:
+            f.write(b"".join(values))
+    os.replace(tmp_path, path)
+
+
+def convert_pickle(pickle_path: str, store_path: str) -> int:
+    with open(pickle_path, 'rb') as f:
+        records = pickle.load(f)
+    write_verse_store(records, store_path)
+
+    # Round-trip check so a bad conversion never replaces a working pickle silently
+    store = VerseStore(store_path)
+    for i, rec in enumerate(records):
+        if any(store.field(i, name) != str(rec.get(name, "") or "") for name in COLUMNS):
+            raise ValueError(f"Verse store mismatch at record {i}")
+    return len(records)
+
+
+if __name__ == "__main__":
+    # Usage: python -m app.rag.verse_store [metadata.pkl] [verses.bin]
+    from app.rag.faiss_engine import METADATA_FILE_PATH, VERSE_STORE_PATH
+    src = sys.argv[1] if len(sys.argv) > 1 else METADATA_FILE_PATH
+    dst = sys.argv[2] if len(sys.argv) > 2 else VERSE_STORE_PATH
+    count = convert_pickle(src, dst)
+    print(f"Converted {count} verses from {src} to {dst} ({os.path.getsize(dst)} bytes).")
@@ -0,0 +1,70 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.rag import faiss_engine
+from app.rag.core import initialize_rag
+from app.rag.inference_pool import inference_pool
+
+# Readiness reported by /api/health. "cold" -> "warming" -> "ready" (or "degraded" if a component failed)
+warmup_state = {
+    "status": "cold",
+    "timings": {},   # component -> seconds
+    "errors": {},    # component -> error message
+    "started_at": None,
+    "finished_at": None,
+}
+_warmup_lock = threading.Lock()
+
+def _timed(name: str, fn):
+    start = time.perf_counter()
+    try:
+        return fn()
+    except Exception as e:
+        warmup_state["errors"][name] = str(e)
+        print(f"Warm-up step '{name}' failed: {e}")
+    finally:
+        warmup_state["timings"][name] = round(time.perf_counter() - start, 3)
+
+def run_warmup():
+    """
+    Eagerly loads everything the first request would otherwise pay for.
+    The embedding model, FAISS index + metadata and the Gemini/Pinecone clients are loaded
+    concurrently, then one dummy query runs through the model and the index.
+    """
+    with _warmup_lock:
+        if warmup_state["status"] in ("warming", "ready"):
+            return warmup_state
+        warmup_state["status"] = "warming"
+        warmup_state["started_at"] = time.time()
+
+    total_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="warmup") as pool:
+        if inference_pool.enabled:
+            # The inference processes hold the model and index; this process never loads them
+            steps = [pool.submit(_timed, "inference_pool", inference_pool.start)]
+        else:
+            steps = [
+                pool.submit(_timed, "embedding_model", faiss_engine.load_embedding_model),
+                pool.submit(_timed, "faiss_index", faiss_engine.load_index),
+            ]
+        steps.append(pool.submit(_timed, "llm_clients", initialize_rag))
+        for step in steps:
+            step.result()
+
+    # No saved index on disk: fall back to the (slow) build from CSV now rather than on the first request
+    if faiss_engine.faiss_index is None and not inference_pool.enabled:
+        _timed("faiss_build", faiss_engine.initialize_faiss)
+
+    # First encode/search pays for lazy kernel setup; do it here instead of on a user request
+    _timed("first_query", lambda: faiss_engine.search_gita("What is the nature of the Self?", top_k=1))
+
+    warmup_state["timings"]["total"] = round(time.perf_counter() - total_start, 3)
+    warmup_state["finished_at"] = time.time()
+    if inference_pool.enabled:
+        local_ready = inference_pool.active
+    else:
+        local_ready = faiss_engine.model is not None and faiss_engine.faiss_index is not None
+    warmup_state["status"] = "ready" if local_ready and not warmup_state["errors"] else "degraded"
+    print(f"Warm-up finished ({warmup_state['status']}): {warmup_state['timings']}")
+    return warmup_state
@@ -0,0 +1,193 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from twilio.base.exceptions import TwilioRestException
+
+from app.whatsapp.handler import get_twilio_client
+
+# Configuration (override via environment)
+BROADCAST_DB = os.getenv("BROADCAST_DB", "app/data/broadcasts.db")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "10"))             # messages/second (Twilio sender limit)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))  # sends in flight
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+BROADCAST_LEASE_S = float(os.getenv("BROADCAST_LEASE_S", "300"))     # a 'sending' row older than this was abandoned
+BROADCAST_PAGE_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id          TEXT PRIMARY KEY,
+    body        TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    broadcast_id TEXT NOT NULL,
+    recipient    TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending',   -- pending | sending (claimed) | sent | failed
+    message_sid  TEXT,
+    error        TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    updated_at   REAL,
+    PRIMARY KEY (broadcast_id, recipient)
+);
+CREATE INDEX IF NOT EXISTS deliveries_status ON deliveries(broadcast_id, status);
+"""
+
+_conn = None
+_db_lock = threading.Lock()
+
+
+def _execute(sql: str, params=(), many: bool = False, fetch: bool = False):
+    global _conn
+    with _db_lock:
+        if _conn is None:
+            if os.path.dirname(BROADCAST_DB):
+                os.makedirs(os.path.dirname(BROADCAST_DB), exist_ok=True)
+            _conn = sqlite3.connect(BROADCAST_DB, check_same_thread=False, isolation_level=None)
+            _conn.execute("PRAGMA journal_mode=WAL")
+            _conn.execute("PRAGMA synchronous=NORMAL")  # one status row per send must stay cheap
+            _conn.executescript(_SCHEMA)
+        if many:
+            _conn.execute("BEGIN")
+            try:
+                _conn.executemany(sql, params)
+                _conn.execute("COMMIT")
+            except Exception:
+                _conn.execute("ROLLBACK")
+                raise
+            return None
+        cursor = _conn.execute(sql, params)
+        # UPDATE ... RETURNING only finishes (and commits) once every row has been read
+        return cursor.fetchall() if fetch else cursor
+
+
+class _Pacer:
+    """Spaces sends evenly at `rate` per second across all worker threads."""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _send(client, from_number: str, recipient: str, body: str, pacer: _Pacer):
+    """Returns (status, message sid, error, attempts). Retries only Twilio's rate-limit responses."""
+    for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+        pacer.wait()
+        try:
+            message = client.messages.create(from_=from_number, body=body, to=recipient)
+            return "sent", message.sid, None, attempt
+        except TwilioRestException as e:
+            if e.status == 429 and attempt < BROADCAST_MAX_ATTEMPTS:
+                time.sleep(attempt)
+                continue
+            return "failed", None, f"{e.code}: {e.msg}", attempt
+        except Exception as e:
+            return "failed", None, str(e), attempt
+    return "failed", None, "rate limited", BROADCAST_MAX_ATTEMPTS
+
+
+def add_recipients(broadcast_id: str, recipients):
+    """Registers recipients (any iterable, consumed in chunks); ones already present are kept as they are."""
+    chunk = []
+    for recipient in recipients:
+        chunk.append((broadcast_id, recipient))
+        if len(chunk) >= BROADCAST_PAGE_SIZE:
+            _execute("INSERT OR IGNORE INTO deliveries (broadcast_id, recipient) VALUES (?, ?)", chunk, many=True)
+            chunk = []
+    if chunk:
+        _execute("INSERT OR IGNORE INTO deliveries (broadcast_id, recipient) VALUES (?, ?)", chunk, many=True)
+
+
+def _claim(broadcast_id: str, statuses: tuple, after_rowid: int, limit: int) -> list:
+    """
+    Atomically marks up to `limit` deliveries as 'sending' and returns their (rowid, recipient).
+    A row is only claimed once, so concurrent runs (two triggers, two workers) never send it twice;
+    rows left 'sending' by a run that died are claimable again after BROADCAST_LEASE_S.
+    """
+    now = time.time()
+    rows = _execute(
+        "UPDATE deliveries SET status = 'sending', updated_at = ? WHERE rowid IN ("
+        f"SELECT rowid FROM deliveries WHERE broadcast_id = ? AND rowid > ? AND (status IN ({','.join('?' * len(statuses))}) "
+        "OR (status = 'sending' AND updated_at < ?)) ORDER BY rowid LIMIT ?) RETURNING rowid, recipient",
+        (now, broadcast_id, after_rowid, *statuses, now - BROADCAST_LEASE_S, limit), fetch=True
+    )
+    return sorted(rows)
+
+
+def run_broadcast(broadcast_id: str, body: str, recipients=(), retry_failed: bool = False,
+                  rate: float = BROADCAST_RATE, concurrency: int = BROADCAST_CONCURRENCY) -> dict:
+    """
+    Sends `body` to every recipient of the broadcast that hasn't received it yet, `concurrency`
+    at a time and at most `rate` per second, recording each delivery as it completes.
+    Calling it again with the same id resumes an interrupted run: recipients already marked
+    sent are skipped, and the body stored on the first run is reused. Runs started at the same
+    time split the recipients between them (see _claim) instead of both sending to everyone.
+    """
+    client = get_twilio_client()
+    from_number = os.getenv("TWILIO_FROM_NUMBER")
+    if not client or not from_number:
+        print("Twilio credentials missing. Cannot run broadcast.")
+        return {"id": broadcast_id, "sent": 0, "failed": 0, "error": "twilio not configured"}
+
+    _execute("INSERT OR IGNORE INTO broadcasts (id, body, created_at) VALUES (?, ?, ?)", (broadcast_id, body, time.time()))
+    body = _execute("SELECT body FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()[0]
+    add_recipients(broadcast_id, recipients)
+    statuses = ("pending", "failed") if retry_failed else ("pending",)
+
+    pacer = _Pacer(rate)
+    sent = failed = 0
+    start = time.perf_counter()
+
+    def deliver(row):
+        rowid, recipient = row
+        status, sid, error, attempts = _send(client, from_number, recipient, body, pacer)
+        # Recorded per message, so a crash loses at most the sends that were in flight
+        _execute("UPDATE deliveries SET status = ?, message_sid = ?, error = ?, attempts = attempts + ?, updated_at = ? "
+                 "WHERE rowid = ?", (status, sid, error, attempts, time.time(), rowid))
+        return status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        last_rowid = 0
+        while True:
+            # Small claims, so rows are 'sending' only briefly before their send and a second run shares the work
+            page = _claim(broadcast_id, statuses, last_rowid, concurrency * 4)
+            if not page:
+                break
+            last_rowid = page[-1][0]
+            for status in pool.map(deliver, page):
+                if status == "sent":
+                    sent += 1
+                else:
+                    failed += 1
+
+    elapsed = time.perf_counter() - start
+    _execute("UPDATE broadcasts SET finished_at = ? WHERE id = ?", (time.time(), broadcast_id))
+    summary = {
+        "id": broadcast_id,
+        "sent": sent,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 2),
+        "messages_per_s": round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    print(f"Broadcast {broadcast_id}: {summary}")
+    return summary
+
+
+def broadcast_status(broadcast_id: str) -> dict:
+    row = _execute("SELECT body, created_at, finished_at FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+    if row is None:
+        return None
+    counts = dict(_execute("SELECT status, COUNT(*) FROM deliveries WHERE broadcast_id = ? GROUP BY status",
+                           (broadcast_id,)).fetchall())
+    return {"id": broadcast_id, "created_at": row[1], "finished_at": row[2], "deliveries": counts}
@@ -1,36 +1,70 @@
 from fastapi import Request
 from twilio.twiml.messaging_response import MessagingResponse
-from app.rag.engine import ask_question
+from app.whatsapp.jobs import whatsapp_jobs
+from app.whatsapp.subscribers import handle_subscription_command
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from requests.adapters import HTTPAdapter
 import os
+import re
+import asyncio
+import threading
 
-# Twilio Client for proactive messaging (Daily Story)
+TWILIO_POOL_SIZE = int(os.getenv("TWILIO_POOL_SIZE", "32"))
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "")  # e.g. http://127.0.0.1:8099 for benchmark_broadcast.py
+
+_twilio_client = None
+_twilio_lock = threading.Lock()
+
+class PooledTwilioHttpClient(TwilioHttpClient):
+    """One keep-alive session whose connection pool is sized for concurrent sends."""
+    def __init__(self, pool_size: int = TWILIO_POOL_SIZE, base_url: str = TWILIO_API_BASE):
+        super().__init__(pool_connections=True, timeout=15)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, url, *args, **kwargs):
+        if self.base_url:
+            url = re.sub(r"^https://[^/]+", self.base_url, url)
+        return super().request(method, url, *args, **kwargs)
+
+# Twilio Client for proactive messaging (Daily Story), shared by every sender
 def get_twilio_client():
+    global _twilio_client
     account_sid = os.getenv("TWILIO_ACCOUNT_SID")
     auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    if account_sid and auth_token:
-        return Client(account_sid, auth_token)
-    return None
+    if not (account_sid and auth_token):
+        return None
+    with _twilio_lock:
+        if _twilio_client is None:
+            _twilio_client = Client(account_sid, auth_token, http_client=PooledTwilioHttpClient())
+    return _twilio_client
 
 async def handle_whatsapp_message(form_data):
     """
     Handles incoming WhatsApp messages via Twilio webhook.
+    Questions are queued and answered in the background (Twilio gives up on webhooks after
+    ~15s); the reply arrives as a separate message via send_whatsapp_message.
     """
     incoming_msg = form_data.get('Body', '').strip()
     sender = form_data.get('From', '') # e.g., 'whatsapp:+1234567890'
+    message_sid = form_data.get('MessageSid', '')
     
     print(f"Received message from {sender}: {incoming_msg}")
 
-    # Get answer from RAG (Gemini + Pinecone)
-    if incoming_msg:
-        answer = ask_question(incoming_msg)
-    else:
-        answer = "I didn't catch that. Please ask a question about the Gita or Upanishads."
-
-    # Create Twilio response
     resp = MessagingResponse()
-    msg = resp.message()
-    msg.body(answer)
+    # Subscription commands (JOIN, STOP, LANGUAGE, TIMEZONE) are answered right away (SQLite, off the loop)
+    command_reply = await asyncio.to_thread(handle_subscription_command, sender, incoming_msg) if incoming_msg else None
+    if command_reply:
+        msg = resp.message()
+        msg.body(command_reply)
+    elif incoming_msg:
+        await whatsapp_jobs.enqueue(message_sid, sender, incoming_msg)
+    else:
+        msg = resp.message()
+        msg.body("I didn't catch that. Please ask a question about the Gita or Upanishads.")
 
     return str(resp)
 
@@ -38,13 +72,14 @@ def send_whatsapp_message(to_number: str, body: str):
     """
     Sends a proactive WhatsApp message (e.g., daily story).
     Requires TWILIO_FROM_NUMBER (whatsapp:+14155238886 sandbox or your number).
+    Returns the Twilio message SID, or None if the message could not be sent.
     """
     client = get_twilio_client()
     from_number = os.getenv("TWILIO_FROM_NUMBER") # e.g. 'whatsapp:+14155238886'
     
     if not client or not from_number:
         print("Twilio credentials missing. Cannot send WhatsApp message.")
-        return
+        return None
 
     try:
         message = client.messages.create(
@@ -53,5 +88,7 @@ def send_whatsapp_message(to_number: str, body: str):
             to=to_number
         )
         print(f"Message sent to {to_number}: {message.sid}")
+        return message.sid
     except Exception as e:
         print(f"Failed to send WhatsApp message: {e}")
+        return None
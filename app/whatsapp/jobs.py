@@ -0,0 +1,181 @@
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+
+from app.rag.rate_limiter import LLMBusyError
+
+# Configuration (override via environment)
+WHATSAPP_JOBS_DB = os.getenv("WHATSAPP_JOBS_DB", "app/data/whatsapp_jobs.db")
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "4"))
+WHATSAPP_MAX_ATTEMPTS = int(os.getenv("WHATSAPP_MAX_ATTEMPTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    message_sid TEXT PRIMARY KEY,
+    sender      TEXT NOT NULL,
+    body        TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    answer      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at);
+"""
+
+
+class WhatsAppJobQueue:
+    """
+    Durable queue of incoming WhatsApp questions, keyed on Twilio's MessageSid.
+    The webhook only enqueues; worker tasks answer and deliver via send_whatsapp_message.
+    A webhook retried by Twilio maps to the same MessageSid and is ignored, and jobs left
+    queued or running by a crash are picked up again on the next start. SQLite calls made
+    from the event loop go through asyncio.to_thread.
+    """
+    def __init__(self, path: str = WHATSAPP_JOBS_DB, workers: int = WHATSAPP_WORKERS):
+        self.path = path
+        self.workers = workers
+        # With several server processes sharing the DB, only one should recover (see serve.py)
+        self.resume = True
+        self.requeue_running = True
+        self.duplicates = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._tasks = []
+
+    def _db(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def close(self):
+        """Closes the connection; the next call reopens it (e.g. in a freshly forked worker)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._db().execute(sql, params)
+
+    def _insert(self, message_sid: str, sender: str, body: str) -> bool:
+        now = time.time()
+        cursor = self._execute(
+            "INSERT OR IGNORE INTO jobs (message_sid, sender, body, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (message_sid, sender, body, now, now)
+        )
+        return cursor.rowcount > 0
+
+    async def enqueue(self, message_sid: str, sender: str, body: str) -> bool:
+        """Returns False if this MessageSid was already received (a Twilio retry)."""
+        message_sid = message_sid or f"local-{uuid.uuid4().hex}"
+        if not await asyncio.to_thread(self._insert, message_sid, sender, body):
+            self.duplicates += 1
+            print(f"Duplicate WhatsApp webhook for {message_sid}, ignoring")
+            return False
+        if self._queue is not None:
+            self._queue.put_nowait(message_sid)
+        return True
+
+    def _claim(self, message_sid: str):
+        cursor = self._execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+            "WHERE message_sid = ? AND status = 'queued'",
+            (time.time(), message_sid)
+        )
+        if cursor.rowcount == 0:
+            return None  # Already handled by another worker
+        return self._execute("SELECT sender, body, attempts FROM jobs WHERE message_sid = ?", (message_sid,)).fetchone()
+
+    def _finish(self, message_sid: str, status: str, answer: str = None, error: str = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, answer = ?, error = ?, updated_at = ? WHERE message_sid = ?",
+            (status, answer, error, time.time(), message_sid)
+        )
+
+    async def _answer(self, body: str) -> str:
+        from app.rag.core import aask_question
+        result = await aask_question(body)
+        return result.get("answer", "") if isinstance(result, dict) else str(result)
+
+    async def _process(self, message_sid: str):
+        from app.whatsapp.handler import send_whatsapp_message
+
+        job = await asyncio.to_thread(self._claim, message_sid)
+        if job is None:
+            return
+        sender, body, attempts = job
+        try:
+            answer = await self._answer(body)
+        except LLMBusyError as e:
+            if attempts < WHATSAPP_MAX_ATTEMPTS:
+                # Out of LLM quota: put it back and try again once the limiter expects capacity
+                await asyncio.to_thread(self._finish, message_sid, "queued", error=str(e))
+                asyncio.get_running_loop().call_later(e.retry_after, self._queue.put_nowait, message_sid)
+                return
+            answer = str(e)
+        except Exception as e:
+            print(f"WhatsApp job {message_sid} failed: {e}")
+            await asyncio.to_thread(self._finish, message_sid, "failed", error=str(e))
+            return
+
+        sent = await asyncio.to_thread(send_whatsapp_message, sender, answer)
+        await asyncio.to_thread(self._finish, message_sid, "done" if sent else "failed", answer=answer,
+                                error=None if sent else "delivery failed")
+
+    async def _worker(self):
+        while True:
+            message_sid = await self._queue.get()
+            try:
+                await self._process(message_sid)
+            except Exception as e:
+                print(f"WhatsApp worker error on {message_sid}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def requeue_interrupted(self) -> int:
+        """Anything 'running' was interrupted mid-answer by a restart: mark it to run again."""
+        return self._execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+
+    def start(self):
+        """Starts the worker tasks on the running loop and re-queues unfinished jobs."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        if self.resume:
+            if self.requeue_running:
+                self.requeue_interrupted()
+            pending = self._execute("SELECT message_sid FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+            for (message_sid,) in pending:
+                self._queue.put_nowait(message_sid)
+            if pending:
+                print(f"Resuming {len(pending)} unfinished WhatsApp jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "workers": len(self._tasks),
+            "backlog": self._queue.qsize() if self._queue is not None else 0,
+            "duplicates": self.duplicates,
+            "jobs": counts,
+        }
+
+
+whatsapp_jobs = WhatsAppJobQueue()
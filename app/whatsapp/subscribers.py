@@ -0,0 +1,199 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, available_timezones
+
+# Configuration (override via environment)
+SUBSCRIBERS_DB = os.getenv("SUBSCRIBERS_DB", "app/data/subscribers.db")
+SUBSCRIBER_DEFAULT_TZ = os.getenv("SUBSCRIBER_DEFAULT_TZ", "Asia/Kolkata")
+SUBSCRIBER_DEFAULT_LANGUAGE = os.getenv("SUBSCRIBER_DEFAULT_LANGUAGE", "en")
+SUBSCRIBER_PAGE_SIZE = 1000
+
+SUBSCRIBE_WORDS = ("join", "start", "subscribe")
+UNSUBSCRIBE_WORDS = ("stop", "unsubscribe", "cancel")
+LANGUAGES = {"en": "English", "hi": "Hindi", "sa": "Sanskrit"}
+# The daily story is only rendered in English so far; other languages are refused rather than
+# stored, until automation sends one wave per language (iter_active already filters by it)
+STORY_LANGUAGES = ("en",)
+
+# Best guess from the number until the subscriber sends "TIMEZONE <name>"; longest prefix wins
+_COUNTRY_TZ = {
+    "+91": "Asia/Kolkata", "+977": "Asia/Kathmandu", "+94": "Asia/Colombo", "+971": "Asia/Dubai",
+    "+65": "Asia/Singapore", "+60": "Asia/Kuala_Lumpur", "+61": "Australia/Sydney", "+64": "Pacific/Auckland",
+    "+44": "Europe/London", "+49": "Europe/Berlin", "+33": "Europe/Paris", "+31": "Europe/Amsterdam",
+    "+1": "America/New_York", "+27": "Africa/Johannesburg", "+254": "Africa/Nairobi", "+230": "Indian/Mauritius",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    phone       TEXT PRIMARY KEY,                  -- e.g. 'whatsapp:+919876543210'
+    status      TEXT NOT NULL DEFAULT 'active',    -- active | opted_out
+    language    TEXT NOT NULL,
+    tz          TEXT NOT NULL,                     -- IANA name, e.g. 'Asia/Kolkata'
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS subscribers_tz ON subscribers(status, tz, phone);
+CREATE INDEX IF NOT EXISTS subscribers_language ON subscribers(status, language, phone);
+"""
+
+
+def guess_timezone(phone: str) -> str:
+    number = phone.replace("whatsapp:", "")
+    for prefix in sorted(_COUNTRY_TZ, key=len, reverse=True):
+        if number.startswith(prefix):
+            return _COUNTRY_TZ[prefix]
+    return SUBSCRIBER_DEFAULT_TZ
+
+
+def utc_offset_minutes(tz: str, now: datetime = None) -> int:
+    now = now or datetime.now(timezone.utc)
+    return int(now.astimezone(ZoneInfo(tz)).utcoffset().total_seconds() // 60)
+
+
+class SubscriberStore:
+    """
+    Daily-story subscribers in SQLite, indexed by (status, tz) and (status, language) so a
+    segment can be paged through with keyset pagination without scanning the whole table.
+    """
+    def __init__(self, path: str = SUBSCRIBERS_DB):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params=(), many: bool = False):
+        with self._lock:
+            if self._conn is None:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(_SCHEMA)
+            if many:
+                self._conn.execute("BEGIN")
+                try:
+                    cursor = self._conn.executemany(sql, params)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                return cursor
+            return self._conn.execute(sql, params)
+
+    def subscribe(self, phone: str, language: str = None, tz: str = None):
+        now = time.time()
+        self._execute(
+            "INSERT INTO subscribers (phone, status, language, tz, created_at, updated_at) VALUES (?, 'active', ?, ?, ?, ?) "
+            "ON CONFLICT(phone) DO UPDATE SET status = 'active', "
+            "language = COALESCE(?, language), tz = COALESCE(?, tz), updated_at = excluded.updated_at",
+            (phone, language or SUBSCRIBER_DEFAULT_LANGUAGE, tz or guess_timezone(phone), now, now, language, tz)
+        )
+
+    def unsubscribe(self, phone: str) -> bool:
+        cursor = self._execute("UPDATE subscribers SET status = 'opted_out', updated_at = ? WHERE phone = ?",
+                               (time.time(), phone))
+        return cursor.rowcount > 0
+
+    def update(self, phone: str, language: str = None, tz: str = None) -> bool:
+        cursor = self._execute(
+            "UPDATE subscribers SET language = COALESCE(?, language), tz = COALESCE(?, tz), updated_at = ? WHERE phone = ?",
+            (language, tz, time.time(), phone)
+        )
+        return cursor.rowcount > 0
+
+    def get(self, phone: str):
+        row = self._execute("SELECT phone, status, language, tz FROM subscribers WHERE phone = ?", (phone,)).fetchone()
+        return dict(zip(("phone", "status", "language", "tz"), row)) if row else None
+
+    def import_numbers(self, phones) -> int:
+        """Adds numbers as active subscribers; existing rows (including opt-outs) are left alone."""
+        now = time.time()
+        rows = [(phone, SUBSCRIBER_DEFAULT_LANGUAGE, guess_timezone(phone), now, now) for phone in phones]
+        cursor = self._execute(
+            "INSERT OR IGNORE INTO subscribers (phone, language, tz, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            rows, many=True
+        )
+        return max(cursor.rowcount, 0) if cursor is not None else 0
+
+    def iter_active(self, tz_names=None, language: str = None, page_size: int = SUBSCRIBER_PAGE_SIZE):
+        """Yields active phone numbers, one indexed page at a time, optionally limited to time zones / a language."""
+        if tz_names is None and language is None:
+            # Walk (status, tz, phone) one time zone at a time rather than sorting the whole table
+            tz_names = [tz for (tz,) in self._execute("SELECT DISTINCT tz FROM subscribers WHERE status = 'active'").fetchall()]
+        if tz_names is not None:
+            lang_clause = " AND language = ?" if language else ""
+            segments = [(f"status = 'active' AND tz = ?{lang_clause}", (tz,) + ((language,) if language else ()))
+                        for tz in tz_names]
+        else:
+            segments = [("status = 'active' AND language = ?", (language,))]
+
+        for where, params in segments:
+            last_phone = ""
+            while True:
+                rows = self._execute(
+                    f"SELECT phone FROM subscribers WHERE {where} AND phone > ? ORDER BY phone LIMIT ?",
+                    params + (last_phone, page_size)
+                ).fetchall()
+                if not rows:
+                    break
+                for (phone,) in rows:
+                    yield phone
+                last_phone = rows[-1][0]
+
+    def waves(self, now: datetime = None) -> list:
+        """Active time zones grouped by their current UTC offset, in offset order: [(offset minutes, [tz, ...])]."""
+        tz_names = [tz for (tz,) in self._execute("SELECT DISTINCT tz FROM subscribers WHERE status = 'active'").fetchall()]
+        by_offset = {}
+        for tz in tz_names:
+            by_offset.setdefault(utc_offset_minutes(tz, now), []).append(tz)
+        return sorted(by_offset.items())
+
+    def stats(self) -> dict:
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM subscribers GROUP BY status").fetchall())
+        languages = dict(self._execute(
+            "SELECT language, COUNT(*) FROM subscribers WHERE status = 'active' GROUP BY language").fetchall())
+        time_zones = dict(self._execute(
+            "SELECT tz, COUNT(*) FROM subscribers WHERE status = 'active' GROUP BY tz").fetchall())
+        return {"subscribers": counts, "languages": languages, "time_zones": time_zones}
+
+
+subscriber_store = SubscriberStore()
+
+
+def handle_subscription_command(phone: str, text: str):
+    """
+    Handles JOIN / STOP / LANGUAGE <code> / TIMEZONE <Area/City> messages.
+    Returns the reply to send, or None if the message is an ordinary question.
+    """
+    words = text.strip().split()
+    if not words:
+        return None
+    command = words[0].lower()
+
+    if len(words) == 1 and command in SUBSCRIBE_WORDS:
+        subscriber_store.subscribe(phone)
+        tz = subscriber_store.get(phone)["tz"]
+        return (f"🙏 You are subscribed to the Daily Vedic Wisdom story (time zone {tz}). "
+                "Reply TIMEZONE <Area/City> to change it, or STOP to unsubscribe.")
+    if len(words) == 1 and command in UNSUBSCRIBE_WORDS:
+        subscriber_store.unsubscribe(phone)
+        return "You have been unsubscribed from the daily story. Reply JOIN any time to subscribe again."
+    if command == "language" and len(words) == 2:
+        code = words[1].lower()
+        if code not in LANGUAGES:
+            return f"Unknown language '{words[1]}'. Choose one of: {', '.join(LANGUAGES)}."
+        if code not in STORY_LANGUAGES:
+            return f"Sorry, the daily story is only available in English for now, not {LANGUAGES[code]}."
+        if not subscriber_store.update(phone, language=code):
+            subscriber_store.subscribe(phone, language=code)
+        return f"Your daily story language is now {LANGUAGES[code]}."
+    if command in ("timezone", "tz") and len(words) == 2:
+        tz = next((name for name in available_timezones() if name.lower() == words[1].lower()), None)
+        if tz is None:
+            return f"Unknown time zone '{words[1]}'. Use a name like Asia/Kolkata or America/New_York."
+        if not subscriber_store.update(phone, tz=tz):
+            subscriber_store.subscribe(phone, tz=tz)
+        return f"Your daily story will arrive in the morning, {tz} time."
+    return None
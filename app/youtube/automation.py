@@ -1,34 +1,49 @@
-import time
 import os
-from app.rag.engine import ask_question
-from app.whatsapp.handler import send_whatsapp_message
+from app.youtube.daily_story import get_or_create_story, StoryUnavailableError
+from app.whatsapp.broadcast import run_broadcast
+from app.whatsapp.subscribers import subscriber_store
+from datetime import datetime, timedelta, timezone
+
+DAILY_STORY_HOUR = int(os.getenv("DAILY_STORY_HOUR", "7"))  # local hour from which a wave receives the story
+DAILY_STORY_WINDOW_HOURS = int(os.getenv("DAILY_STORY_WINDOW_HOURS", "12"))  # don't start a wave late at night
+DAILY_STORY_WAVES = os.getenv("DAILY_STORY_WAVES", "true").lower() in ("1", "true", "yes")
+
+def _due_waves(now: datetime) -> list:
+    """[(broadcast id, local date, time zones)] for each wave whose local time is within the delivery window."""
+    due = []
+    for offset, tz_names in subscriber_store.waves(now):
+        local = now + timedelta(minutes=offset)
+        if DAILY_STORY_HOUR <= local.hour < DAILY_STORY_HOUR + DAILY_STORY_WINDOW_HOURS:
+            due.append((f"daily-story-{local.date().isoformat()}-utc{offset:+d}", local.date(), tz_names))
+    return due
 
 def generate_daily_story():
     """
-    Generates a daily wisdom story using Gemini and sends it to WhatsApp subscribers.
+    Makes sure today's story exists (it is generated once per date and then served from the
+    store) and sends it to WhatsApp subscribers.
+    Call it hourly: each time-zone wave gets the story once its local time reaches DAILY_STORY_HOUR.
     """
-    print("Generating daily story...")
-    
-    # Prompt the RAG system (Gemini)
-    prompt = "Generate a very short, inspiring story (max 150 words) based on the Bhagavad Gita or Upanishads. End with a reflection question."
-    
-    story = ask_question(prompt)
+    now = datetime.now(timezone.utc)
+    try:
+        story = get_or_create_story(now.date())
+    except StoryUnavailableError as e:
+        print(f"Daily story not generated: {e}")
+        return None
+    print(f"--- DAILY STORY ({story['date']}) ---\n{story['whatsapp']}\n-------------------")
     
-    print(f"--- DAILY STORY ---\n{story}\n-------------------")
-    
-    # Send to WhatsApp
-    # In a real app, retrieve subscribers from DB. 
-    # Here we use a comma-separated list from ENV
+    # Numbers from the legacy env var become ordinary subscribers (opt-outs stay opted out)
     to_numbers_str = os.getenv("WHATSAPP_TO_NUMBER", "")
-    
     if to_numbers_str:
-        # Split by comma and strip whitespace
-        recipients = [num.strip() for num in to_numbers_str.split(',') if num.strip()]
-        
-        for number in recipients:
-            print(f"Sending daily story to {number}...")
-            send_whatsapp_message(number, f"🌟 *Daily Vedic Wisdom* 🌟\n\n{story}")
-    else:
-        print("No WHATSAPP_TO_NUMBER defined. Story generated but not sent.")
+        subscriber_store.import_numbers(num.strip() for num in to_numbers_str.split(',') if num.strip())
+
+    # Send to WhatsApp, one broadcast per time-zone wave, each with the story for its local date.
+    # Re-running a broadcast (another trigger, or after a crash) only reaches subscribers who missed it.
+    waves = _due_waves(now) if DAILY_STORY_WAVES else [(f"daily-story-{now.date().isoformat()}", now.date(), None)]
+    if not waves:
+        print(f"No time-zone wave has reached {DAILY_STORY_HOUR}:00 yet. Story generated but not sent.")
+    for broadcast_id, local_date, tz_names in waves:
+        message = get_or_create_story(local_date)["whatsapp"]
+        print(f"Sending daily story wave {broadcast_id} ({', '.join(tz_names or ['all time zones'])})...")
+        run_broadcast(broadcast_id, message, subscriber_store.iter_active(tz_names=tz_names))
     
     return story
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from datetime import date
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+# Configuration (override via environment)
+DAILY_STORY_DB = os.getenv("DAILY_STORY_DB", "app/data/daily_stories.db")
+DAILY_STORY_CLAIM_TIMEOUT = float(os.getenv("DAILY_STORY_CLAIM_TIMEOUT", "300"))  # seconds before a stuck generation is retried
+FORMATS = ("whatsapp", "web", "youtube")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    day         TEXT PRIMARY KEY,                   -- ISO date
+    status      TEXT NOT NULL,                      -- generating | ready
+    story       TEXT,                               -- JSON: title, body, reflection
+    sources     TEXT,                               -- JSON list of verse dicts
+    whatsapp    TEXT,
+    web         TEXT,                               -- JSON
+    youtube     TEXT,
+    claimed_at  REAL NOT NULL,
+    created_at  REAL
+);
+"""
+
+_conn = None
+_db_lock = threading.Lock()
+
+
+class StoryUnavailableError(RuntimeError):
+    """The story can't be generated right now (no LLM configured); nothing was stored for the date."""
+
+
+def _execute(sql: str, params=()):
+    global _conn
+    with _db_lock:
+        if _conn is None:
+            if os.path.dirname(DAILY_STORY_DB):
+                os.makedirs(os.path.dirname(DAILY_STORY_DB), exist_ok=True)
+            _conn = sqlite3.connect(DAILY_STORY_DB, check_same_thread=False, isolation_level=None)
+            _conn.execute("PRAGMA journal_mode=WAL")
+            _conn.executescript(_SCHEMA)
+        return _conn.execute(sql, params)
+
+
+def pick_verse(day: date) -> dict:
+    """The day's verse: a stable pseudo-random pick, so every worker (and every rerun) agrees on it."""
+    from app.rag import faiss_engine
+
+    digest = hashlib.sha1(day.isoformat().encode()).hexdigest()
+    if faiss_engine.gita_metadata:
+        metadata = faiss_engine.gita_metadata
+        meta = metadata[int(digest, 16) % len(metadata)]
+    else:
+        # Run outside the server (e.g. a cron script): open the store just for this pick
+        metadata = faiss_engine.load_metadata()
+        try:
+            meta = metadata[int(digest, 16) % len(metadata)]
+        finally:
+            if hasattr(metadata, "close"):
+                metadata.close()
+    return {
+        "reference": meta.get("chapter", ""),
+        "sanskrit": meta.get("sanskrit", ""),
+        "translation": meta.get("translation", ""),
+        "source": "Bhagavad Gita",
+    }
+
+
+def _require_llm():
+    """The RAG core module once its LLM is initialized; raises StoryUnavailableError if it can't be."""
+    from app.rag import core
+
+    if not core.llm:
+        core.initialize_rag()
+    if not core.llm:
+        raise StoryUnavailableError("LLM is not initialized (check GOOGLE_API_KEY and the RAG settings)")
+    return core
+
+
+def _generate(verse: dict) -> dict:
+    """One LLM call: a short story illustrating the verse, parsed into title / body / reflection."""
+    core = _require_llm()
+    messages = [
+        SystemMessage(content=(
+            "You are a warm storyteller who brings the Bhagavad Gita to everyday life. "
+            "Answer in plain text, no markdown."
+        )),
+        HumanMessage(content=(
+            f"VERSE ({verse['reference']}): {verse['translation']}\n\n"
+            "Write a very short, inspiring story (max 150 words) that illustrates this verse.\n"
+            "Format exactly:\nTitle: <a short title>\n<the story>\nReflection: <one reflection question>"
+        )),
+    ]
+    response = core.call_llm_with_retry(messages)
+    text = core._response_text(response).strip()
+
+    title, reflection, body_lines = "", "", []
+    for line in text.splitlines():
+        stripped = line.strip().strip("*")
+        if stripped.lower().startswith("title:") and not title:
+            title = stripped[len("title:"):].strip()
+        elif stripped.lower().startswith("reflection:"):
+            reflection = stripped[len("reflection:"):].strip()
+        else:
+            body_lines.append(line)
+    return {
+        "title": title or "Daily Vedic Wisdom",
+        "body": "\n".join(body_lines).strip(),
+        "reflection": reflection,
+    }
+
+
+def render_whatsapp(story: dict, verse: dict) -> str:
+    parts = [f"🌟 *Daily Vedic Wisdom* 🌟\n\n*{story['title']}*\n\n{story['body']}"]
+    if story["reflection"]:
+        parts.append(f"🪷 _{story['reflection']}_")
+    parts.append(f"📖 {verse['source']}, {verse['reference']}")
+    return "\n\n".join(parts)
+
+
+def render_web(story: dict, verse: dict) -> dict:
+    return {"title": story["title"], "story": story["body"], "reflection": story["reflection"], "verse": verse}
+
+
+def render_youtube(story: dict, verse: dict) -> str:
+    return "\n\n".join([
+        f"[HOOK]\n{story['title']}",
+        f"[VERSE]\n{verse['source']}, {verse['reference']}\n{verse['sanskrit']}\n{verse['translation']}",
+        f"[STORY]\n{story['body']}",
+        f"[REFLECTION]\n{story['reflection']}" if story["reflection"] else "",
+        "[CALL TO ACTION]\nSubscribe for a new story from the Gita every day.",
+    ]).strip()
+
+
+def _row_to_story(row) -> dict:
+    day, story, sources, whatsapp, web, youtube, created_at = row
+    return {
+        "date": day,
+        "story": json.loads(story),
+        "sources": json.loads(sources),
+        "whatsapp": whatsapp,
+        "web": json.loads(web),
+        "youtube": youtube,
+        "created_at": created_at,
+    }
+
+
+def get_story(day: date):
+    """The stored story for a day, or None if it hasn't been generated yet."""
+    row = _execute("SELECT day, story, sources, whatsapp, web, youtube, created_at FROM stories "
+                   "WHERE day = ? AND status = 'ready'", (day.isoformat(),)).fetchone()
+    return _row_to_story(row) if row else None
+
+
+def get_or_create_story(day: date = None) -> dict:
+    """
+    Returns the day's story, generating it first if needed. Exactly one caller (across threads
+    and worker processes sharing the database) generates; the others wait for its result.
+    """
+    day = day or date.today()
+    key = day.isoformat()
+    while True:
+        story = get_story(day)
+        if story is not None:
+            return story
+        # Checked before claiming the date, so a missing LLM doesn't hold the claim for other callers
+        _require_llm()
+
+        now = time.time()
+        claimed = _execute("INSERT OR IGNORE INTO stories (day, status, claimed_at) VALUES (?, 'generating', ?)",
+                           (key, now)).rowcount
+        if not claimed:
+            # Someone else is generating; take over only if they seem to have died
+            claimed = _execute("UPDATE stories SET claimed_at = ? WHERE day = ? AND status = 'generating' "
+                               "AND claimed_at < ?", (now, key, now - DAILY_STORY_CLAIM_TIMEOUT)).rowcount
+        if not claimed:
+            time.sleep(1)
+            continue
+
+        try:
+            verse = pick_verse(day)
+            story = _generate(verse)
+        except Exception:
+            _execute("DELETE FROM stories WHERE day = ? AND status = 'generating'", (key,))
+            raise
+        _execute(
+            "UPDATE stories SET status = 'ready', story = ?, sources = ?, whatsapp = ?, web = ?, youtube = ?, "
+            "created_at = ? WHERE day = ?",
+            (json.dumps(story, ensure_ascii=False), json.dumps([verse], ensure_ascii=False),
+             render_whatsapp(story, verse), json.dumps(render_web(story, verse), ensure_ascii=False),
+             render_youtube(story, verse), time.time(), key)
+        )
+        print(f"Generated daily story for {key} ({verse['reference']}): {story['title']}")
+        return get_story(day)
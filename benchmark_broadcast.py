@@ -0,0 +1,97 @@
+"""
+Benchmarks the broadcast engine against a local fake Twilio API (no real messages are sent).
+
+    python benchmark_broadcast.py --recipients 2000 --rate 200 --latency-ms 80
+    python benchmark_broadcast.py --compare        # also time the old one-by-one loop
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+    latency = 0.05
+    fail_rate = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        time.sleep(self.latency)
+        with self.lock:
+            FakeTwilioHandler.received += 1
+
+        if random.random() < self.fail_rate:
+            status, payload = 400, {"code": 21211, "message": "Invalid 'To' Phone Number", "status": 400}
+        else:
+            status, payload = 201, {"sid": f"SM{uuid.uuid4().hex}", "status": "queued"}
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_twilio(port: int):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeTwilioHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Broadcast throughput against a fake Twilio server.")
+    parser.add_argument("--recipients", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="Send limit in messages/second")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake Twilio response time")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--compare", action="store_true", help="Also time sequential sends with a new client each")
+    args = parser.parse_args(argv)
+
+    FakeTwilioHandler.latency = args.latency_ms / 1000
+    FakeTwilioHandler.fail_rate = args.fail_rate
+    start_fake_twilio(args.port)
+
+    # Point the app at the fake server and a throwaway database before importing it
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACfake")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "fake")
+    os.environ.setdefault("TWILIO_FROM_NUMBER", "whatsapp:+10000000000")
+    os.environ["TWILIO_API_BASE"] = f"http://127.0.0.1:{args.port}"
+    os.environ["BROADCAST_DB"] = os.path.join(tempfile.mkdtemp(), "broadcasts.db")
+    from app.whatsapp.broadcast import run_broadcast
+
+    recipients = [f"whatsapp:+1555{i:07d}" for i in range(args.recipients)]
+    summary = run_broadcast("benchmark", "Benchmark message", recipients, rate=args.rate, concurrency=args.concurrency)
+    print(f"\nbroadcast:  {summary['sent']} sent, {summary['failed']} failed in {summary['elapsed_s']}s "
+          f"-> {summary['messages_per_s']} msg/s (limit {args.rate}/s)")
+
+    if args.compare:
+        from twilio.rest import Client
+        from app.whatsapp.handler import PooledTwilioHttpClient
+        FakeTwilioHandler.fail_rate = 0.0
+        sample = recipients[:min(len(recipients), 100)]
+        start = time.perf_counter()
+        for number in sample:
+            # What generate_daily_story used to do: a fresh client (and connection) per message
+            client = Client("ACfake", "fake", http_client=PooledTwilioHttpClient())
+            client.messages.create(from_=os.environ["TWILIO_FROM_NUMBER"], body="Benchmark message", to=number)
+        elapsed = time.perf_counter() - start
+        print(f"sequential: {len(sample)} sent in {elapsed:.2f}s -> {len(sample) / elapsed:.1f} msg/s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,448 @@
+"""
+Offline benchmark of the RAG pipeline. Gemini and Pinecone are replaced by deterministic fakes
+(benchmarks/fakes.py); the local FAISS/BM25 retrieval, caches, router and endpoints are the
+real code. Runs the fixed corpus in benchmarks/queries.txt through each scenario and reports
+throughput, p50/p99, per-stage latency and memory.
+
+    python benchmark_rag.py                                  # every scenario
+    python benchmark_rag.py --scenarios search,api_ask --concurrency 16 --llm-latency-ms 800
+    python benchmark_rag.py --save-baseline local            # writes benchmarks/baselines/local.json
+    python benchmark_rag.py --compare local                  # exits 1 if anything regressed
+    python benchmark_rag.py --fake-embedder                  # without sentence-transformers installed
+
+Baselines are plain sorted JSON, so committing them makes every regression show up in a diff.
+benchmarks/baselines/smoke-fake-embedder.json is a --fake-embedder smoke run (--compare
+smoke-fake-embedder --fake-embedder), not a measurement of the real embedding model.
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import contextlib
+from urllib.parse import urlencode
+
+import numpy as np
+
+SCENARIOS = ("search", "ask_sync", "ask_async", "api_ask", "api_whatsapp")
+QUERIES_PATH = "benchmarks/queries.txt"
+BASELINE_DIR = "benchmarks/baselines"
+# metric -> True if higher is better
+COMPARED_METRICS = {"throughput_rps": True, "p50_ms": False, "p99_ms": False, "peak_rss_mb": False,
+                    "delivery_p50_ms": False, "delivery_p99_ms": False}
+
+
+def load_queries(path: str = QUERIES_PATH) -> list:
+    """(query, mode) pairs; a "deep_dive: " prefix selects deep-dive mode."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("deep_dive:"):
+                queries.append((line[len("deep_dive:"):].strip(), "deep_dive"))
+            else:
+                queries.append((line, "chat"))
+    return queries
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _is_error(answer) -> bool:
+    text = answer.get("answer", "") if isinstance(answer, dict) else str(answer)
+    return text.startswith("Error calling AI") or text.startswith("Internal Server Error")
+
+
+# --- Setup ------------------------------------------------------------------------------------
+
+def configure_environment(args, workdir: str):
+    """Must run before the app is imported: module-level configuration is read from the environment."""
+    # Empty (not unset) so load_dotenv() can't bring real keys back and initialize_rag() stays a no-op
+    for key in ("GOOGLE_API_KEY", "PINECONE_API_KEY", "PINECONE_INDEX_NAME",
+                "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "WHATSAPP_TO_NUMBER"):
+        os.environ[key] = ""
+    os.environ.update({
+        "RAG_LOG_PATH": os.path.join(workdir, "rag_log.jsonl"),
+        "WHATSAPP_JOBS_DB": os.path.join(workdir, "whatsapp_jobs.db"),
+        "SUBSCRIBERS_DB": os.path.join(workdir, "subscribers.db"),
+        "BROADCAST_DB": os.path.join(workdir, "broadcasts.db"),
+        "DAILY_STORY_DB": os.path.join(workdir, "daily_stories.db"),
+        "ANSWER_CACHE_PATH": "",
+        "WHATSAPP_WORKERS": str(args.concurrency),
+        "LLM_HEDGE": "true" if args.hedge else "false",
+    })
+    # The fake LLM has no quota: keep the limiter out of the way unless asked to measure it
+    if not args.real_limits:
+        os.environ.update({"LLM_RPM": "0", "LLM_TPM": "0", "LLM_MAX_CONCURRENCY": "100000",
+                           "LLM_MAX_QUEUE": "100000"})
+
+
+def install_fakes(args) -> dict:
+    """Swaps the remote clients for fakes and loads the local index. Returns startup timings."""
+    from app.rag import core, faiss_engine
+    from app.rag.llm_router import llm_router
+    from benchmarks.fakes import (FakeChatModel, FakeEncoder, FakePineconeEmbeddings, FakePineconeIndex,
+                                  load_passages)
+
+    llm_router.clients = {
+        model: FakeChatModel(model, latency_ms=args.llm_latency_ms, jitter=args.llm_jitter, seed=args.seed)
+        for model in llm_router.models()
+    }
+    core.llm = llm_router
+    core.embeddings = FakePineconeEmbeddings(latency_ms=args.pinecone_latency_ms)
+    core.pinecone_index = FakePineconeIndex(load_passages(), latency_ms=args.pinecone_latency_ms)
+
+    timings = {}
+    start = time.perf_counter()
+    if not faiss_engine.load_index():
+        raise SystemExit(f"No FAISS index at {faiss_engine.INDEX_FILE_PATH}; build it first (app/rag/index_builder.py).")
+    timings["index_load_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    if args.fake_embedder:
+        faiss_engine.model = FakeEncoder(dim=faiss_engine.faiss_index.d, encode_ms=args.encode_ms)
+    else:
+        try:
+            faiss_engine.load_embedding_model()
+        except ImportError as e:
+            raise SystemExit(f"{e}. Install requirements.txt or pass --fake-embedder.")
+        if faiss_engine.model is None:
+            raise SystemExit("Embedding model failed to load; pass --fake-embedder to run without it.")
+    timings["model_load_s"] = round(time.perf_counter() - start, 3)
+    timings["rss_after_load_mb"] = rss_mb()
+    return timings
+
+
+def reset_state():
+    from app.rag import telemetry
+    from app.rag.cache import answer_cache, embedding_cache
+
+    answer_cache.clear()
+    embedding_cache.clear()
+    telemetry.reset()
+
+
+# --- Scenarios ----------------------------------------------------------------------------------
+# Each returns (per-request latencies in seconds, error count, extra metrics)
+
+async def _bounded(items, concurrency: int, fn):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*(one(item) for item in items))
+
+
+def scenario_search(queries, args):
+    from app.rag.faiss_engine import search_gita
+
+    latencies = []
+    for query, _ in queries:
+        start = time.perf_counter()
+        search_gita(query, top_k=4)
+        latencies.append(time.perf_counter() - start)
+    return latencies, 0, {}
+
+
+def scenario_ask_sync(queries, args):
+    from app.rag.core import ask_question
+
+    latencies, errors = [], 0
+    for query, mode in queries:
+        start = time.perf_counter()
+        answer = ask_question(query, mode=mode)
+        latencies.append(time.perf_counter() - start)
+        errors += _is_error(answer)
+    return latencies, errors, {}
+
+
+def scenario_ask_async(queries, args):
+    from app.rag.core import aask_question
+
+    async def one(item):
+        query, mode = item
+        start = time.perf_counter()
+        answer = await aask_question(query, mode=mode)
+        return time.perf_counter() - start, _is_error(answer)
+
+    results = asyncio.run(_bounded(queries, args.concurrency, one))
+    return [r[0] for r in results], sum(r[1] for r in results), {}
+
+
+def scenario_api_ask(queries, args):
+    import httpx
+    from app.main import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            async def one(item):
+                query, mode = item
+                start = time.perf_counter()
+                response = await client.post("/api/ask?" + urlencode({"question": query, "mode": mode}))
+                return time.perf_counter() - start, response.status_code != 200 or _is_error(response.json()["answer"])
+            return await _bounded(queries, args.concurrency, one)
+
+    results = asyncio.run(run())
+    return [r[0] for r in results], sum(r[1] for r in results), {}
+
+
+def scenario_api_whatsapp(queries, args):
+    """Webhook ack latency, plus time until the background worker hands the answer to (fake) Twilio."""
+    import httpx
+    from app.main import app
+    from app.whatsapp import handler
+    from app.whatsapp.jobs import whatsapp_jobs
+
+    sent_at, received_at = {}, {}
+    lock = threading.Lock()
+
+    def fake_send(to_number: str, body: str):
+        time.sleep(args.twilio_latency_ms / 1000)
+        with lock:
+            sent_at[to_number] = time.perf_counter()
+        return f"SM{to_number[-8:]}"
+
+    original_send = handler.send_whatsapp_message
+    handler.send_whatsapp_message = fake_send
+    run_id = f"{time.time_ns()}"
+
+    async def run():
+        whatsapp_jobs.start()
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                async def one(item):
+                    i, (query, _) = item
+                    sender = f"whatsapp:+1555{i:07d}"
+                    received_at[sender] = time.perf_counter()
+                    response = await client.post("/api/whatsapp", data={
+                        "Body": query, "From": sender, "MessageSid": f"SMbench{run_id}{i}"})
+                    return time.perf_counter() - received_at[sender], response.status_code != 200
+                acks = await _bounded(list(enumerate(queries)), args.concurrency, one)
+
+            deadline = time.perf_counter() + args.timeout
+            while len(sent_at) < len(queries) and time.perf_counter() < deadline:
+                await asyncio.sleep(0.02)
+            return acks
+        finally:
+            await whatsapp_jobs.stop()
+
+    try:
+        acks = asyncio.run(run())
+    finally:
+        handler.send_whatsapp_message = original_send
+
+    delivery = [sent_at[s] - received_at[s] for s in sent_at]
+    missing = len(queries) - len(delivery)
+    errors = sum(a[1] for a in acks) + missing
+    extra = {"delivered": len(delivery)}
+    if delivery:
+        extra["delivery_p50_ms"] = round(float(np.percentile(delivery, 50)) * 1000, 3)
+        extra["delivery_p99_ms"] = round(float(np.percentile(delivery, 99)) * 1000, 3)
+        extra["delivery_throughput_rps"] = round(len(delivery) / (max(sent_at.values()) - min(received_at.values())), 2)
+    return [a[0] for a in acks], errors, extra
+
+
+SCENARIO_FUNCTIONS = {
+    "search": scenario_search,
+    "ask_sync": scenario_ask_sync,
+    "ask_async": scenario_ask_async,
+    "api_ask": scenario_api_ask,
+    "api_whatsapp": scenario_api_whatsapp,
+}
+
+
+def run_scenario(name: str, queries: list, args) -> dict:
+    from app.rag.telemetry import stage_summary
+
+    reset_state()
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        start = time.perf_counter()
+        latencies, errors, extra = SCENARIO_FUNCTIONS[name](queries, args)
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    stages = {}
+    for stage, modes in stage_summary().items():
+        for mode, summary in modes.items():
+            stages[f"{stage}/{mode}"] = {"count": summary["count"], "p50_ms": summary["p50_ms"],
+                                         "p99_ms": summary["p99_ms"]}
+    return {
+        "requests": len(latencies),
+        "errors": int(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3) if len(latencies_ms) else 0.0,
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3) if len(latencies_ms) else 0.0,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+        **extra,
+    }
+
+
+# --- Reporting -----------------------------------------------------------------------------------
+
+def print_report(results: dict):
+    print(f"\n{'scenario':<14}{'reqs':>6}{'err':>5}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'rss MB':>9}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:<14}{r['requests']:>6}{r['errors']:>5}{r['throughput_rps']:>10.2f}{r['p50_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['rss_mb']:>9.1f}")
+        if "delivered" in r:
+            print(f"{'  delivery':<14}{r['delivered']:>6}{'':>5}{r.get('delivery_throughput_rps', 0):>10.2f}"
+                  f"{r.get('delivery_p50_ms', 0):>10.1f}{r.get('delivery_p99_ms', 0):>10.1f}")
+    for name, r in results["scenarios"].items():
+        print(f"\n{name} stages{'':<16}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}")
+        for stage, s in r["stages"].items():
+            print(f"  {stage:<26}{s['count']:>7}{s['p50_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 1.0) -> list:
+    """
+    Prints current vs. baseline and returns the regressions: metrics worse by more than
+    `tolerance` (a fraction) and, for latencies, by at least `min_delta_ms`.
+    """
+    if baseline.get("note"):
+        print(f"\nBaseline note: {baseline['note']}")
+    if baseline.get("config") != results["config"]:
+        print("\nWarning: baseline was recorded with a different configuration:")
+        for key in sorted(set(baseline.get("config", {})) | set(results["config"])):
+            old, new = baseline.get("config", {}).get(key), results["config"].get(key)
+            if old != new:
+                print(f"  {key}: {old} -> {new}")
+
+    regressions = []
+    print(f"\n{'scenario':<14}{'metric':<16}{'baseline':>11}{'current':>11}{'change':>9}")
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            print(f"{name:<14}(not in baseline)")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            if metric == "throughput_rps":
+                absolute = abs(1000 / new - 1000 / old) if new else float("inf")  # ms per request
+            else:
+                absolute = abs(new - old) if metric.endswith("_ms") else float("inf")
+            # Sub-millisecond wobble on fast scenarios is noise, not a regression
+            flag = "  REGRESSION" if worse > tolerance and absolute >= min_delta_ms else ""
+            if flag:
+                regressions.append((name, metric, old, new))
+            print(f"{name:<14}{metric:<16}{old:>11.2f}{new:>11.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline RAG benchmark with fake Gemini and Pinecone.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--repeat", type=int, default=1, help="Run the corpus this many times (later passes hit the caches)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight for the async scenarios")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter", type=float, default=0.25, help="Log-normal sigma of the fake LLM latency")
+    parser.add_argument("--pinecone-latency-ms", type=float, default=50)
+    parser.add_argument("--twilio-latency-ms", type=float, default=80)
+    parser.add_argument("--fake-embedder", action="store_true", help="Hash embeddings instead of the sentence-transformer")
+    parser.add_argument("--encode-ms", type=float, default=0.0, help="Simulated encode time per batch with --fake-embedder")
+    parser.add_argument("--hedge", action="store_true", help="Enable LLM hedging (LLM_HEDGE)")
+    parser.add_argument("--real-limits", action="store_true", help="Keep the LLM rate limiter's configured quotas")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="Max seconds to wait for WhatsApp deliveries")
+    parser.add_argument("--save-baseline", metavar="NAME", help=f"Write results to {BASELINE_DIR}/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help=f"Compare with {BASELINE_DIR}/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown before flagging")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore latency changes smaller than this")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output")
+    args = parser.parse_args(argv)
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIO_FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    configure_environment(args, workdir)
+    queries = load_queries(args.queries) * max(1, args.repeat)
+
+    with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+        startup = install_fakes(args)
+    print(f"Loaded index in {startup['index_load_s']}s, model in {startup['model_load_s']}s "
+          f"(RSS {startup['rss_after_load_mb']} MB); {len(queries)} queries per scenario")
+
+    results = {
+        "config": {
+            "queries": len(queries),
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter": args.llm_jitter,
+            "pinecone_latency_ms": args.pinecone_latency_ms,
+            "twilio_latency_ms": args.twilio_latency_ms,
+            "fake_embedder": args.fake_embedder,
+            "hedge": args.hedge,
+            "real_limits": args.real_limits,
+            "seed": args.seed,
+        },
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "startup": startup,
+        "scenarios": {},
+    }
+    if args.fake_embedder:
+        results["note"] = ("Recorded with --fake-embedder (hash vectors, no sentence-transformers): "
+                           "a smoke run, not a retrieval or production latency baseline.")
+    for name in names:
+        print(f"Running {name}...")
+        results["scenarios"][name] = run_scenario(name, queries, args)
+
+    print_report(results)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {path}")
+
+    if args.compare:
+        path = os.path.join(BASELINE_DIR, f"{args.compare}.json")
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
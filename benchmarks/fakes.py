@@ -0,0 +1,148 @@
+"""
+Deterministic stand-ins for Gemini, Pinecone and (optionally) the sentence-transformer model,
+so the RAG pipeline can be benchmarked offline. The same prompt always gets the same answer
+and the same simulated latency (for a given seed).
+"""
+import time
+import json
+import random
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+def _seed(*parts) -> int:
+    return int(hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel:
+    """
+    Replaces one ChatGoogleGenerativeAI client. Latency is lognormal around `latency_ms`
+    (`jitter` is the log-space sigma); streamed chunks then arrive `chunk_ms` apart.
+    """
+    def __init__(self, name: str, latency_ms: float = 300, jitter: float = 0.25, chunk_ms: float = 15,
+                 seed: int = 0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.chunk_ms = chunk_ms
+        self.seed = seed
+        self.calls = 0
+
+    def _prompt(self, messages) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _latency(self, prompt: str) -> float:
+        rng = random.Random(_seed(self.seed, self.name, prompt))
+        return self.latency_ms / 1000 * float(np.exp(self.jitter * rng.gauss(0, 1)))
+
+    def _answer(self, prompt: str) -> str:
+        rng = random.Random(_seed(self.seed, "answer", prompt))
+        words = ["dharma", "karma", "action", "detachment", "self", "mind", "duty", "peace", "wisdom", "devotion"]
+        answer = " ".join(rng.choice(words) for _ in range(rng.randint(60, 120))).capitalize() + "."
+        follow_ups = [f"What does the Gita say about {rng.choice(words)}?" for _ in range(4)]
+        if "Return VALID JSON" in prompt:
+            return json.dumps({"answer": answer, "follow_up_questions": follow_ups})
+        return answer + "\n\nSuggested Questions:\n" + "\n".join(f"- {q}" for q in follow_ups)
+
+    def _usage(self, prompt: str, answer: str) -> dict:
+        input_tokens, output_tokens = _tokens(prompt), _tokens(answer)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def invoke(self, messages):
+        self.calls += 1
+        prompt = self._prompt(messages)
+        time.sleep(self._latency(prompt))
+        answer = self._answer(prompt)
+        return AIMessage(content=answer, usage_metadata=self._usage(prompt, answer))
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        prompt = self._prompt(messages)
+        await asyncio.sleep(self._latency(prompt))
+        answer = self._answer(prompt)
+        return AIMessage(content=answer, usage_metadata=self._usage(prompt, answer))
+
+    async def astream(self, messages):
+        self.calls += 1
+        prompt = self._prompt(messages)
+        await asyncio.sleep(self._latency(prompt))
+        answer = self._answer(prompt)
+        words = answer.split(" ")
+        for i in range(0, len(words), 4):
+            if i:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            yield AIMessageChunk(content=" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else ""))
+        yield AIMessageChunk(content="", usage_metadata=self._usage(prompt, answer))
+
+
+def _hash_vector(text: str, dim: int) -> np.ndarray:
+    """Bag-of-words hashing embedding: texts sharing words get similar vectors."""
+    vector = np.zeros(dim, dtype="float32")
+    for word in text.lower().split():
+        vector += np.random.default_rng(_seed("word", word)).standard_normal(dim).astype("float32")
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class FakeEncoder:
+    """Stand-in for the SentenceTransformer when it isn't installed; `encode_ms` simulates model time per batch."""
+    def __init__(self, dim: int = 384, encode_ms: float = 0.0):
+        self.dim = dim
+        self.encode_ms = encode_ms
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        if self.encode_ms:
+            time.sleep(self.encode_ms / 1000)
+        return np.vstack([_hash_vector(t, self.dim) for t in texts])
+
+
+class FakePineconeEmbeddings:
+    """Replaces PineconeInferenceEmbeddings: one simulated inference round-trip per query."""
+    model = "fake-pinecone-embed"
+
+    def __init__(self, latency_ms: float = 60, dim: int = 64):
+        self.latency_ms = latency_ms
+        self.dim = dim
+
+    def embed_query(self, text: str) -> list:
+        time.sleep(self.latency_ms / 1000)
+        return _hash_vector(text, self.dim).tolist()
+
+    async def aembed_query(self, text: str) -> list:
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+class FakePineconeIndex:
+    """Replaces the Pinecone index: brute-force cosine over the given passages after `latency_ms`."""
+    def __init__(self, passages: list, latency_ms: float = 40, dim: int = 64):
+        self.passages = passages
+        self.latency_ms = latency_ms
+        self.vectors = np.vstack([_hash_vector(p, dim) for p in passages]) if passages else np.zeros((0, dim), "float32")
+
+    def query(self, vector, top_k: int = 4, include_metadata: bool = True, namespace: str = None):
+        time.sleep(self.latency_ms / 1000)
+        if not self.passages:
+            return SimpleNamespace(matches=[])
+        scores = self.vectors @ np.asarray(vector, dtype="float32")
+        order = np.argsort(-scores)[:top_k]
+        return SimpleNamespace(matches=[
+            SimpleNamespace(id=f"passage-{i}", score=float(scores[i]), metadata={"text": self.passages[i]})
+            for i in order
+        ])
+
+
+def load_passages(path: str = "data/sample_geeta.txt") -> list:
+    """Blank-line separated passages from the sample scripture file."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [p.strip() for p in f.read().split("\n\n") if p.strip()]
+    except FileNotFoundError:
+        return []
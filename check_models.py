@@ -11,8 +11,16 @@ else:
     genai.configure(api_key=api_key)
     print("Listing available models...")
     try:
+        available = set()
         for m in genai.list_models():
             if 'generateContent' in m.supported_generation_methods:
                 print(f"Name: {m.name}")
+                available.add(m.name.replace("models/", ""))
+
+        # Check the models the LLM router is configured to use (LLM_CHAT_MODELS / LLM_DEEP_DIVE_MODELS)
+        from app.rag.llm_router import LLM_CHAT_MODELS, LLM_DEEP_DIVE_MODELS
+        for tier, models in (("chat", LLM_CHAT_MODELS), ("deep dive", LLM_DEEP_DIVE_MODELS)):
+            for model in models:
+                print(f"Router {tier}: {model} - {'OK' if model in available else 'NOT AVAILABLE'}")
     except Exception as e:
         print(f"Error listing models: {e}")
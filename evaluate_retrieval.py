@@ -0,0 +1,252 @@
+"""
+Retrieval quality guardrail for faiss_engine.search_gita. Runs a labelled set of
+(question -> expected Chapter/Verse) through several engine configurations in one process
+and prints recall@1, recall@k, MRR@k and search latency side by side. Off-topic questions
+labelled "=> none" should return nothing (so the Pinecone fallback runs); "noise" is the
+share of them that still got a verse.
+
+    python evaluate_retrieval.py                                     # on-disk index, fusion on/off
+    python evaluate_retrieval.py --index-types flat,hnsw,ivf_pq --min-scores 0.3,0.0
+    python evaluate_retrieval.py --fusion on --output benchmarks/baselines/retrieval.json
+    python evaluate_retrieval.py --fusion on --bm25-min-scores 0,1,2,4   # calibrate BM25_MIN_SCORE
+
+Labels live in benchmarks/verse_labels.txt; the verse texts in data/sample_geeta.txt and
+the meanings in frontend/shlokas.json (a different translation) are added as seed pairs.
+Queries are embedded once up front, so every configuration sees the same vectors and the
+latency columns measure search + rerank only.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import itertools
+import contextlib
+
+import numpy as np
+
+LABELS_PATH = "benchmarks/verse_labels.txt"
+SAMPLE_PATH = "data/sample_geeta.txt"
+SHLOKAS_PATH = "frontend/shlokas.json"
+
+_SOURCE_REF_RE = re.compile(r"Chapter\s+(\d+),\s*Verse\s+(\d+)(?:\s*-\s*(\d+))?")
+_SAMPLE_REF_RE = re.compile(r"^Chapter\s+(\d+),\s*Verse\s+(\d+):\s*$")
+_SHLOKA_REF_RE = re.compile(r"^Bhagavad Gita\s+(\d+)\.(\d+)$")
+
+
+def parse_ref(ref: str) -> tuple:
+    chapter, verse = ref.strip().split(".")
+    return int(chapter), int(verse)
+
+
+def load_labels(path: str = LABELS_PATH) -> list:
+    """[(question, {(chapter, verse), ...}, origin)] from "question => 2.47, 2.48" lines ("=> none": empty set)."""
+    labels = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            question, _, refs = line.rpartition("=>")
+            refs = [] if refs.strip().lower() == "none" else [r for r in refs.split(",") if r.strip()]
+            labels.append((question.strip(), {parse_ref(r) for r in refs}, "labelled"))
+    return labels
+
+
+def seed_labels(sample_path: str = SAMPLE_PATH, shlokas_path: str = SHLOKAS_PATH) -> list:
+    """Verse text -> its own reference, for the Gita verses in the sample file and the shloka cards."""
+    seeds = []
+    if os.path.exists(sample_path):
+        with open(sample_path, encoding="utf-8") as f:
+            for passage in f.read().split("\n\n"):
+                head, _, text = passage.strip().partition("\n")
+                match = _SAMPLE_REF_RE.match(head.strip())
+                if match and text.strip():
+                    seeds.append((text.strip(), {(int(match.group(1)), int(match.group(2)))}, "sample_geeta"))
+    if os.path.exists(shlokas_path):
+        with open(shlokas_path, encoding="utf-8") as f:
+            for shloka in json.load(f):
+                match = _SHLOKA_REF_RE.match(shloka.get("source", ""))
+                if match and shloka.get("meaning"):
+                    seeds.append((shloka["meaning"], {(int(match.group(1)), int(match.group(2)))}, "shlokas"))
+    return seeds
+
+
+def hit_refs(hit: dict) -> set:
+    """Verses covered by a search hit; "Chapter 10, Verse 4-5" covers both 10.4 and 10.5."""
+    match = _SOURCE_REF_RE.search(hit.get("source", ""))
+    if not match:
+        return set()
+    chapter, first = int(match.group(1)), int(match.group(2))
+    return {(chapter, verse) for verse in range(first, int(match.group(3) or first) + 1)}
+
+
+def score_ranking(hits: list, expected: set, k: int) -> dict:
+    """recall@1 and recall@k (share of expected verses retrieved) and reciprocal rank of the first relevant hit."""
+    found, first_rank, top1 = set(), 0, set()
+    for rank, hit in enumerate(hits[:k], start=1):
+        refs = hit_refs(hit) & expected
+        if rank == 1:
+            top1 = refs
+        if refs and not first_rank:
+            first_rank = rank
+        found |= refs
+    return {
+        "recall@1": len(top1) / len(expected),
+        f"recall@{k}": len(found) / len(expected),
+        "rr": 1.0 / first_rank if first_rank else 0.0,
+    }
+
+
+# --- Engine configurations ------------------------------------------------------------------
+
+def build_indexes(index_types: list) -> dict:
+    """name -> FAISS index. "loaded" is the on-disk index; other types are rebuilt in memory from the exact vectors."""
+    from app.rag import faiss_engine
+    from app.rag.index_builder import create_index, load_vectors
+
+    indexes, vectors = {}, None
+    for index_type in index_types:
+        if index_type == "loaded":
+            indexes[index_type] = faiss_engine.faiss_index
+            continue
+        if vectors is None:
+            if os.path.exists(faiss_engine.FLAT_INDEX_FILE_PATH):
+                vectors = load_vectors(faiss_engine.FLAT_INDEX_FILE_PATH)
+            else:
+                vectors = faiss_engine.faiss_index.reconstruct_n(0, faiss_engine.faiss_index.ntotal)
+        start = time.perf_counter()
+        indexes[index_type] = create_index(vectors, index_type, faiss_engine.FAISS_METRIC)
+        print(f"Built {index_type} index in {time.perf_counter() - start:.2f}s")
+    return indexes
+
+
+@contextlib.contextmanager
+def engine_config(index, fusion: bool, bm25_min_score: float):
+    """Temporarily points faiss_engine at another index / fusion setting / BM25 cutoff."""
+    from app.rag import faiss_engine
+
+    saved = faiss_engine.faiss_index, faiss_engine.LEXICAL_FUSION, faiss_engine.BM25_MIN_SCORE
+    faiss_engine.faiss_index, faiss_engine.LEXICAL_FUSION, faiss_engine.BM25_MIN_SCORE = index, fusion, bm25_min_score
+    try:
+        yield
+    finally:
+        faiss_engine.faiss_index, faiss_engine.LEXICAL_FUSION, faiss_engine.BM25_MIN_SCORE = saved
+
+
+def evaluate_config(labels: list, vectors: np.ndarray, k: int, min_score: float) -> dict:
+    from app.rag.faiss_engine import search_gita
+
+    totals, latencies, misses, noise = {}, [], [], []
+    for (question, expected, _), vector in zip(labels, vectors):
+        start = time.perf_counter()
+        hits = search_gita(question, top_k=k, query_vector=vector, min_score=min_score)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if not expected:
+            if hits:
+                noise.append(question)
+            continue
+        scores = score_ranking(hits, expected, k)
+        for metric, value in scores.items():
+            totals[metric] = totals.get(metric, 0.0) + value
+        if not scores["rr"]:
+            misses.append(question)
+
+    n = max(sum(1 for _, expected, _ in labels if expected), 1)
+    negatives = len(labels) - sum(1 for _, expected, _ in labels if expected)
+    return {
+        "recall@1": round(totals.get("recall@1", 0.0) / n, 4),
+        f"recall@{k}": round(totals.get(f"recall@{k}", 0.0) / n, 4),
+        f"mrr@{k}": round(totals.get("rr", 0.0) / n, 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3) if latencies else 0.0,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3) if latencies else 0.0,
+        "noise": round(len(noise) / negatives, 4) if negatives else 0.0,
+        "misses": misses + [f"(off-topic hit) {question}" for question in noise],
+    }
+
+
+def _csv(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    from app.rag.index_builder import INDEX_TYPES
+
+    parser = argparse.ArgumentParser(description="Recall/MRR/latency of search_gita across engine configurations.")
+    parser.add_argument("--labels", default=LABELS_PATH)
+    parser.add_argument("--no-seeds", action="store_true", help="Skip the sample_geeta.txt / shlokas.json seed pairs")
+    parser.add_argument("--k", type=int, default=4, help="top_k passed to search_gita (the app uses 4)")
+    parser.add_argument("--index-types", default="loaded",
+                        help=f"Comma-separated: loaded (the index on disk) and/or {', '.join(INDEX_TYPES)}")
+    parser.add_argument("--min-scores", default=None, help="Comma-separated cosine cutoffs (default FAISS_MIN_SCORE)")
+    parser.add_argument("--fusion", default="on,off", help="BM25 fusion settings to compare: on, off or on,off")
+    parser.add_argument("--bm25-min-scores", default=None,
+                        help="Comma-separated BM25 cutoffs for fusion (default BM25_MIN_SCORE)")
+    parser.add_argument("--show-misses", action="store_true", help="List questions with no relevant hit per configuration")
+    parser.add_argument("--output", help="Also write the results as sorted JSON to this path")
+    args = parser.parse_args(argv)
+
+    from app.rag import faiss_engine
+
+    index_types = _csv(args.index_types)
+    unknown = [t for t in index_types if t != "loaded" and t not in INDEX_TYPES]
+    if unknown:
+        parser.error(f"unknown index type(s): {', '.join(unknown)}")
+    fusions = [f == "on" for f in _csv(args.fusion)]
+    min_scores = [float(s) for s in _csv(args.min_scores)] if args.min_scores else [faiss_engine.FAISS_MIN_SCORE]
+    bm25_min_scores = ([float(s) for s in _csv(args.bm25_min_scores)] if args.bm25_min_scores
+                       else [faiss_engine.BM25_MIN_SCORE])
+
+    labels = load_labels(args.labels) + ([] if args.no_seeds else seed_labels())
+    print(f"{len(labels)} labelled questions ({sum(origin == 'labelled' for _, _, origin in labels)} hand-written, "
+          f"{sum(not expected for _, expected, _ in labels)} off-topic)")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ready = faiss_engine.load_index() and faiss_engine.load_embedding_model() is not None
+    if not ready:
+        raise SystemExit(f"Needs {faiss_engine.INDEX_FILE_PATH}, its verse metadata and the embedding model.")
+    if any(fusions) and faiss_engine.lexical_index is None:
+        print("Warning: no BM25 index loaded; fusion=on behaves like fusion=off")
+
+    start = time.perf_counter()
+    vectors = faiss_engine.encode_queries([question for question, _, _ in labels])
+    encode_ms = (time.perf_counter() - start) * 1000 / max(len(labels), 1)
+    print(f"Encoded queries in {encode_ms:.2f} ms each (batched, not included below)")
+
+    indexes = build_indexes(index_types)
+    results = []
+    for index_type, min_score, fusion in itertools.product(index_types, min_scores, fusions):
+        # The BM25 cutoff only matters with fusion on
+        for bm25_min_score in (bm25_min_scores if fusion else [faiss_engine.BM25_MIN_SCORE]):
+            with engine_config(indexes[index_type], fusion, bm25_min_score):
+                report = evaluate_config(labels, vectors, args.k, min_score)
+            results.append({"index": index_type, "min_score": min_score, "fusion": fusion,
+                            "bm25_min_score": bm25_min_score if fusion else None, **report})
+
+    k = args.k
+    print(f"\n{'index':<10}{'min':>6}{'fusion':>8}{'bm25':>6}{'R@1':>8}{'R@' + str(k):>8}{'MRR@' + str(k):>8}"
+          f"{'noise':>7}{'p50 ms':>9}{'p99 ms':>9}")
+    for r in results:
+        bm25 = f"{r['bm25_min_score']:>6.1f}" if r['fusion'] else f"{'-':>6}"
+        print(f"{r['index']:<10}{r['min_score']:>6.2f}{'on' if r['fusion'] else 'off':>8}{bm25}{r['recall@1']:>8.3f}"
+              f"{r[f'recall@{k}']:>8.3f}{r[f'mrr@{k}']:>8.3f}{r['noise']:>7.2f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}")
+    if args.show_misses:
+        for r in results:
+            print(f"\nMisses for {r['index']} min={r['min_score']} fusion={'on' if r['fusion'] else 'off'}"
+                  f"{' bm25=' + str(r['bm25_min_score']) if r['fusion'] else ''}:")
+            for question in r["misses"]:
+                print(f"  {question[:100]}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"k": k, "questions": len(labels), "encode_ms": round(encode_ms, 3), "configs": results},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -50,6 +50,55 @@ document.addEventListener('DOMContentLoaded', () => {
         }, 50);
     }
 
+    // Reads the Server-Sent Events stream from /api/ask/stream.
+    // Calls onToken for every text chunk and resolves with the final {answer, follow_up_questions}.
+    async function streamAnswer(question, mode, onToken) {
+        const response = await fetch(`http://127.0.0.1:8000/api/ask/stream?question=${encodeURIComponent(question)}&mode=${mode}`, {
+            method: 'POST'
+        });
+        if (!response.ok || !response.body) {
+            const errText = await response.text();
+            throw new Error(`Server Error: ${response.status} - ${errText}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataStr = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataStr += line.slice(5).trim();
+                });
+                if (!dataStr) continue;
+                const data = JSON.parse(dataStr);
+
+                if (eventName === 'token') {
+                    onToken(data.text || '');
+                } else if (eventName === 'done') {
+                    result = data;
+                } else if (eventName === 'error') {
+                    throw new Error(data.answer || 'Streaming failed');
+                }
+            }
+        }
+
+        if (!result) throw new Error('Stream ended before the answer was complete');
+        return result;
+    }
+
     async function sendMessage() {
         if (!userInput) return;
         const text = userInput.value.trim();
@@ -60,37 +109,34 @@ document.addEventListener('DOMContentLoaded', () => {
 
         toggleLoading(true);
 
+        let streamDiv = null;
+        let streamedText = '';
+        const wrap = (body) => `<div class="deep-dive-content" style="border-left: 3px solid #bb86fc; padding-left: 15px;">${formatMessage(body)}</div>`;
+
         try {
             // STRICTLY USE DEEP DIVE MODE
             console.log("Sending Deep Dive Request...");
-            const response = await fetch(`http://127.0.0.1:8000/api/ask?question=${encodeURIComponent(text)}&mode=${currentMode}`, {
-                method: 'POST'
+            const data = await streamAnswer(text, currentMode, (token) => {
+                if (!streamDiv) {
+                    toggleLoading(false);
+                    addMessage(wrap(''), false);
+                    streamDiv = chatHistory ? chatHistory.lastElementChild : null;
+                }
+                streamedText += token;
+                if (streamDiv) streamDiv.innerHTML = wrap(streamedText);
             });
-
-            if (!response.ok) {
-                const errText = await response.text();
-                throw new Error(`Server Error: ${response.status} - ${errText}`);
-            }
-
-            const data = await response.json();
             console.log("Response Data:", data);
 
-            let answerText = "";
-            let followUps = [];
+            const answerText = wrap(data.answer || streamedText);
+            const followUps = data.follow_up_questions || [];
 
-            // Robust JSON Parsing/Unwrapping
-            if (data.answer && data.answer.answer) {
-                answerText = data.answer.answer;
-                followUps = data.answer.follow_up_questions || [];
-            } else if (data.answer) {
-                answerText = data.answer;
+            // Replace the streamed draft with the final, cleaned answer
+            if (streamDiv) {
+                streamDiv.innerHTML = answerText;
+            } else {
+                addMessage(answerText, false);
             }
 
-            // Wrap in styling for emphasis
-            answerText = `<div class="deep-dive-content" style="border-left: 3px solid #bb86fc; padding-left: 15px;">${formatMessage(answerText)}</div>`;
-
-            addMessage(answerText, false);
-
             if (followUps.length > 0) {
                 renderSuggestions(followUps);
             }
@@ -116,6 +116,55 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // ... (existing code)
 
+    // Reads the Server-Sent Events stream from /api/ask/stream.
+    // Calls onToken for every text chunk and resolves with the final {answer, follow_up_questions}.
+    async function streamAnswer(question, mode, onToken) {
+        const response = await fetch(`/api/ask/stream?question=${encodeURIComponent(question)}&mode=${mode}`, {
+            method: 'POST'
+        });
+        if (!response.ok || !response.body) {
+            const errText = await response.text();
+            throw new Error(`Server Error: ${response.status} - ${errText}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataStr = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataStr += line.slice(5).trim();
+                });
+                if (!dataStr) continue;
+                const data = JSON.parse(dataStr);
+
+                if (eventName === 'token') {
+                    onToken(data.text || '');
+                } else if (eventName === 'done') {
+                    result = data;
+                } else if (eventName === 'error') {
+                    throw new Error(data.answer || 'Streaming failed');
+                }
+            }
+        }
+
+        if (!result) throw new Error('Stream ended before the answer was complete');
+        return result;
+    }
+
     async function sendMessage() {
         if (!userInput) return;
         const text = userInput.value.trim();
@@ -126,54 +175,36 @@ document.addEventListener('DOMContentLoaded', () => {
 
         toggleLoading(true);
 
+        // Bot bubble that fills in as tokens arrive
+        let streamDiv = null;
+        let streamedText = '';
+
         try {
             // Pass the currentMode to the API
-            const response = await fetch(`/api/ask?question=${encodeURIComponent(text)}&mode=${currentMode}`, {
-                method: 'POST'
-            });
-            if (!response.ok) {
-                const errText = await response.text();
-                try {
-                    const errJson = JSON.parse(errText);
-                    throw new Error(errJson.answer || `Server Error: ${response.status}`);
-                } catch (e) {
-                    throw new Error(`Server Error: ${response.status} - ${errText}`);
+            const data = await streamAnswer(text, currentMode, (token) => {
+                if (!streamDiv) {
+                    toggleLoading(false);
+                    addMessage('', false);
+                    streamDiv = chatHistory ? chatHistory.lastElementChild : null;
                 }
-            }
-            const data = await response.json();
-
-            let answerText = "";
-            let followUps = [];
-
-            if (typeof data.answer === 'object' && data.answer !== null) {
-                answerText = data.answer.answer || JSON.stringify(data.answer);
-            } else if (typeof data.answer === 'string') {
-                try {
-                    const inner = JSON.parse(data.answer);
-                    if (inner.answer) {
-                        answerText = inner.answer;
-                        followUps = inner.follow_up_questions || [];
-                    } else {
-                        answerText = data.answer;
-                    }
-                } catch {
-                    answerText = data.answer;
-                }
-            }
+                streamedText += token;
+                if (streamDiv) streamDiv.innerHTML = formatMessage(streamedText);
+            });
 
-            if (data.answer && data.answer.answer) {
-                answerText = data.answer.answer;
-                followUps = data.answer.follow_up_questions || [];
-            } else if (data.answer) {
-                answerText = data.answer;
-            }
+            let answerText = data.answer || streamedText;
+            const followUps = data.follow_up_questions || [];
 
             if (currentMode === 'deep_dive') {
                 // Optional: distinctive styling wrapping
-                answerText = `<div class="deep-dive-content">${answerText}</div>`;
+                answerText = `<div class="deep-dive-content">${formatMessage(answerText)}</div>`;
             }
 
-            addMessage(answerText, false);
+            // Replace the streamed draft with the final, cleaned answer
+            if (streamDiv) {
+                streamDiv.innerHTML = answerText.trim().startsWith('<div') ? answerText : formatMessage(answerText);
+            } else {
+                addMessage(answerText, false);
+            }
 
             if (followUps.length > 0) {
                 renderSuggestions(followUps);
@@ -0,0 +1,248 @@
+"""
+Production launcher: preloads the embedding model, FAISS index, verse store and BM25 index
+once in a parent process, then forks uvicorn workers that share those pages copy-on-write
+(the verse store is an mmap'd file, so it is shared through the page cache as well).
+
+    python serve.py                       # one worker per available CPU, port $PORT (8080)
+    python serve.py --workers 2 --port 8001
+    WEB_CONCURRENCY=4 python serve.py
+
+Per-process state is set up in each worker after the fork: Gemini/Pinecone clients (made
+by warm-up), the event loop, the log file (RAG_LOG_PATH.w<N>) and torch/FAISS threads.
+The LLM quotas (LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY) are for the whole instance and are
+split evenly between workers. The answer cache, batcher and /api/metrics are per worker.
+With INFERENCE_WORKERS set, each web worker instead starts its own inference processes
+(app/rag/inference_pool.py) and the parent preloads nothing but the app's modules.
+
+Startup time and each worker's RSS/PSS are printed once the workers are up, so instance
+memory can be sized as roughly shared + workers * private.
+"""
+import gc
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+
+WORKER_MEMORY_REPORT_DELAY = 30  # seconds after start, once warm-up has usually finished
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: the affinity mask, capped by a cgroup v2 quota (Cloud Run, Docker --cpus)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def memory_mb(pid: int) -> dict:
+    """rss, pss, shared and private MB of a process from /proc/<pid>/smaps_rollup (Linux only)."""
+    fields = {"Rss": 0, "Pss": 0, "Shared_Clean": 0, "Shared_Dirty": 0, "Private_Clean": 0, "Private_Dirty": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in fields:
+                    fields[name] = int(rest.split()[0])
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(fields["Rss"] / 1024, 1),
+        "pss_mb": round(fields["Pss"] / 1024, 1),
+        "shared_mb": round((fields["Shared_Clean"] + fields["Shared_Dirty"]) / 1024, 1),
+        "private_mb": round((fields["Private_Clean"] + fields["Private_Dirty"]) / 1024, 1),
+    }
+
+
+def preload() -> dict:
+    """Loads everything read-only that workers would otherwise each load. Returns timings in seconds."""
+    timings = {}
+    start = time.perf_counter()
+    import app.main  # noqa: F401  (imports every module the workers need)
+    timings["import"] = round(time.perf_counter() - start, 3)
+
+    from app.rag import faiss_engine
+    from app.rag.inference_pool import inference_pool
+    from app.whatsapp.jobs import whatsapp_jobs
+
+    start = time.perf_counter()
+    if inference_pool.enabled:
+        # The web workers' inference processes hold the model and index (app/rag/inference_pool.py).
+        # Only build a missing index here, once, instead of in every inference process.
+        if not os.path.exists(faiss_engine.INDEX_FILE_PATH):
+            faiss_engine.initialize_faiss()
+            faiss_engine.model = faiss_engine.faiss_index = faiss_engine.lexical_index = None
+            faiss_engine.gita_metadata = []
+    else:
+        faiss_engine.load_embedding_model()
+        timings["embedding_model"] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        if not faiss_engine.load_index():
+            # Build once here rather than in every worker at the same time
+            faiss_engine.initialize_faiss()
+    timings["faiss_index"] = round(time.perf_counter() - start, 3)
+
+    # Jobs interrupted by the previous shutdown go back to 'queued' for worker 0 to resume.
+    # SQLite connections must not cross the fork, so close it again.
+    whatsapp_jobs.requeue_interrupted()
+    whatsapp_jobs.close()
+
+    # Objects allocated so far are never freed: keep the collector from touching (and copying) their pages
+    gc.collect()
+    gc.freeze()
+    return timings
+
+
+def _set_worker_threads(threads: int):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def run_worker(sock: socket.socket, index: int, workers: int, respawned: bool, args):
+    """Body of one forked worker. Never returns."""
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    exit_code = 0
+    try:
+        import uvicorn
+        from app.main import app
+        from app.rag import telemetry
+        from app.rag.llm_router import llm_router
+        from app.whatsapp.jobs import whatsapp_jobs
+
+        _set_worker_threads(max(1, available_cpus() // workers))
+        llm_router.scale_limits(1.0 / workers)
+        telemetry.RAG_LOG_PATH = f"{telemetry.RAG_LOG_PATH}.w{index}"
+        # Worker 0 picks up the backlog; a respawned worker takes back the jobs its predecessor queued
+        whatsapp_jobs.requeue_running = False
+        whatsapp_jobs.resume = index == 0 or respawned
+
+        config = uvicorn.Config(app, log_level=args.log_level, timeout_graceful_shutdown=args.graceful_timeout)
+        uvicorn.Server(config).run(sockets=[sock])
+    except Exception as e:
+        print(f"Worker {index} crashed: {e}")
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(exit_code)
+
+
+def print_memory(children: dict):
+    parent = memory_mb(os.getpid())
+    rows = [("parent", os.getpid(), parent)]
+    rows += [(f"worker {i}", pid, memory_mb(pid)) for pid, i in sorted(children.items(), key=lambda c: c[1])]
+    print(f"{'process':<10}{'pid':>8}{'rss MB':>9}{'pss MB':>9}{'shared':>9}{'private':>9}")
+    for name, pid, mem in rows:
+        if mem:
+            print(f"{name:<10}{pid:>8}{mem['rss_mb']:>9.1f}{mem['pss_mb']:>9.1f}{mem['shared_mb']:>9.1f}{mem['private_mb']:>9.1f}")
+    total_pss = sum(mem.get("pss_mb", 0) for _, _, mem in rows)
+    print(f"Total PSS {total_pss:.1f} MB for {len(children)} workers", flush=True)
+
+
+def serve(args) -> int:
+    start = time.perf_counter()
+    timings = preload()
+    timings["total"] = round(time.perf_counter() - start, 3)
+    print(f"Preloaded in {timings['total']}s {timings}; starting {args.workers} workers on {args.host}:{args.port}", flush=True)
+
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = {}  # pid -> worker index
+    stopping = False
+
+    def spawn(index: int, respawned: bool = False):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(sock, index, args.workers, respawned, args)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(args.workers):
+        spawn(index)
+
+    report_at = time.monotonic() + args.report_delay if args.report_delay > 0 else None
+    kill_at = None
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = children.pop(pid)
+            if not stopping:
+                print(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting", flush=True)
+                time.sleep(1)  # Don't spin if a worker crashes on startup
+                spawn(index, respawned=True)
+            continue
+        if report_at is not None and time.monotonic() >= report_at and not stopping:
+            report_at = None
+            print(f"Preload took {timings['total']}s; memory {args.report_delay:g}s after the workers started:")
+            print_memory(children)
+        if stopping:
+            kill_at = kill_at or time.monotonic() + args.graceful_timeout + 5
+            if time.monotonic() >= kill_at:
+                for pid in list(children):
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+        time.sleep(0.2)
+    sock.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with preloaded models and forked workers.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")),
+                        help="Worker processes (default: one per available CPU)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "20")))
+    parser.add_argument("--report-delay", type=float, default=WORKER_MEMORY_REPORT_DELAY,
+                        help="Seconds before printing per-worker memory (0 to skip)")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+    args.workers = args.workers or available_cpus()
+
+    if not hasattr(os, "fork"):
+        # No fork (Windows): plain uvicorn workers, each loading its own copy
+        import uvicorn
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+        return 0
+    return serve(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))